@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark comparing utils.convert_datetime with plain maya parsing of
+the dd/mm/yyyy hh:mm:ss dates used by the importer and create_event().
+"""
+
+import timeit
+import datetime
+
+import maya
+
+from gcalendar import utils
+
+NR_DATES = 1000
+# distinct dates, 61 minutes apart, so that the uncached run never hits the
+# cache
+DATES = [(datetime.datetime(2017, 1, 1) + datetime.timedelta(minutes=61 * d))
+        .strftime("%d/%m/%Y %H:%M:%S") for d in range(NR_DATES)]
+
+
+def parse_maya():
+    for date in DATES:
+        maya.parse(date, day_first=True).add(hours=24).iso8601()
+
+
+def parse_uncached():
+    utils._convert_datetime.cache_clear()
+    for date in DATES:
+        utils.convert_datetime(date, hours=24)
+
+
+def parse_cached():
+    for date in DATES:
+        utils.convert_datetime(date, hours=24)
+
+
+if __name__ == "__main__":
+    results = {}
+    for name in ["parse_maya", "parse_uncached", "parse_cached"]:
+        seconds = min(timeit.repeat(name + "()", globals=globals(), number=1,
+            repeat=5))
+        results[name] = seconds
+        print("{:<16}{:>10.1f} us/date".format(name, seconds / NR_DATES * 1e6))
+
+    print("Speedup uncached: {:.0f}x, cached: {:.0f}x".format(
+        results["parse_maya"] / results["parse_uncached"],
+        results["parse_maya"] / results["parse_cached"]))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Benchmark of the CLI startup: measures the time from launching
+gcalendar.main:main until the menu prompt is shown, and lists the slowest
+imports as reported by `python -X importtime`.
+"""
+
+import sys
+import time
+import subprocess
+
+NR_RUNS = 5
+PROMPT = b"Your Choice: "
+LAUNCH = "from gcalendar.main import main; main()"
+
+
+def time_to_first_prompt():
+    """Launch the CLI, wait for the menu prompt and exit by choosing 6."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", LAUNCH],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = b""
+    while not output.endswith(PROMPT):
+        char = process.stdout.read(1)
+        if not char:
+            raise RuntimeError("CLI exited before showing the prompt")
+        output += char
+    elapsed = time.perf_counter() - start
+
+    process.communicate(b"6\n")
+    return elapsed
+
+
+def slowest_imports(nr_imports=10):
+    """Return (cumulative microseconds, module) of the slowest imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+        "import gcalendar.main"], stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:nr_imports]
+
+
+if __name__ == "__main__":
+    timings = [time_to_first_prompt() for _ in range(NR_RUNS)]
+    print("Time to first prompt: {:.1f} ms (min of {} runs)".format(
+        min(timings) * 1000, NR_RUNS))
+
+    print("Slowest imports of gcalendar.main (cumulative):")
+    for microseconds, module in slowest_imports():
+        print("{:>10.1f} ms  {}".format(microseconds / 1000, module))
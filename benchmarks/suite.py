@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Benchmark suite of the hot paths, run against the in-process fake Calendar
+API of gcalendar.fake.
+
+    python benchmarks/suite.py run [--output results.json] [names...]
+    python benchmarks/suite.py compare base.json new.json [--threshold 0.1]
+
+`run` stores the minimum time of every benchmark over several repetitions as
+JSON, by default as benchmarks/results/<commit>.json. `compare` prints the
+ratio of two result files and exits with status 1 if any benchmark got slower
+by more than the threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import subprocess
+
+from gcalendar import importer, methods, scheduler, utils
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+import startup
+
+# the fake has no quota; time the code instead of the rate limit
+scheduler.default_scheduler = scheduler.RequestScheduler()
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "results")
+REPEAT = 5
+# Relative slowdown above which a benchmark counts as regression
+THRESHOLD = 0.1
+
+NR_DATES = 1000
+NR_BODIES = 1000
+NR_EVENTS = 10000
+NR_IMPORT_DAYS = 365
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """Register a benchmark. It is called with the number of the repetition,
+    performs untimed setup and returns the callable to time."""
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def dates(count, offset=0):
+    """Return count distinct dates in dd/mm/yyyy hh:mm:ss format, 61 minutes
+    apart from January 1st of the year 2000 + offset on."""
+    start = datetime.datetime(2000 + offset, 1, 1)
+    return [(start + datetime.timedelta(minutes=61 * d)).strftime(
+        "%d/%m/%Y %H:%M:%S") for d in range(count)]
+
+
+@benchmark
+def convert_datetime(repetition):
+    # distinct dates per repetition to bypass the memoization
+    values = dates(NR_DATES, offset=repetition)
+
+    def run():
+        for date in values:
+            utils.convert_datetime(date, hours=24)
+    return run
+
+
+@benchmark
+def event_body(repetition):
+    starts = dates(NR_BODIES, offset=20 + repetition)
+
+    def run():
+        for start in starts:
+            methods.event_body(summary="Meeting", location="Room 1",
+                    start=start, end=start, attendees=["a@b.com", "c@d.com"])
+    return run
+
+
+@benchmark
+def fetch_events(repetition):
+    http = FakeCalendarHttp()
+    start = datetime.datetime(2017, 1, 1)
+    for i in range(NR_EVENTS):
+        event_start = start + datetime.timedelta(minutes=30 * i)
+        http.add_event(summary="Event {}".format(i),
+                start={"dateTime": "{}Z".format(event_start.isoformat())},
+                end={"dateTime": "{}Z".format(
+                    (event_start + datetime.timedelta(minutes=20)).isoformat())})
+    service = build_fake_service(http)
+
+    def run():
+        events = methods.fetch_events(service, start="01/01/2017",
+                end="31/12/2017", max_results=2500)
+        assert len(events) == NR_EVENTS
+    return run
+
+
+@benchmark
+def bulk_import(repetition):
+    service = build_fake_service()
+    first_day = datetime.date(2017, 1, 1)
+    lines = ["{} 8\n".format((first_day + datetime.timedelta(days=day))
+        .strftime("%d/%m/%Y")) for day in range(NR_IMPORT_DAYS)]
+
+    def run():
+        records = importer.read_txt(lines, summary="Working hours")
+        result = importer.import_events(service, records,
+                key=lambda record: record["start"].split()[0])
+        assert result.inserted == NR_IMPORT_DAYS
+    return run
+
+
+@benchmark
+def cli_startup(repetition):
+    return startup.time_to_first_prompt
+
+
+def measure(name, repeat=REPEAT):
+    """Return the minimum time in seconds of the benchmark."""
+    timings = []
+    for repetition in range(repeat):
+        run = BENCHMARKS[name](repetition)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    names = args.names or sorted(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        print("Unknown benchmark(s): {}".format(", ".join(sorted(unknown))))
+        return 2
+
+    results = {}
+    for name in names:
+        results[name] = measure(name, args.repeat)
+        print("{:<20}{:>12.2f} ms".format(name, results[name] * 1000))
+
+    output = args.output or os.path.join(RESULTS_DIR, "{}.json".format(
+        commit() or "results"))
+    directory = os.path.dirname(os.path.abspath(output))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(output, "w") as f:
+        json.dump({"commit": commit(), "python": platform.python_version(),
+            "repeat": args.repeat, "seconds": results}, f, indent=2,
+            sort_keys=True)
+    print("Results written to {}".format(output))
+    return 0
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print("{:<20}{:>12}{:>12}{:>9}".format("benchmark", base["commit"],
+        new["commit"], "ratio"))
+    regressions = []
+    for name in sorted(set(base["seconds"]) & set(new["seconds"])):
+        ratio = new["seconds"][name] / base["seconds"][name]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<20}{:>9.2f} ms{:>9.2f} ms{:>8.2f}x{}".format(name,
+            base["seconds"][name] * 1000, new["seconds"][name] * 1000, ratio,
+            flag))
+
+    if regressions:
+        print("{} regression(s) above {:.0%}".format(len(regressions),
+            args.threshold))
+        return 1
+    return 0
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("names", nargs="*", metavar="name",
+            help="benchmark to run, out of {}. Default: all".format(
+                ", ".join(sorted(BENCHMARKS))))
+    run_parser.add_argument("--output", help="path of the JSON result file")
+    run_parser.add_argument("--repeat", type=int, default=REPEAT)
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser("compare",
+            help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=THRESHOLD,
+            help="relative slowdown counted as regression. Default: 0.1")
+    compare_parser.set_defaults(function=compare)
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(args.function(args))
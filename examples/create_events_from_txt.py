@@ -6,63 +6,26 @@ Events that are already present will be updated.
 """
 
 import os
-from datetime import datetime
-from collections import namedtuple
 
-import maya
-
-from gcalendar import methods, utils
+from gcalendar import importer, methods, utils
 
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-WorkDay = namedtuple("WorkDay", ["start", "end"])
-
-workdays = []
-with open(os.path.join(script_dir, "2017_working_hours.txt")) as f:
-    for line in f:
-        if line.startswith("#"):
-            continue
-
-        try:
-            date, hours = line.strip().split()
-            # start the day at 9am, putting 'day_first' as a reminder
-            start = maya.parse(date, day_first=True).add(hours=9)
-            end = start.add(hours=float(hours))
-            workday = WorkDay(
-                    start.datetime().strftime("%d/%m/%Y %H:%M:%S"),
-                    end.datetime().strftime("%d/%m/%Y %H:%M:%S")
-                    )
-            workdays.append(workday)
-        except Exception as e:
-            print("Parsing error: {}".format(e))
-            print("Skipping line: {}".format(line))
-            continue
+summary = "Philipp Metzner"
+records = importer.read_file(os.path.join(script_dir, "2017_working_hours.txt"),
+        summary=summary)
 
 service = utils.build_service()
 calendarId = dict(methods.list_calendars(service))["MUC working students attendance"]
 
-for workday in workdays:
-    events = methods.fetch_events(service,
-            calendarId=calendarId,
-            start=workday.start.split()[0]
-            )
-    summary = "Philipp Metzner"
-
-    existing_event = None
-    for event in events:
-        if event["summary"] == summary:
-            existing_event = event
-            break
-    if existing_event is not None:
-        print("Event already exists, is being updated!")
-        methods.delete_event(service, existing_event["id"],
-                calendarId=calendarId)
+# one event per day: identify by date to update the hours of existing events
+result = importer.import_events(service, records,
+        calendarId=calendarId,
+        key=lambda record: record["start"].split()[0]
+        )
 
-    methods.create_event(service,
-            calendarId=calendarId,
-            summary=summary,
-            start=workday.start,
-            end=workday.end,
-            enable_reminders=False
-            )
+print("{} events created, {} updated, {} unchanged".format(
+    result.inserted, result.updated, result.unchanged))
+for event_id, exception in result.failed:
+    print("Request for event {} failed: {}".format(event_id, exception))
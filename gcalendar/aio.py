@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+"""Asynchronous counterparts of the functions of gcalendar.methods for use in
+an asyncio event loop. Needs the optional httpx package
+(pip install 'httpx[http2]').
+
+All functions take a Client that shares its connection pool among the
+concurrent calls and limits their number, e.g.
+
+    async with aio.Client() as client:
+        await asyncio.gather(*(aio.delete_event(client, event_id)
+            for event_id in event_ids))
+
+        async for page in aio.fetch_events(client, start='11/04/2017'):
+            ...
+
+Errors are raised as apiclient.errors.HttpError, like the ones of the
+blocking functions, and are retried with the policy of the scheduler module.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from urllib.parse import quote
+
+from . import instrumentation
+from .methods import event_body, time_range
+from .scheduler import is_retryable
+from .utils import API_URL_VARIABLE
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ROOT_URL = "https://www.googleapis.com/"
+SERVICE_PATH = "calendar/v3/"
+# Default number of calls running concurrently per client
+MAX_CONCURRENCY = 50
+
+
+class Client(object):
+    """
+    Sends Calendar API requests with an httpx.AsyncClient.
+
+    :param credentials: OAuth2 credentials providing get_access_token(), e.g.
+        as returned from utils.get_credentials(). Requests to Google are
+        authorized with them; by default, utils.get_credentials() is called
+        on the first request. Requests to other servers are sent
+        unauthorized.
+    :type credentials: oauth2client.client.Credentials
+
+    :param root_url: URL of the API server, e.g. of a fake.FakeCalendarServer.
+        Defaults to the value of GCALENDAR_API_URL, or Google's server.
+    :type root_url: str
+
+    :param max_concurrency: maximum number of calls sent at once
+    :type max_concurrency: int
+
+    :param max_connections: maximum number of open connections
+    :type max_connections: int
+
+    :param http2: If true (default), use HTTP/2 if the server supports it.
+    :type http2: bool
+
+    :param max_retries: maximum number of retries of a failed call. See
+        scheduler.RequestScheduler for the backoff.
+    :type max_retries: int
+    """
+
+    def __init__(self, credentials=None, root_url=None,
+            max_concurrency=MAX_CONCURRENCY, max_connections=MAX_CONCURRENCY,
+            http2=True, timeout=60.0, max_retries=5, base_delay=1.0,
+            max_delay=32.0, sleep=asyncio.sleep, random=random.random):
+        import httpx
+
+        if root_url is None:
+            root_url = os.environ.get(API_URL_VARIABLE, GOOGLE_ROOT_URL)
+        self.root_url = root_url.rstrip("/") + "/"
+        self._authorize = self.root_url == GOOGLE_ROOT_URL
+        self._credentials = credentials
+        self._token = None
+        self._token_expiry = 0.0
+        self._token_lock = asyncio.Lock()
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._random = random
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._transport_error = httpx.TransportError
+        self._client = httpx.AsyncClient(http2=http2, timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections,
+                    max_keepalive_connections=max_connections))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def request(self, method, path, api_method, params=None, body=None):
+        """
+        Send an API call, retrying it on retryable errors.
+
+        :param method: HTTP method
+        :type method: str
+
+        :param path: path relative to the service, e.g. 'users/me/calendarList'
+        :type path: str
+
+        :param api_method: name of the API method reported to instrumentation
+            hooks, e.g. 'calendar.events.list'
+        :type api_method: str
+
+        :param params: query parameters; None values are left out
+        :type params: dict
+
+        :param body: JSON body
+        :type body: dict
+
+        :raises apiclient.errors.HttpError: if the call fails finally
+
+        :returns the deserialized response, or None if empty
+        """
+
+        url = self.root_url + SERVICE_PATH + path
+        params = dict((key, _format_param(value)) for key, value in
+                (params or {}).items() if value is not None)
+        content = None if body is None else json.dumps(body).encode("utf-8")
+
+        attempt, size, error = 0, None, None
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    response = await self._send(method, url, params, content)
+                    size = len(response.content)
+                    return json.loads(response.content.decode("utf-8")) \
+                        if response.content else None
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    await self._backoff(api_method, attempt, e)
+                    attempt += 1
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if instrumentation.enabled():
+                instrumentation.emit(instrumentation.CallRecord(
+                    method=api_method, calendarId=instrumentation.calendar_id(url),
+                    latency=time.perf_counter() - start, bytes=size,
+                    retries=attempt, pages=int(error is None and
+                        api_method.endswith(".list")), error=error))
+
+    async def _send(self, method, url, params, content):
+        headers = {"accept": "application/json"}
+        if content is not None:
+            headers["content-type"] = "application/json"
+        if self._authorize:
+            headers["authorization"] = "Bearer {}".format(
+                    await self._access_token())
+
+        async with self._semaphore:
+            try:
+                response = await self._client.request(method, url,
+                        params=params, content=content, headers=headers)
+            except self._transport_error as e:
+                # retryable like the errors of httplib2
+                raise ConnectionError(str(e)) from e
+
+        if response.status_code >= 300:
+            import httplib2
+            from apiclient.errors import HttpError
+            if response.status_code == 401:
+                # let the next call refresh the token
+                self._token = None
+            info = dict(response.headers)
+            info["status"] = str(response.status_code)
+            raise HttpError(httplib2.Response(info), response.content,
+                    uri=str(response.url))
+        return response
+
+    async def _access_token(self):
+        """Return a valid access token, refreshing it in an executor thread
+        since oauth2client is blocking."""
+        async with self._token_lock:
+            if self._token is None or time.monotonic() >= self._token_expiry:
+                loop = asyncio.get_running_loop()
+                if self._credentials is None:
+                    from .utils import get_credentials
+                    self._credentials = await loop.run_in_executor(None,
+                            get_credentials)
+                info = await loop.run_in_executor(None,
+                        self._credentials.get_access_token)
+                self._token = info.access_token
+                # renew a minute early
+                self._token_expiry = time.monotonic() + \
+                    (info.expires_in or 3600) - 60
+            return self._token
+
+    async def _backoff(self, api_method, attempt, error):
+        delay = self._random() * min(self.max_delay,
+                self.base_delay * 2 ** attempt)
+        logger.warning("Retrying {} in {:.1f}s after error: {}".format(
+            api_method, delay, error))
+        await self._sleep(delay)
+
+
+async def create_event(client, calendarId='primary', **kwargs):
+    """
+    Create an event. See methods.create_event() for the arguments, except
+    for conflicts.
+
+    :returns event_id: ID of the created event
+    :type event_id: str
+    """
+
+    event = event_body(**kwargs)
+    response = await client.request("POST", _events_path(calendarId),
+            "calendar.events.insert", body=event)
+    logger.info("Successfully created event with ID={}".format(response["id"]))
+    return response["id"]
+
+
+async def fetch_events(client, calendarId='primary', start=None, end=None,
+        max_results=250, fields=None):
+    """
+    Asynchronous generator yielding the events of the specified calendar
+    between start and end date page by page. The next page is requested when
+    iterating on. See methods.iter_events() for the arguments.
+
+    :yields list[dict]
+    """
+
+    time_min, time_max = time_range(start, end)
+    params = dict(timeMin=time_min, timeMax=time_max, singleEvents=True,
+            orderBy="startTime", maxResults=max_results)
+    if fields is not None:
+        params["fields"] = "nextPageToken,items({})".format(fields)
+
+    while True:
+        response = await client.request("GET", _events_path(calendarId),
+                "calendar.events.list", params=params)
+        yield response.get("items", [])
+
+        params["pageToken"] = response.get("nextPageToken")
+        if params["pageToken"] is None:
+            break
+
+
+async def delete_event(client, event_id, calendarId='primary'):
+    """
+    Delete event specified by ID from calendar.
+
+    :raises apiclient.errors.HttpError: e.g. if the event is not found
+    """
+
+    await client.request("DELETE", "{}/{}".format(_events_path(calendarId),
+        quote(event_id, safe="")), "calendar.events.delete")
+
+
+async def list_calendars(client):
+    """
+    Asynchronous generator yielding a (summary, ID) tuple for every calendar.
+
+    :yields tuple(str, str)
+    """
+
+    params = {}
+    while True:
+        response = await client.request("GET", "users/me/calendarList",
+                "calendar.calendarList.list", params=params)
+        for item in response.get("items", []):
+            yield item["summary"], item["id"]
+
+        params["pageToken"] = response.get("nextPageToken")
+        if params["pageToken"] is None:
+            break
+
+
+def _events_path(calendarId):
+    return "calendars/{}/events".format(quote(calendarId, safe=""))
+
+
+def _format_param(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""Free/busy queries and conflict detection.
+
+Busy times are either requested from the Calendar freebusy endpoint or taken
+from events fetched before (e.g. from methods.fetch_events() or the event
+cache), and kept in an IntervalIndex that answers overlap and free slot
+queries without further requests.
+
+All times are UTC timestamps as returned from utils.utc_timestamp().
+"""
+
+import logging
+import datetime
+
+from . import methods
+from .utils import utc_timestamp, TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of calendars per freebusy request
+FREEBUSY_MAX_CALENDARS = 50
+
+
+class ConflictError(Exception):
+    """Raised if a new event overlaps existing ones. The overlapping items are
+    available as `conflicts`."""
+
+    def __init__(self, conflicts):
+        super(ConflictError, self).__init__(
+                "Event overlaps {} existing event(s)".format(len(conflicts)))
+        self.conflicts = conflicts
+
+
+class IntervalIndex(object):
+    """
+    Static interval tree over (start, end, item) tuples. The intervals are
+    sorted by start and form an implicit balanced binary tree in which every
+    node knows the maximum end of its subtree, so queries visit only the
+    subtrees that can contain overlapping intervals: O(log n + k) for k
+    results.
+
+    Intervals are half-open, i.e. an interval ending at 10:00 does not overlap
+    one starting at 10:00.
+
+    :param intervals: (start, end, item) tuples
+    :type intervals: iterable[tuple(str, str, object)]
+    """
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self._starts = [interval[0] for interval in intervals]
+        self._ends = [interval[1] for interval in intervals]
+        self._items = [interval[2] for interval in intervals]
+        self._max_ends = list(self._ends)
+        self._build(0, len(intervals))
+
+    @classmethod
+    def from_events(cls, events):
+        """Create the index of events as returned from fetch_events(). The
+        events are the items of the index. Cancelled events and events not
+        blocking time (transparent) are left out."""
+        return cls((utc_timestamp(event["start"]), utc_timestamp(event["end"]),
+            event) for event in events if event.get("status") != "cancelled"
+            and event.get("transparency") != "transparent")
+
+    def __len__(self):
+        return len(self._items)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and self._max_ends[child] > self._max_ends[mid]:
+                self._max_ends[mid] = self._max_ends[child]
+        return mid
+
+    def overlapping(self, start, end):
+        """
+        Return the items of all intervals overlapping [start, end), ordered by
+        start.
+
+        :type start: str
+        :type end: str
+
+        :rtype list
+        """
+
+        indices = []
+        self._search(0, len(self._items), start, end, indices)
+        return [self._items[index] for index in indices]
+
+    def _search(self, lo, hi, start, end, indices):
+        """Append the indices of intervals overlapping [start, end) within the
+        subtree of the index range [lo, hi), in order."""
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        # no interval of the subtree ends after the start
+        if self._max_ends[mid] <= start:
+            return
+        self._search(lo, mid, start, end, indices)
+        # intervals right of mid start after the end if mid does
+        if self._starts[mid] < end:
+            if self._ends[mid] > start:
+                indices.append(mid)
+            self._search(mid + 1, hi, start, end, indices)
+
+    def check(self, start, end):
+        """
+        Raise ConflictError if any interval overlaps [start, end).
+
+        :param start: RFC3339 timestamp, or the start field of an event
+        :type start: str or dict
+        :type end: str or dict
+        """
+
+        conflicts = self.overlapping(utc_timestamp(start), utc_timestamp(end))
+        if conflicts:
+            raise ConflictError(conflicts)
+
+    def free_slots(self, start, end, min_duration=None):
+        """
+        Return the gaps between the intervals within [start, end).
+
+        :type start: str
+        :type end: str
+
+        :param min_duration: minimum length of the returned slots
+        :type min_duration: datetime.timedelta
+
+        :returns list of (start, end) tuples
+        """
+
+        indices = []
+        self._search(0, len(self._items), start, end, indices)
+
+        slots = []
+        current = start
+        for index in indices:
+            if self._starts[index] > current:
+                slots.append((current, self._starts[index]))
+            current = max(current, self._ends[index])
+        if current < end:
+            slots.append((current, end))
+
+        if min_duration is not None:
+            slots = [slot for slot in slots if _duration(slot) >= min_duration]
+        return slots
+
+
+def query_busy(service, calendar_ids, start=None, end=None):
+    """
+    Request the busy times of the calendars between start and end date from
+    the freebusy endpoint.
+
+    :param calendar_ids: IDs of the calendars, e.g. emails of people
+    :type calendar_ids: iterable[str]
+
+    :param start: start date of the query in format dd/mm/yyyy
+    :type start: str
+
+    :param end: end date of the query in format dd/mm/yyyy, included.
+        Default: start date
+    :type end: str
+
+    :raises Errors are propagated from the apiclient module.
+
+    :returns IntervalIndex of the busy times; the items are the calendar IDs
+    """
+
+    time_min, time_max = methods.time_range(start, end)
+    calendar_ids = list(calendar_ids)
+
+    intervals = []
+    for offset in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+        items = [{"id": calendarId} for calendarId in
+                calendar_ids[offset:offset + FREEBUSY_MAX_CALENDARS]]
+        response = methods.execute(service.freebusy().query(body={
+            "timeMin": time_min, "timeMax": time_max, "items": items}))
+
+        for calendarId, calendar in response["calendars"].items():
+            if calendar.get("errors"):
+                logger.warning("Free/busy of calendar {} unavailable: {}".format(
+                    calendarId, calendar["errors"]))
+            for busy in calendar.get("busy", []):
+                intervals.append((utc_timestamp(busy["start"]),
+                    utc_timestamp(busy["end"]), calendarId))
+
+    return IntervalIndex(intervals)
+
+
+def find_free_slots(service, calendar_ids, start=None, end=None,
+        min_duration=None):
+    """
+    Find the times between start and end date at which all calendars are
+    free. See query_busy() for the arguments.
+
+    :param min_duration: minimum length of the returned slots
+    :type min_duration: datetime.timedelta
+
+    :returns list of (start, end) UTC timestamps
+    """
+
+    time_min, time_max = methods.time_range(start, end)
+    index = query_busy(service, calendar_ids, start, end)
+    return index.free_slots(utc_timestamp(time_min), utc_timestamp(time_max),
+            min_duration)
+
+
+def _duration(slot):
+    start, end = (datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+            for value in slot)
+    return end - start
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""Local SQLite store of calendar events that is kept current by incremental
+synchronisation with the Calendar API."""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+from .methods import execute, time_range
+from .utils import utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'gcalendar',
+        'events.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS events_range ON events (calendar_id, start, end);
+CREATE TABLE IF NOT EXISTS sync_tokens (
+    calendar_id TEXT PRIMARY KEY,
+    token TEXT NOT NULL
+);
+"""
+
+
+class EventCache(object):
+    """
+    On-disk event store keyed by calendar ID and event ID.
+
+    The first sync() of a calendar downloads all of its events, subsequent
+    calls only transfer the changes since the previous sync. Queries are
+    answered from the local store without network access.
+
+    :param path: path of the SQLite database file, ':memory:' for a
+        non-persistent store. Default: ~/.cache/gcalendar/events.sqlite
+    :type path: str
+
+    The store can be shared among threads, e.g. with the sync thread of a
+    notifications.CalendarWatcher.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        if path != ':memory:':
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+
+    def close(self):
+        self._connection.close()
+
+    def sync(self, service, calendarId='primary', max_results=250, http=None):
+        """
+        Synchronise the stored events of the calendar with the server. A full
+        sync is performed if the calendar was never synced before or if the
+        server invalidated the sync token.
+
+        :param calendarId: ID of the calendar to sync. Default: 'primary'
+        :type calendarId: str
+
+        :param max_results: maximum number of events per result page
+        :type max_results: int
+
+        :param http: Http object to send the requests with instead of the one
+            of the service, e.g. when syncing from another thread
+        :type http: httplib2.Http
+
+        :raises Errors are propagated from the apiclient module.
+
+        :returns number of added, modified or removed events
+        :type int
+        """
+
+        from apiclient.errors import HttpError
+
+        with self._lock:
+            sync_token = self.sync_token(calendarId)
+
+            try:
+                return self._sync(service, calendarId, sync_token, max_results,
+                        http)
+            except HttpError as e:
+                if sync_token is None or e.resp.status != 410:
+                    raise
+
+            logger.info("Sync token of calendar {} expired".format(calendarId))
+            return self._sync(service, calendarId, None, max_results, http)
+
+    def _sync(self, service, calendarId, sync_token, max_results, http):
+        list_kwargs = dict(calendarId=calendarId, singleEvents=True,
+                maxResults=max_results)
+        if sync_token is None:
+            logger.info("Full sync of calendar {}".format(calendarId))
+        else:
+            list_kwargs["syncToken"] = sync_token
+
+        nr_changes = 0
+        page_token = None
+        with self._connection:
+            if sync_token is None:
+                self.clear(calendarId)
+
+            while True:
+                response = execute(service.events().list(pageToken=page_token,
+                        **list_kwargs), http=http)
+
+                for event in response.get('items', []):
+                    self._store(calendarId, event)
+                    nr_changes += 1
+
+                page_token = response.get('nextPageToken')
+                if page_token is None:
+                    break
+
+            self._connection.execute(
+                    "INSERT OR REPLACE INTO sync_tokens VALUES (?, ?)",
+                    (calendarId, response['nextSyncToken']))
+
+        logger.info("Synced {} changes of calendar {}".format(nr_changes,
+            calendarId))
+        return nr_changes
+
+    def _store(self, calendarId, event):
+        if event.get('status') == 'cancelled':
+            self._connection.execute(
+                    "DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                    (calendarId, event['id']))
+            return
+
+        self._connection.execute(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                (calendarId, event['id'], utc_timestamp(event['start']),
+                    utc_timestamp(event['end']), json.dumps(event)))
+
+    def sync_token(self, calendarId='primary'):
+        """Return the token of the last sync of the calendar, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                    "SELECT token FROM sync_tokens WHERE calendar_id = ?",
+                    (calendarId,)).fetchone()
+        return None if row is None else row[0]
+
+    def clear(self, calendarId):
+        """Remove all stored events and the sync token of the calendar."""
+        with self._lock:
+            self._connection.execute("DELETE FROM events WHERE calendar_id = ?",
+                    (calendarId,))
+            self._connection.execute(
+                    "DELETE FROM sync_tokens WHERE calendar_id = ?",
+                    (calendarId,))
+
+    def fetch_events(self, calendarId='primary', start=None, end=None):
+        """
+        Fetch stored events of the specified calendar between start and end
+        date, ordered by start time. See methods.fetch_events() for the
+        arguments.
+
+        :returns list[dict]
+        """
+
+        time_min, time_max = time_range(start, end)
+        with self._lock:
+            rows = self._connection.execute(
+                    "SELECT body FROM events WHERE calendar_id = ? AND start < ? "
+                    "AND end > ? ORDER BY start",
+                    (calendarId, utc_timestamp(time_max),
+                        utc_timestamp(time_min))).fetchall()
+        return [json.loads(body) for body, in rows]
+
+    def get_event(self, event_id, calendarId='primary'):
+        """
+        Return the stored event with the given ID, or None if not found.
+
+        :type event_id: str
+        :type calendarId: str
+
+        :returns dict
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                    "SELECT body FROM events WHERE calendar_id = ? AND "
+                    "event_id = ?", (calendarId, event_id)).fetchone()
+        return None if row is None else json.loads(row[0])
+
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+
+"""In-process cache of OAuth2 credentials with proactive token refresh.
+
+Credentials are loaded once per process and refreshed by a background timer
+shortly before their access token expires, so requests never wait for a
+refresh. User credentials are stored in a file that is locked while being
+read or refreshed, hence several processes can share it: a process finding a
+token refreshed by another one takes it over instead of refreshing again.
+
+Service-account credentials (e.g. for headless workers) are read from a JSON
+key file, given directly or by the GCALENDAR_SERVICE_ACCOUNT environment
+variable.
+"""
+
+import os
+import fcntl
+import logging
+import datetime
+import threading
+
+from .utils import SCOPES, APPLICATION_NAME
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_FILE = os.path.join(os.path.expanduser('~'), '.credentials',
+        'calendar-python-quickstart.json')
+# Default location of the OAuth2 client secret downloaded from the Google
+# API console
+CLIENT_SECRET_FILE = os.path.join(os.path.expanduser('~'), '.credentials',
+        'client_secret.json')
+CLIENT_SECRET_VARIABLE = 'GCALENDAR_CLIENT_SECRET'
+SERVICE_ACCOUNT_VARIABLE = 'GCALENDAR_SERVICE_ACCOUNT'
+
+# Seconds before expiry at which access tokens are refreshed
+REFRESH_MARGIN = 5 * 60
+# Seconds after which a failed background refresh is retried
+RETRY_INTERVAL = 60
+REFRESH_THREAD = 'gcalendar-token-refresh'
+
+
+def _storage_class():
+    from oauth2client.file import Storage
+
+    class LockedStorage(Storage):
+        """File storage of credentials that is locked against other processes
+        as well as other threads, using a lock file next to it."""
+
+        def acquire_lock(self):
+            super(LockedStorage, self).acquire_lock()
+            self._lock_file = open('{}.lock'.format(self._filename), 'a')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+        def release_lock(self):
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            super(LockedStorage, self).release_lock()
+
+    return LockedStorage
+
+
+def locked_storage(path):
+    """Return an oauth2client Storage of the file at path that locks it
+    against concurrent access of other processes."""
+    return _storage_class()(path)
+
+
+class CredentialCache(object):
+    """
+    Credentials by key, each refreshed in background REFRESH_MARGIN seconds
+    before its access token expires.
+
+    :param refresh_margin: seconds before expiry at which tokens are refreshed
+    :type refresh_margin: float
+
+    :param http_factory: callable returning an Http object to refresh tokens
+        with. Default: httplib2.Http
+    :type http_factory: callable
+    """
+
+    def __init__(self, refresh_margin=REFRESH_MARGIN, http_factory=None,
+            utcnow=datetime.datetime.utcnow):
+        self.refresh_margin = refresh_margin
+        self._http_factory = http_factory
+        self._utcnow = utcnow
+        self._credentials = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+        Return the cached credentials of the key. On first access, they are
+        created by calling load(), refreshed if due and scheduled for
+        background refresh.
+
+        :type key: hashable
+        :type load: callable
+
+        :returns oauth2client.client.Credentials
+        """
+
+        with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None or credentials.invalid:
+                credentials = load()
+                self._credentials[key] = credentials
+            else:
+                return credentials
+
+        if self._seconds_left(credentials) <= self.refresh_margin:
+            self._refresh(key, credentials)
+        self._schedule(key, credentials)
+        return credentials
+
+    def clear(self):
+        """Forget all credentials and stop their background refresh."""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._credentials.clear()
+
+    def discard(self, credentials):
+        """Forget the credentials and stop their background refresh."""
+        with self._lock:
+            for key, cached in list(self._credentials.items()):
+                if cached is credentials:
+                    del self._credentials[key]
+                    timer = self._timers.pop(key, None)
+                    if timer is not None:
+                        timer.cancel()
+
+    def _seconds_left(self, credentials):
+        """Seconds until the access token expires; 0 if there is none."""
+        if credentials.access_token is None:
+            return 0
+        if credentials.token_expiry is None:
+            return float('inf')
+        return (credentials.token_expiry - self._utcnow()).total_seconds()
+
+    def _refresh(self, key, credentials):
+        if self._http_factory is None:
+            import httplib2
+            http = httplib2.Http()
+        else:
+            http = self._http_factory()
+        credentials.refresh(http)
+        logger.debug("Refreshed access token of {}".format(key))
+
+    def _schedule(self, key, credentials, delay=None):
+        if delay is None:
+            delay = self._seconds_left(credentials) - self.refresh_margin
+            if delay == float('inf'):
+                return
+        timer = threading.Timer(max(delay, 0), self._refresh_in_background,
+                args=(key, credentials))
+        timer.name = REFRESH_THREAD
+        timer.daemon = True
+        with self._lock:
+            if self._credentials.get(key) is not credentials:
+                return
+            previous = self._timers.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._timers[key] = timer
+        timer.start()
+
+    def _refresh_in_background(self, key, credentials):
+        try:
+            self._refresh(key, credentials)
+        except Exception as e:
+            # the token is refreshed inline on the next request if expired
+            logger.warning("Refresh of access token failed: {}".format(e))
+            self._schedule(key, credentials, RETRY_INTERVAL)
+            return
+        self._schedule(key, credentials)
+
+
+default_cache = CredentialCache()
+
+
+def client_secret_file():
+    """Return the path of the OAuth2 client secret: the value of
+    GCALENDAR_CLIENT_SECRET, or ~/.credentials/client_secret.json."""
+    return os.environ.get(CLIENT_SECRET_VARIABLE, CLIENT_SECRET_FILE)
+
+
+def user_credentials(flags=None, client_secret=None, path=CREDENTIALS_FILE,
+        cache=None):
+    """
+    Return the cached credentials of the user stored at path. If nothing has
+    been stored, or if the stored credentials are invalid, the OAuth2 flow is
+    completed to obtain new ones.
+
+    :param flags: flags of the OAuth2 flow as returned from
+        utils.parse_flags(). Defaults are used if omitted.
+    :type flags: argparse.Namespace
+
+    :param client_secret: path of the client secret file. Default: see
+        client_secret_file()
+    :type client_secret: str
+
+    :param cache: Default: default_cache
+    :type cache: CredentialCache
+
+    :returns oauth2client.client.Credentials
+    """
+
+    def load():
+        from oauth2client import client
+        from oauth2client import tools
+        from .utils import parse_flags
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        store = locked_storage(path)
+        credentials = store.get()
+        if not credentials or credentials.invalid:
+            flow = client.flow_from_clientsecrets(
+                    client_secret or client_secret_file(), SCOPES)
+            flow.user_agent = APPLICATION_NAME
+            credentials = tools.run_flow(flow, store,
+                    flags if flags is not None else parse_flags([]))
+            print('Storing credentials to ' + path)
+        return credentials
+
+    cache = cache if cache is not None else default_cache
+    return cache.get(('user', os.path.abspath(path)), load)
+
+
+def service_account_credentials(keyfile=None, subject=None, cache=None):
+    """
+    Return the cached credentials of a service account.
+
+    :param keyfile: path of the JSON key file of the service account.
+        Default: value of GCALENDAR_SERVICE_ACCOUNT
+    :type keyfile: str
+
+    :param subject: email of the user to impersonate (domain-wide delegation)
+    :type subject: str
+
+    :param cache: Default: default_cache
+    :type cache: CredentialCache
+
+    :raises ValueError: if no key file is given
+
+    :returns oauth2client.service_account.ServiceAccountCredentials
+    """
+
+    keyfile = keyfile or os.environ.get(SERVICE_ACCOUNT_VARIABLE)
+    if keyfile is None:
+        raise ValueError("No service account key file given")
+
+    def load():
+        from oauth2client.service_account import ServiceAccountCredentials
+        credentials = ServiceAccountCredentials.from_json_keyfile_name(keyfile,
+                SCOPES)
+        if subject is not None:
+            credentials = credentials.create_delegated(subject)
+        return credentials
+
+    cache = cache if cache is not None else default_cache
+    return cache.get(('service', os.path.abspath(keyfile), subject), load)
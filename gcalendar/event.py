@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Compact representation of calendar events."""
+
+import json
+import datetime
+
+
+class Event(object):
+    """
+    Memory-efficient event with parsed start and end. Only ID, summary,
+    status and times are held as attributes; all other fields are kept as
+    compact JSON and decoded on access, e.g. event.location or
+    event.get('htmlLink').
+
+    Events are ordered by start, end and ID.
+
+    :param event: event as returned from the API
+    :type event: dict
+
+    :param keep_raw: If false, the remaining fields are dropped to save
+        memory. Accessing them raises AttributeError then.
+    :type keep_raw: bool
+    """
+
+    __slots__ = ("id", "summary", "status", "start", "end", "all_day", "_raw")
+
+    def __init__(self, event, keep_raw=True):
+        self.id = event.get("id")
+        self.summary = event.get("summary", "")
+        self.status = event.get("status", "confirmed")
+        self.start, self.all_day = _parse_time(event["start"])
+        self.end, _ = _parse_time(event["end"])
+        self._raw = json.dumps(event, separators=(",", ":")) if keep_raw else None
+
+    def raw(self):
+        """Return the event as dict, as returned from the API. The dict is
+        decoded on every call."""
+        if self._raw is None:
+            raise AttributeError("Raw event of {} was not kept".format(self.id))
+        return json.loads(self._raw)
+
+    def get(self, field, default=None):
+        """Return the value of any field of the raw event."""
+        return self.raw().get(field, default)
+
+    def __getattr__(self, field):
+        # only called for fields that are no slots
+        if field.startswith("_"):
+            raise AttributeError(field)
+        try:
+            return self.raw()[field]
+        except KeyError:
+            raise AttributeError(field)
+
+    def duration(self):
+        return self.end - self.start
+
+    def overlaps(self, start, end):
+        """Return whether the event overlaps the datetimes [start, end)."""
+        return self.start < end and self.end > start
+
+    def __lt__(self, other):
+        return (self.start, self.end, self.id) < (other.start, other.end, other.id)
+
+    def __eq__(self, other):
+        return isinstance(other, Event) and self.id == other.id and \
+            self.start == other.start and self.end == other.end
+
+    def __hash__(self):
+        return hash((self.id, self.start, self.end))
+
+    def __repr__(self):
+        return "Event(id={!r}, summary={!r}, start={}, end={})".format(
+                self.id, self.summary, self.start.isoformat(),
+                self.end.isoformat())
+
+
+def _parse_time(time):
+    """Parse the start or end field of an event to a timezone-aware datetime.
+    All-day events start at midnight UTC.
+
+    :returns tuple(datetime.datetime, bool) datetime and whether all-day
+    """
+    if "dateTime" in time:
+        value = time["dateTime"].replace("Z", "+00:00")
+        return datetime.datetime.fromisoformat(value), False
+
+    date = datetime.datetime.strptime(time["date"], "%Y-%m-%d")
+    return date.replace(tzinfo=datetime.timezone.utc), True
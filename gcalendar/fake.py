@@ -0,0 +1,664 @@
+#!/usr/bin/env python
+
+"""In-memory stand-in for the Google Calendar API to run tests and
+benchmarks without network access or OAuth credentials.
+
+The events, calendarList and freebusy endpoints are supported, including
+pagination, sync tokens and batch requests. Watched calendars send push
+notifications to their channel addresses, see NotificationSender.
+FakeCalendarHttp answers the requests in-process; FakeCalendarServer serves
+them on localhost, e.g.
+
+    with FakeCalendarServer(FakeCalendarHttp(latency=0.05)) as server:
+        service = utils.build_service(root_url=server.url)
+
+The CLI can be pointed at a running server by the GCALENDAR_API_URL
+environment variable, see utils.build_service().
+"""
+
+import json
+import time
+import uuid
+import queue
+import datetime
+import random
+import logging
+import threading
+import urllib.request
+from email.parser import FeedParser
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httplib2
+from apiclient import discovery
+
+from . import notifications
+from .utils import BUNDLED_DISCOVERY_FILE, TIMESTAMP_FORMAT, utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/calendar/v3/"
+BATCH_PATH = "/batch/calendar/v3"
+DISCOVERY_PATH = "/discovery/v1/apis/calendar/v3/rest"
+MAX_BATCH_SIZE = 50
+# Query parameters that may be given several times
+REPEATED_PARAMS = ("privateExtendedProperty", "sharedExtendedProperty")
+# Lifetime of notification channels if no ttl is requested, in seconds
+CHANNEL_TTL = 7 * 24 * 60 * 60
+
+
+class FakeCalendarHttp(object):
+    """
+    Object mimicking httplib2.Http that answers Calendar API requests from
+    an in-memory store of calendars and events. It is thread-safe.
+
+    Every received request is recorded as (method, path, params) tuple in
+    `requests`.
+
+    :param calendars: summaries of the initial calendars by ID.
+        Default: {'primary': 'Primary'}
+    :type calendars: dict
+
+    :param latency: delay in seconds of every response
+    :type latency: float
+
+    :param error_rate: probability of an API call to fail with a 503 error
+    :type error_rate: float
+
+    :param seed: seed of the random errors
+    :type seed: int
+    """
+
+    def __init__(self, calendars=None, latency=0.0, error_rate=0.0, seed=None):
+        self.calendars = {}
+        self.requests = []
+        self.latency = latency
+        self.error_rate = error_rate
+        # incremented on every modification, used as sync token
+        self.sequence = 0
+        self._modified = {}
+        # statuses of errors returned for the next API calls, see fail_next()
+        self._failures = []
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        # open notification channels by ID
+        self.channels = {}
+        self._sender = None
+        for calendarId, summary in (calendars or {"primary": "Primary"}).items():
+            self.add_calendar(calendarId, summary)
+
+    def add_calendar(self, calendarId, summary):
+        self.calendars[calendarId] = {"summary": summary, "events": {}}
+
+    def add_event(self, calendarId="primary", **event):
+        event.setdefault("id", uuid.uuid4().hex)
+        event.setdefault("status", "confirmed")
+        event.setdefault("iCalUID", "{}@google.com".format(event["id"]))
+        self.calendars[calendarId]["events"][event["id"]] = event
+        self._touch(calendarId, event["id"])
+        return event
+
+    def delete_event(self, calendarId, eventId):
+        self.events(calendarId)[eventId]["status"] = "cancelled"
+        self._touch(calendarId, eventId)
+
+    def _touch(self, calendarId, eventId):
+        self.sequence += 1
+        self._modified[(calendarId, eventId)] = self.sequence
+        event = self.events(calendarId)[eventId]
+        # like the API, drop empty fields; patching a field with null clears it
+        for field in [field for field, value in event.items()
+                if value in ("", [], None)]:
+            del event[field]
+        event["etag"] = '"{}"'.format(self.sequence)
+        event["updated"] = "{}Z".format(datetime.datetime.utcnow().isoformat(
+            timespec="milliseconds"))
+        for channel in list(self.channels.values()):
+            if int(channel["expiration"]) <= time.time() * 1000:
+                # expired channels are dropped silently
+                del self.channels[channel["id"]]
+            elif channel["calendarId"] == calendarId:
+                self._send_notification(channel, "exists")
+
+    def _send_notification(self, channel, state):
+        if self._sender is None:
+            self._sender = NotificationSender()
+        channel["messageNumber"] += 1
+        self._sender.send(channel["address"], channel["id"],
+                channel["resourceId"], state, channel["messageNumber"],
+                token=channel.get("token"),
+                resource_uri="https://www.googleapis.com/calendar/v3/calendars"
+                "/{}/events?alt=json".format(channel["calendarId"]))
+
+    def flush_notifications(self, timeout=None):
+        """Block until all notifications sent so far have been delivered."""
+        if self._sender is not None:
+            self._sender.join(timeout)
+
+    def fail_next(self, status=503, count=1, reason="backendError"):
+        """Let the next API calls fail with the given status and reason."""
+        self._failures.extend([(status, reason)] * count)
+
+    def events(self, calendarId="primary"):
+        return self.calendars[calendarId]["events"]
+
+    def request(self, uri, method="GET", body=None, headers=None,
+            redirections=None, connection_type=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = urlparse(uri)
+        params = _params(parsed.query)
+        headers = dict((k.lower(), v) for k, v in (headers or {}).items())
+        with self._lock:
+            self.requests.append((method, parsed.path, params))
+            if parsed.path == BATCH_PATH:
+                return self._batch(headers["content-type"], body)
+            return self._dispatch(method, parsed.path, params, body, headers)
+
+    def _batch(self, content_type, body):
+        if not isinstance(body, str):
+            body = body.decode("utf-8")
+        parser = FeedParser()
+        parser.feed("content-type: {}\r\n\r\n{}".format(content_type, body))
+        parts = parser.close().get_payload()
+        if len(parts) > MAX_BATCH_SIZE:
+            return _response(400, {"error": {"message": "Too many requests"}})
+
+        boundary = "batch_{}".format(uuid.uuid4().hex)
+        chunks = []
+        for part in parts:
+            request_line, rest = part.get_payload().split("\n", 1)
+            method, target, _ = request_line.split(" ")
+            header_block, _, inner_body = rest.partition("\n\n")
+            headers = dict((name.strip().lower(), value.strip()) for name, _,
+                    value in (line.partition(":") for line in
+                        header_block.splitlines() if ":" in line))
+            parsed = urlparse(target)
+            params = _params(parsed.query)
+            resp, content = self._dispatch(method, parsed.path, params,
+                    inner_body or None, headers)
+            chunks.append(
+                "--{}\r\nContent-Type: application/http\r\n"
+                "Content-ID: <response-{}>\r\n\r\n"
+                "HTTP/1.1 {} OK\r\nContent-Type: application/json\r\n\r\n"
+                "{}\r\n".format(boundary, part["Content-ID"][1:-1], resp.status,
+                    content.decode("utf-8")))
+        chunks.append("--{}--".format(boundary))
+
+        resp = httplib2.Response({"status": "200",
+            "content-type": "multipart/mixed; boundary={}".format(boundary)})
+        return resp, "".join(chunks).encode("utf-8")
+
+    def _dispatch(self, method, path, params, body, headers=None):
+        if not self._failures and self.error_rate and \
+                self._random.random() < self.error_rate:
+            self.fail_next()
+        if self._failures:
+            status, reason = self._failures.pop(0)
+            return _response(status, {"error": {"code": status,
+                "message": reason, "errors": [{"reason": reason}]}})
+
+        if not path.startswith(API_PREFIX):
+            return _response(404, {"error": {"message": "Not found"}})
+
+        parts = path[len(API_PREFIX):].split("/")
+        if body and not isinstance(body, str):
+            body = body.decode("utf-8")
+        payload = json.loads(body) if body else None
+
+        if parts[:3] == ["users", "me", "calendarList"]:
+            return self._calendar_list(params)
+        if parts == ["freeBusy"] and method == "POST":
+            return self._freebusy(payload)
+        if parts == ["channels", "stop"] and method == "POST":
+            return self._stop_channel(payload)
+        if len(parts) >= 3 and parts[0] == "calendars" and parts[2] == "events":
+            calendarId = unquote(parts[1])
+            if calendarId not in self.calendars:
+                return _response(404, {"error": {"message": "Not found"}})
+            if len(parts) == 3:
+                if method == "GET":
+                    return self._list_events(calendarId, params)
+                if method == "POST":
+                    return self._insert_event(calendarId, payload)
+            elif parts[3:] == ["import"] and method == "POST":
+                return self._import_event(calendarId, payload)
+            elif parts[3:] == ["watch"] and method == "POST":
+                return self._watch(calendarId, payload)
+            elif len(parts) == 4:
+                return self._event(method, calendarId, unquote(parts[3]),
+                        payload, headers or {})
+            elif parts[4:] == ["instances"] and method == "GET":
+                return self._instances(calendarId, unquote(parts[3]), params)
+
+        return _response(400, {"error": {"message": "Unsupported request"}})
+
+    def _calendar_list(self, params):
+        items = [{"id": calendarId, "summary": calendar["summary"]}
+                for calendarId, calendar in sorted(self.calendars.items())]
+        return _response(200, {"items": items})
+
+    def _freebusy(self, query):
+        calendars = {}
+        for item in query["items"]:
+            if item["id"] not in self.calendars:
+                calendars[item["id"]] = {"errors": [{"reason": "notFound"}],
+                        "busy": []}
+                continue
+            # like the API, busy times are given in UTC
+            busy = sorted((utc_timestamp(e["start"]), utc_timestamp(e["end"]))
+                    for e in self.events(item["id"]).values()
+                    if e["status"] != "cancelled" and
+                    e.get("transparency") != "transparent")
+            calendars[item["id"]] = {"busy": [{"start": start, "end": end}
+                for start, end in busy if end > utc_timestamp(query["timeMin"])
+                and start < utc_timestamp(query["timeMax"])]}
+        return _response(200, {"kind": "calendar#freeBusy",
+            "timeMin": query["timeMin"], "timeMax": query["timeMax"],
+            "calendars": calendars})
+
+    def _list_events(self, calendarId, params):
+        if "syncToken" in params:
+            return self._sync_events(calendarId, params)
+
+        updated_min = params.get("updatedMin")
+        # deleted events are always included if updatedMin is given
+        show_deleted = params.get("showDeleted") == "true" or \
+            updated_min is not None
+        single_events = params.get("singleEvents") == "true"
+        # as are deleted instances of recurring events, unless expanded
+        events = [event for event in self.events(calendarId).values()
+                if show_deleted or event["status"] != "cancelled" or
+                (not single_events and "recurringEventId" in event)]
+        if updated_min is not None:
+            events = [e for e in events if utc_timestamp(e["updated"]) >
+                    utc_timestamp(updated_min)]
+        if params.get("q"):
+            events = [e for e in events if _matches_query(e, params["q"])]
+        for private_property in params.get("privateExtendedProperty", []):
+            key, _, value = private_property.partition("=")
+            events = [e for e in events if e.get("extendedProperties", {})
+                    .get("private", {}).get(key) == value]
+        time_min = params.get("timeMin")
+        time_max = params.get("timeMax")
+        if single_events:
+            events = self._single_events(calendarId, events, time_min,
+                    time_max)
+        # deleted instances of recurring events only have originalStartTime
+        if time_min is not None:
+            events = [e for e in events if "recurrence" in e or
+                    utc_timestamp(e.get("end", e.get("originalStartTime"))) >
+                    utc_timestamp(time_min)]
+        if time_max is not None:
+            events = [e for e in events if utc_timestamp(e.get("start",
+                e.get("originalStartTime"))) < utc_timestamp(time_max)]
+        events.sort(key=lambda e: utc_timestamp(e.get("start",
+            e.get("originalStartTime"))))
+        return _response(200, self._page(events, params))
+
+    def _single_events(self, calendarId, events, time_min, time_max):
+        """Replace recurring events by their instances within the range."""
+        from .recurrence import expand
+
+        exceptions = {}
+        for event in self.events(calendarId).values():
+            if "recurringEventId" in event:
+                exceptions.setdefault(event["recurringEventId"], set()).add(
+                        utc_timestamp(event["originalStartTime"]))
+
+        single_events = []
+        for event in events:
+            if "recurrence" not in event:
+                single_events.append(event)
+            elif event["status"] != "cancelled":
+                single_events.extend(expand(event,
+                    utc_timestamp(time_min or "1970-01-01T00:00:00Z"),
+                    utc_timestamp(time_max or "2100-01-01T00:00:00Z"),
+                    exceptions.get(event["id"], ())))
+        return single_events
+
+    def _sync_events(self, calendarId, params):
+        sync_token = params["syncToken"]
+        if not sync_token.isdigit() or int(sync_token) > self.sequence:
+            return _response(410, {"error": {"message": "Sync token invalid"}})
+        events = [event for event in self.events(calendarId).values()
+                if self._modified[(calendarId, event["id"])] > int(sync_token)]
+        events.sort(key=lambda e: self._modified[(calendarId, e["id"])])
+        return _response(200, self._page(events, params))
+
+    def _page(self, events, params):
+        offset = int(params.get("pageToken", 0))
+        max_results = int(params.get("maxResults", 250))
+        result = {"items": events[offset:offset + max_results]}
+        if offset + max_results < len(events):
+            result["nextPageToken"] = str(offset + max_results)
+        else:
+            result["nextSyncToken"] = str(self.sequence)
+        return result
+
+    def _insert_event(self, calendarId, event):
+        if event.get("id") in self.events(calendarId):
+            return _response(409, {"error": {"message": "Duplicate"}})
+        return _response(200, self.add_event(calendarId, **event))
+
+    def _import_event(self, calendarId, event):
+        """Insert the event, or update the one with the same iCalUID."""
+        if not event.get("iCalUID"):
+            return _response(400, {"error": {"message": "Missing iCalUID"}})
+        events = self.events(calendarId)
+        for existing in events.values():
+            # instances share the iCalUID of their recurring event
+            if existing["iCalUID"] == event["iCalUID"] and \
+                    "recurringEventId" not in existing:
+                event.update(id=existing["id"], status=event.get("status",
+                    "confirmed"))
+                events[existing["id"]] = event
+                self._touch(calendarId, existing["id"])
+                return _response(200, event)
+        event.pop("id", None)
+        return _response(200, self.add_event(calendarId, **event))
+
+    def _watch(self, calendarId, channel):
+        if channel.get("type") != "web_hook" or not channel.get("address"):
+            return _response(400, {"error": {"message": "Invalid channel"}})
+        if channel["id"] in self.channels:
+            return _response(400, {"error": {"message": "Channel id not unique"}})
+        ttl = int(channel.get("params", {}).get("ttl", CHANNEL_TTL))
+        channel.update(calendarId=calendarId, resourceId=uuid.uuid4().hex,
+                expiration=str(int((time.time() + ttl) * 1000)),
+                messageNumber=0)
+        self.channels[channel["id"]] = channel
+        self._send_notification(channel, notifications.SYNC_STATE)
+        return _response(200, {"kind": "api#channel", "id": channel["id"],
+            "resourceId": channel["resourceId"],
+            "expiration": channel["expiration"]})
+
+    def _stop_channel(self, payload):
+        channel = self.channels.get(payload.get("id"))
+        if channel is None or channel["resourceId"] != payload.get("resourceId"):
+            return _response(404, {"error": {"message": "Channel not found"}})
+        del self.channels[channel["id"]]
+        return _response(204, None)
+
+    def _instances(self, calendarId, eventId, params):
+        from .recurrence import expand
+
+        series = self.events(calendarId).get(eventId)
+        if series is None or series["status"] == "cancelled" or \
+                "recurrence" not in series:
+            return _response(404, {"error": {"message": "Not found"}})
+
+        exceptions = [event for event in self.events(calendarId).values()
+                if event.get("recurringEventId") == eventId]
+        time_min = params.get("timeMin", "1970-01-01T00:00:00Z")
+        time_max = params.get("timeMax", "2100-01-01T00:00:00Z")
+        if "originalStart" in params:
+            time_min = params["originalStart"]
+            time_max = _add_second(params["originalStart"])
+        instances = list(expand(series, utc_timestamp(time_min),
+            utc_timestamp(time_max), set(utc_timestamp(
+                event["originalStartTime"]) for event in exceptions)))
+        instances.extend(event for event in exceptions
+                if params.get("showDeleted") == "true" or
+                event["status"] != "cancelled")
+        if "originalStart" in params:
+            instances = [event for event in instances if utc_timestamp(
+                event["originalStartTime"]) == utc_timestamp(
+                    params["originalStart"])]
+        instances.sort(key=lambda e: utc_timestamp(e["originalStartTime"]))
+        return _response(200, self._page(instances, params))
+
+    def _instance(self, calendarId, eventId):
+        """Return the instance of a recurring event with the given ID, as
+        generated from the recurrence, or None."""
+        from .recurrence import expand
+
+        series_id, _, suffix = eventId.rpartition("_")
+        series = self.events(calendarId).get(series_id)
+        if series is None or series["status"] == "cancelled" or \
+                "recurrence" not in series:
+            return None
+        try:
+            if len(suffix) == 8:
+                original_start = utc_timestamp(datetime.datetime.strptime(
+                    suffix, "%Y%m%d").strftime("%Y-%m-%d"))
+            else:
+                original_start = utc_timestamp(datetime.datetime.strptime(
+                    suffix, "%Y%m%dT%H%M%SZ").strftime("%Y-%m-%dT%H:%M:%SZ"))
+        except ValueError:
+            return None
+        return next((instance for instance in expand(series, original_start,
+            utc_timestamp(_add_second(original_start))) if instance["id"] ==
+            eventId), None)
+
+    def _event(self, method, calendarId, eventId, payload, headers):
+        events = self.events(calendarId)
+        if eventId not in events:
+            instance = self._instance(calendarId, eventId)
+            if instance is None:
+                return _response(404, {"error": {"message": "Not found"}})
+            if method == "GET":
+                return _response(200, instance)
+            # modifying an instance stores it as exception of its series
+            events[eventId] = instance
+            self._touch(calendarId, eventId)
+        # deleted events can only be restored by an update
+        if events[eventId]["status"] == "cancelled" and method != "PUT":
+            return _response(404, {"error": {"message": "Not found"}})
+
+        if method == "GET":
+            return _response(200, events[eventId])
+        if headers.get("if-match", events[eventId]["etag"]) != events[eventId]["etag"]:
+            return _response(412, {"error": {"message": "Precondition Failed"}})
+        if method == "DELETE":
+            self.delete_event(calendarId, eventId)
+            return _response(204, None)
+        if method == "PUT":
+            payload["id"] = eventId
+            payload.setdefault("status", "confirmed")
+            events[eventId] = payload
+            self._touch(calendarId, eventId)
+            return _response(200, payload)
+        if method == "PATCH":
+            events[eventId].update(payload)
+            self._touch(calendarId, eventId)
+            return _response(200, events[eventId])
+        return _response(400, {"error": {"message": "Unsupported request"}})
+
+
+class NotificationSender(object):
+    """
+    Stand-in for the push notifications of the Calendar API: POSTs
+    notifications to channel addresses in order, from a background thread,
+    with the headers Google sends. Delivery failures are logged and dropped.
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                name="gcalendar-fake-notifications", daemon=True)
+        self._thread.start()
+
+    def send(self, address, channel_id, resource_id, state, message_number,
+            token=None, resource_uri=None):
+        headers = {
+            notifications.CHANNEL_ID_HEADER: channel_id,
+            notifications.RESOURCE_ID_HEADER: resource_id,
+            notifications.RESOURCE_STATE_HEADER: state,
+            notifications.MESSAGE_NUMBER_HEADER: str(message_number),
+            }
+        if token is not None:
+            headers[notifications.CHANNEL_TOKEN_HEADER] = token
+        if resource_uri is not None:
+            headers[notifications.RESOURCE_URI_HEADER] = resource_uri
+        self._queue.put((address, headers))
+
+    def join(self, timeout=None):
+        """Wait until the queued notifications are delivered."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else \
+                    deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._queue.all_tasks_done.wait(remaining)
+
+    def _run(self):
+        while True:
+            address, headers = self._queue.get()
+            try:
+                request = urllib.request.Request(address, data=b"",
+                        headers=headers, method="POST")
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                logger.warning("Delivering notification to {} failed: {}"
+                        .format(address, e))
+            finally:
+                self._queue.task_done()
+
+
+class FakeCalendarServer(object):
+    """
+    HTTP server on localhost answering Calendar API requests with a
+    FakeCalendarHttp. The discovery document is served as well. Use it as
+    context manager, or call start() and stop().
+
+    :param calendar: Default: a new FakeCalendarHttp
+    :type calendar: FakeCalendarHttp
+
+    :param port: Default: any free port
+    :type port: int
+    """
+
+    def __init__(self, calendar=None, host="127.0.0.1", port=0):
+        self.calendar = calendar if calendar is not None else FakeCalendarHttp()
+        self._server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.calendar = self.calendar
+        self._thread = None
+
+    @property
+    def url(self):
+        """Root URL of the server, e.g. 'http://127.0.0.1:8080/'."""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                name="gcalendar-fake-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("content-length", 0))
+        body = self.rfile.read(length) if length else None
+
+        if self.path.startswith(DISCOVERY_PATH):
+            resp, content = _response(200, discovery_document(
+                "http://{}/".format(self.headers["host"])))
+        else:
+            resp, content = self.server.calendar.request(self.path,
+                    method=self.command, body=body, headers=dict(self.headers))
+
+        self.send_response(resp.status)
+        for name, value in resp.items():
+            if name not in ("status", "content-length"):
+                self.send_header(name, value)
+        self.send_header("content-length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def discovery_document(root_url):
+    """Return the bundled discovery document pointing at the root URL."""
+    with open(BUNDLED_DISCOVERY_FILE) as f:
+        document = json.load(f)
+    document["rootUrl"] = root_url
+    return document
+
+
+def build_fake_service(http=None):
+    """Build a Calendar service from the bundled discovery document that sends
+    its requests to a FakeCalendarHttp instance."""
+    if http is None:
+        http = FakeCalendarHttp()
+    with open(BUNDLED_DISCOVERY_FILE) as f:
+        return discovery.build_from_document(f.read(), http=http)
+
+
+def _params(query):
+    return dict((k, v if k in REPEATED_PARAMS else v[-1])
+            for k, v in parse_qs(query).items())
+
+
+def _matches_query(event, q):
+    """Whether all words of the free text query occur in the event."""
+    text = " ".join([event.get("summary", ""), event.get("description", ""),
+        event.get("location", "")] + [attendee["email"] for attendee in
+            event.get("attendees", [])]).lower()
+    return all(word in text for word in q.lower().split())
+
+
+def _response(status, content):
+    resp = httplib2.Response({"status": str(status),
+        "content-type": "application/json"})
+    content = b"" if content is None else json.dumps(content).encode("utf-8")
+    return resp, content
+
+
+def _add_second(timestamp):
+    date_time = datetime.datetime.strptime(utc_timestamp(timestamp),
+            TIMESTAMP_FORMAT) + datetime.timedelta(seconds=1)
+    return date_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _start(event):
+    return event["start"].get("dateTime", event["start"].get("date"))
+
+
+def _end(event):
+    return event["end"].get("dateTime", event["end"].get("date"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a fake Calendar API "
+            "on localhost. Point the CLI at it by setting GCALENDAR_API_URL.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0,
+            help="delay of every response in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+            help="probability of an API call to fail with status 503")
+    args = parser.parse_args()
+
+    server = FakeCalendarServer(FakeCalendarHttp(latency=args.latency,
+        error_rate=args.error_rate), port=args.port)
+    print("Serving on {}".format(server.url))
+    server.serve_forever()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Composable predicates on events, applied locally to the events fetched by
+methods.iter_events() and fetch_events() (argument `where`).
+
+Filters combine with &, | and ~:
+
+    where = filters.equals("summary", "Standup") & \\
+        ~filters.contains("location", "Berlin")
+    events = methods.fetch_events(service, start="11/04/2017", q="Standup",
+        fields="id,summary,start,end", where=where)
+
+Every filter knows the event fields it reads, so these are added to the
+fields requested from the server. Combine them with the server-side
+parameters (e.g. q) to transfer as few events as possible.
+
+Field names may refer to nested fields by dots, e.g. 'organizer.email'.
+"""
+
+import re
+
+from .utils import utc_timestamp
+
+
+class Filter(object):
+    """
+    Predicate on event dicts.
+
+    :param predicate: callable taking an event and returning a bool
+    :type predicate: callable
+
+    :param fields: fields read by the predicate, as names of the fields
+        parameter of the API, e.g. 'organizer/email'
+    :type fields: iterable[str]
+    """
+
+    def __init__(self, predicate, fields=()):
+        self._predicate = predicate
+        self.fields = frozenset(fields)
+
+    def __call__(self, event):
+        return bool(self._predicate(event))
+
+    def __and__(self, other):
+        return Filter(lambda event: self(event) and other(event),
+                self.fields | other.fields)
+
+    def __or__(self, other):
+        return Filter(lambda event: self(event) or other(event),
+                self.fields | other.fields)
+
+    def __invert__(self):
+        return Filter(lambda event: not self(event), self.fields)
+
+
+def where(predicate, *names):
+    """Wrap a callable taking an event as Filter reading the given fields."""
+    return Filter(predicate, [_selector(name) for name in names])
+
+
+def equals(name, value):
+    """Events whose field equals the value."""
+    return where(lambda event: get(event, name) == value, name)
+
+
+def one_of(name, values):
+    """Events whose field equals any of the values."""
+    values = frozenset(values)
+    return where(lambda event: get(event, name) in values, name)
+
+
+def exists(name):
+    """Events having a non-empty field."""
+    return where(lambda event: bool(get(event, name)), name)
+
+
+def contains(name, text, ignore_case=True):
+    """Events whose field contains the text, by default ignoring case."""
+    if ignore_case:
+        text = text.lower()
+        return where(lambda event: text in (get(event, name) or "").lower(),
+                name)
+    return where(lambda event: text in (get(event, name) or ""), name)
+
+
+def matches(name, pattern, flags=0):
+    """Events whose field matches the regular expression anywhere."""
+    regex = re.compile(pattern, flags)
+    return where(lambda event: regex.search(get(event, name) or "")
+            is not None, name)
+
+
+def private_property(key, value):
+    """Events with the private extended property set to value."""
+    return where(lambda event: get(event, "extendedProperties.private",
+        {}).get(key) == value, "extendedProperties.private")
+
+
+def starts_before(timestamp):
+    """Events starting before the RFC3339 timestamp."""
+    timestamp = utc_timestamp(timestamp)
+    return where(lambda event: utc_timestamp(event["start"]) < timestamp,
+            "start")
+
+
+def ends_after(timestamp):
+    """Events ending after the RFC3339 timestamp."""
+    timestamp = utc_timestamp(timestamp)
+    return where(lambda event: utc_timestamp(event["end"]) > timestamp, "end")
+
+
+def get(event, name, default=None):
+    """Return the field of the event given by a dotted name, or default."""
+    value = event
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+
+def _selector(name):
+    return name.replace(".", "/")
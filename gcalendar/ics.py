@@ -0,0 +1,634 @@
+#!/usr/bin/env python
+
+"""Streaming conversion between iCalendar (RFC 5545) data and Calendar API
+events.
+
+Both directions are generator pipelines handling one VEVENT at a time, so
+files of any size are processed in bounded memory:
+
+    with open('archive.ics', newline='') as f:
+        result = ics.import_lines(service, f, calendarId='primary')
+
+    with open('export.ics', 'w', newline='') as f:
+        f.writelines(ics.export_lines(service, start='01/01/2017',
+            end='31/12/2017'))
+
+Imports use the events.import method in batch requests, which identifies
+events by their iCalendar UID: importing a file again updates the events
+instead of duplicating them.
+"""
+
+import hashlib
+import logging
+import datetime
+import itertools
+from collections import namedtuple
+
+from . import methods
+from .utils import utc_timestamp, TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Lines longer than this many octets are folded
+MAX_LINE_OCTETS = 75
+PRODUCT_ID = "-//gcalendar//gcalendar//EN"
+# Properties copied to the recurrence field of events
+RECURRENCE_PROPERTIES = ("RRULE", "RDATE", "EXDATE", "EXRULE")
+# Properties of VTIMEZONE components needed to convert times
+VTIMEZONE_PROPERTIES = ("BEGIN", "END", "TZID", "DTSTART", "RRULE", "RDATE",
+        "TZOFFSETFROM", "TZOFFSETTO")
+
+IcsImportResult = namedtuple("IcsImportResult", ["imported", "failed"])
+
+
+def read_events(lines):
+    """
+    Generator function yielding an event body for every VEVENT of iCalendar
+    data. Components nested in events, e.g. VALARM, are skipped.
+
+    Times with TZID keep their time zone if it is an IANA name, e.g.
+    'Europe/Berlin'. Other TZIDs, e.g. 'W. Europe Standard Time' of Outlook,
+    are converted to UTC by the VTIMEZONE components of the data. UTC and
+    floating times are given in UTC. Recurring events without time zone are
+    expanded in UTC. Events without UID get one derived from their contents.
+
+    :param lines: lines of the file
+    :type lines: iterable[str]
+
+    :yields dict
+    """
+
+    event = None
+    nested = 0
+    # tzinfo by TZID, from VTIMEZONE components
+    time_zones = {}
+    vtimezone = None
+    for name, params, value in unfold(lines):
+        if vtimezone is not None:
+            vtimezone.append((name, value))
+            if name == "END" and value == "VTIMEZONE":
+                time_zones.update(_parse_vtimezone(vtimezone))
+                vtimezone = None
+        elif name == "BEGIN" and value == "VTIMEZONE" and event is None:
+            vtimezone = [(name, value)]
+        elif name == "BEGIN" and value == "VEVENT":
+            event, nested = {}, 0
+        elif event is None:
+            continue
+        elif name == "BEGIN":
+            nested += 1
+        elif name == "END" and value != "VEVENT":
+            nested -= 1
+        elif nested:
+            continue
+        elif name == "END":
+            if "start" in event:
+                yield _complete(event)
+            event = None
+        elif name in ("SUMMARY", "LOCATION", "DESCRIPTION"):
+            event[name.lower()] = unescape(value)
+        elif name == "UID":
+            event["iCalUID"] = value
+        elif name in ("DTSTART", "DTEND", "RECURRENCE-ID"):
+            field = {"DTSTART": "start", "DTEND": "end",
+                    "RECURRENCE-ID": "originalStartTime"}[name]
+            event[field] = _time_field(value, params, time_zones)
+        elif name in RECURRENCE_PROPERTIES:
+            event.setdefault("recurrence", []).append(
+                    _recurrence_line(name, params, value, time_zones))
+        elif name == "STATUS" and value.upper() in ("CANCELLED", "TENTATIVE"):
+            event["status"] = value.lower()
+        elif name == "TRANSP" and value.upper() == "TRANSPARENT":
+            event["transparency"] = "transparent"
+        elif name == "ATTENDEE" and value.lower().startswith("mailto:"):
+            event.setdefault("attendees", []).append({"email": value[7:]})
+
+
+def write_events(events):
+    """
+    Generator function yielding the lines of an iCalendar file holding the
+    events, terminated by CRLF and folded. Cancelled instances of recurring
+    events, i.e. deleted occurrences, are written with STATUS:CANCELLED;
+    other cancelled events are skipped.
+
+    :param events: events as returned from the API
+    :type events: iterable[dict]
+
+    :yields str
+    """
+
+    for line in ("BEGIN:VCALENDAR", "VERSION:2.0",
+            "PRODID:{}".format(PRODUCT_ID), "CALSCALE:GREGORIAN"):
+        yield line + "\r\n"
+
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    time_zones = set()
+    # UIDs of the written recurring events by event ID
+    uids = {}
+    # cancelled instances by the ID of their recurring event not written yet
+    pending = {}
+    for event in events:
+        if _cancelled_instance(event):
+            uid = event.get("iCalUID") or uids.get(event["recurringEventId"])
+            if uid is None:
+                pending.setdefault(event["recurringEventId"], []).append(event)
+                continue
+            event = dict(event, iCalUID=uid)
+        elif event.get("status") == "cancelled" or "start" not in event:
+            continue
+
+        for line in _component_lines(event, stamp, time_zones):
+            yield line
+        if "recurrence" in event and "id" in event:
+            uid = event.get("iCalUID") or "{}@google.com".format(event["id"])
+            uids[event["id"]] = uid
+            for instance in pending.pop(event["id"], []):
+                for line in _component_lines(dict(instance, iCalUID=uid),
+                        stamp, time_zones):
+                    yield line
+
+    # the recurring events were not listed, assume UIDs assigned by Google
+    for series_id, instances in pending.items():
+        for instance in instances:
+            for line in _component_lines(dict(instance, iCalUID="{}@google.com"
+                    .format(series_id)), stamp, time_zones):
+                yield line
+
+    yield "END:VCALENDAR\r\n"
+
+
+def _cancelled_instance(event):
+    return event.get("status") == "cancelled" and \
+        "recurringEventId" in event and "originalStartTime" in event
+
+
+def _component_lines(event, stamp, time_zones):
+    """Yield the folded lines of the VEVENT of the event, preceded by the
+    VTIMEZONE components of TZIDs not in the set time_zones yet."""
+    for time_zone, year in _time_zones(event):
+        if time_zone not in time_zones:
+            time_zones.add(time_zone)
+            for line in _vtimezone(time_zone, year):
+                yield fold(line)
+    for line in _vevent(event, stamp):
+        yield fold(line)
+
+
+def import_lines(service, lines, calendarId='primary',
+        batch_size=methods.BATCH_SIZE):
+    """
+    Import the events of iCalendar data in batch requests of batch_size
+    events. The data is read while importing.
+
+    Modified and cancelled instances of recurring events (VEVENTs with
+    RECURRENCE-ID) are kept until the end of the data and then applied to
+    the instances of their imported recurring events.
+
+    :param lines: lines of the file
+    :type lines: iterable[str]
+
+    :param calendarId: ID of the calendar to import to. Default: 'primary'
+    :type calendarId: str
+
+    :raises Errors of the batch requests themselves are propagated from the
+        apiclient module.
+
+    :returns number of imported events and instances, and (iCalUID,
+        exception) tuples of failed imports
+    :type IcsImportResult
+    """
+
+    imported, failed = 0, []
+    # IDs of the imported recurring events by iCalUID
+    series_ids = {}
+    overrides = []
+    events = _without_overrides(read_events(lines), overrides)
+    while True:
+        chunk = list(itertools.islice(events, batch_size))
+        if not chunk:
+            break
+        requests = [service.events().import_(calendarId=calendarId, body=event)
+                for event in chunk]
+        for event, (response, exception) in zip(chunk,
+                methods.execute_batch(service, requests)):
+            if exception is None:
+                imported += 1
+                if "recurrence" in event:
+                    series_ids[event["iCalUID"]] = response["id"]
+            else:
+                failed.append((event["iCalUID"], exception))
+
+    for start in range(0, len(overrides), batch_size):
+        applied, chunk_failed = _apply_overrides(service, calendarId,
+                overrides[start:start + batch_size], series_ids)
+        imported += applied
+        failed.extend(chunk_failed)
+
+    return IcsImportResult(imported, failed)
+
+
+def _without_overrides(events, overrides):
+    """Yield the events, except for instances of recurring events, which are
+    appended to the list overrides instead."""
+    for event in events:
+        if "originalStartTime" in event:
+            overrides.append(event)
+        else:
+            yield event
+
+
+def _apply_overrides(service, calendarId, overrides, series_ids):
+    """
+    Patch or delete the instances of imported recurring events that the
+    overrides modify or cancel.
+
+    :param series_ids: IDs of the imported recurring events by iCalUID
+    :type series_ids: dict
+
+    :returns number of applied overrides, and (iCalUID, exception) tuples of
+        failed ones
+    :type tuple(int, list)
+    """
+
+    failed = []
+    known = []
+    for override in overrides:
+        if override["iCalUID"] in series_ids:
+            known.append(override)
+        else:
+            failed.append((override["iCalUID"], LookupError("Recurring event "
+                "{} was not imported".format(override["iCalUID"]))))
+
+    requests = [service.events().instances(calendarId=calendarId,
+        eventId=series_ids[override["iCalUID"]], showDeleted=True,
+        originalStart=_original_start(override)) for override in known]
+    writes, applied = [], 0
+    for override, (response, exception) in zip(known,
+            methods.execute_batch(service, requests)):
+        items = [] if exception is not None else response.get("items", [])
+        if not items:
+            failed.append((override["iCalUID"], exception or LookupError(
+                "No instance of {} starts at {}".format(override["iCalUID"],
+                    _original_start(override)))))
+        elif override.get("status") == "cancelled":
+            if items[0].get("status") == "cancelled":
+                applied += 1
+            else:
+                writes.append((override, service.events().delete(
+                    calendarId=calendarId, eventId=items[0]["id"])))
+        else:
+            changes = dict((field, value) for field, value in override.items()
+                    if field not in ("iCalUID", "originalStartTime"))
+            writes.append((override, service.events().patch(
+                calendarId=calendarId, eventId=items[0]["id"], body=changes)))
+
+    for (override, _), (_, exception) in zip(writes, methods.execute_batch(
+            service, [request for _, request in writes])):
+        if exception is None:
+            applied += 1
+        else:
+            failed.append((override["iCalUID"], exception))
+    return applied, failed
+
+
+def _original_start(event):
+    time = event["originalStartTime"]
+    return time.get("dateTime", time.get("date"))
+
+
+def export_lines(service, calendarId='primary', start=None, end=None,
+        max_results=250):
+    """
+    Generator function yielding the lines of an iCalendar file holding the
+    events of the calendar between start and end date. Recurring events are
+    exported once, with their recurrence rules, followed by their modified
+    and cancelled instances. Result pages are requested while writing.
+
+    :param start: start date in format dd/mm/yyyy
+    :type start: str
+
+    :param end: end date in format dd/mm/yyyy, included. Default: start date
+    :type end: str
+
+    :yields str
+    """
+
+    time_min, time_max = methods.time_range(start, end)
+    return write_events(methods.list_events(service, calendarId=calendarId,
+        timeMin=time_min, timeMax=time_max, singleEvents=False,
+        maxResults=max_results))
+
+
+def unfold(lines):
+    """Generator function yielding (name, params, value) of every content
+    line of iCalendar data, joining folded lines."""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield split_content_line(current)
+        current = line
+    if current:
+        yield split_content_line(current)
+
+
+def split_content_line(line):
+    name_and_params, _, value = line.partition(":")
+    parts = name_and_params.split(";")
+    params = dict(param.partition("=")[::2] for param in parts[1:])
+    return parts[0].upper(), params, value
+
+
+def fold(line):
+    """Fold a content line into parts of at most MAX_LINE_OCTETS octets,
+    without splitting characters, and terminate it by CRLF."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+
+    parts = []
+    start, limit = 0, MAX_LINE_OCTETS
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # do not split UTF-8 continuation bytes
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode("utf-8"))
+        start, limit = end, MAX_LINE_OCTETS - 1
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def escape(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def unescape(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+            .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def parse_datetime(value, params, time_zones=None):
+    """Parse DATE or DATE-TIME values to naive UTC datetimes.
+
+    :param time_zones: tzinfo by TZID of the VTIMEZONE components of the
+        data, for TZIDs that are no IANA names
+    :type time_zones: dict
+    """
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value, "%Y%m%d")
+
+    date_time = datetime.datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if "TZID" in params and not value.endswith("Z"):
+        zone, _ = _time_zone(params["TZID"].strip('"'), time_zones)
+        date_time = date_time.replace(tzinfo=zone)
+        date_time = date_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date_time
+
+
+def _time_zone(tzid, time_zones=None):
+    """
+    Look up the time zone of a TZID: the IANA time zone of that name, or else
+    the one defined by a VTIMEZONE component. Unknown TZIDs are taken as UTC,
+    with a warning.
+
+    :returns tzinfo and whether it is an IANA time zone
+    :type tuple(datetime.tzinfo, bool)
+    """
+
+    from zoneinfo import ZoneInfo
+    try:
+        return ZoneInfo(tzid), True
+    except (KeyError, ValueError):
+        # ZoneInfoNotFoundError is a KeyError
+        pass
+
+    if time_zones is None:
+        time_zones = {}
+    if tzid not in time_zones:
+        logger.warning("Unknown time zone '{}', taking its times as UTC"
+                .format(tzid))
+        time_zones[tzid] = datetime.timezone.utc
+    return time_zones[tzid], False
+
+
+def _parse_vtimezone(properties):
+    """Return tzinfo by TZID of the VTIMEZONE component given by its
+    (name, value) properties, nothing if it can not be parsed."""
+    import io
+    from dateutil import tz
+
+    # the parser rejects other properties, e.g. X-LIC-LOCATION, and params
+    lines = ["{}:{}".format(name, value) for name, value in properties
+            if name in VTIMEZONE_PROPERTIES]
+    try:
+        definitions = tz.tzical(io.StringIO("\r\n".join(lines)))
+        return dict((tzid, definitions.get(tzid)) for tzid in
+                definitions.keys())
+    except ValueError as e:
+        logger.warning("Skipping invalid VTIMEZONE: {}".format(e))
+        return {}
+
+
+def _time_field(value, params, time_zones=None):
+    """Convert a DTSTART or DTEND value to the start or end field of an
+    event."""
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return {"date": datetime.datetime.strptime(value, "%Y%m%d")
+                .strftime("%Y-%m-%d")}
+
+    if "TZID" in params and not value.endswith("Z"):
+        time_zone = params["TZID"].strip('"')
+        zone, known = _time_zone(time_zone, time_zones)
+        if known:
+            date_time = datetime.datetime.strptime(value, "%Y%m%dT%H%M%S")
+            date_time = date_time.replace(tzinfo=zone)
+            return {"dateTime": date_time.isoformat(), "timeZone": time_zone}
+
+    return {"dateTime": "{}Z".format(parse_datetime(value, params,
+        time_zones).isoformat())}
+
+
+def _recurrence_line(name, params, value, time_zones):
+    """Return the content line of a recurrence property. Dates of RDATE and
+    EXDATE in time zones that are no IANA names are converted to UTC, which
+    the API understands."""
+    tzid = params.get("TZID", "").strip('"')
+    if name in ("RDATE", "EXDATE") and tzid and not _time_zone(tzid,
+            time_zones)[1]:
+        params = dict((key, param) for key, param in params.items()
+                if key != "TZID")
+        value = ",".join(parse_datetime(part, {"TZID": tzid}, time_zones)
+                .strftime("%Y%m%dT%H%M%SZ") for part in value.split(","))
+    return _content_line(name, params, value)
+
+
+def _complete(event):
+    if "recurrence" in event and "dateTime" in event["start"] and \
+            "timeZone" not in event["start"]:
+        # the API requires the time zone of recurring events
+        for field in ("start", "end"):
+            if field in event:
+                event[field] = dict(event[field], timeZone="UTC")
+    if "end" not in event:
+        if "date" in event["start"]:
+            start = datetime.datetime.strptime(event["start"]["date"], "%Y-%m-%d")
+            event["end"] = {"date": (start + datetime.timedelta(days=1))
+                    .strftime("%Y-%m-%d")}
+        else:
+            event["end"] = dict(event["start"])
+    if "iCalUID" not in event:
+        digest = hashlib.sha1("{}|{}".format(event.get("summary", ""),
+            utc_timestamp(event["start"])).encode("utf-8")).hexdigest()
+        event["iCalUID"] = "{}@gcalendar".format(digest)
+    return event
+
+
+def _content_line(name, params, value):
+    return ";".join([name] + ["{}={}".format(key, param) for key, param in
+        params.items()]) + ":" + value
+
+
+def _recurring(event):
+    """Whether the event is a recurring series or an instance of one."""
+    return bool(event.get("recurrence") or event.get("recurringEventId"))
+
+
+def _time_zones(event):
+    """Return (time zone, year) of the times of the event written with TZID,
+    see _format_time()."""
+    if not _recurring(event):
+        return []
+    times = [event[field] for field in ("originalStartTime", "start", "end")
+            if field in event]
+    return [(time["timeZone"], int(time["dateTime"][:4])) for time in times
+            if "timeZone" in time and "dateTime" in time]
+
+
+def _vevent(event, stamp):
+    recurring = _recurring(event)
+    yield "BEGIN:VEVENT"
+    yield "UID:{}".format(event.get("iCalUID") or "{}@google.com".format(
+        event["id"]))
+    yield "DTSTAMP:{}".format(stamp)
+    if "originalStartTime" in event:
+        yield _format_time("RECURRENCE-ID", event["originalStartTime"],
+                recurring)
+    # cancelled instances are given by their original start only
+    yield _format_time("DTSTART", event.get("start",
+        event.get("originalStartTime")), recurring)
+    if "end" in event:
+        yield _format_time("DTEND", event["end"], recurring)
+    for field in ("summary", "location", "description"):
+        if event.get(field):
+            yield "{}:{}".format(field.upper(), escape(event[field]))
+    for line in event.get("recurrence", []):
+        yield line
+    if event.get("status") in ("tentative", "cancelled"):
+        yield "STATUS:{}".format(event["status"].upper())
+    if event.get("transparency") == "transparent":
+        yield "TRANSP:TRANSPARENT"
+    for attendee in event.get("attendees", []):
+        yield "ATTENDEE:mailto:{}".format(attendee["email"])
+    yield "END:VEVENT"
+
+
+def _format_time(name, time, keep_time_zone=False):
+    if "date" in time:
+        return "{};VALUE=DATE:{}".format(name, time["date"].replace("-", ""))
+
+    if keep_time_zone and "timeZone" in time:
+        # keep the wall time for recurrence rules across DST changes
+        from zoneinfo import ZoneInfo
+        date_time = datetime.datetime.fromisoformat(
+                time["dateTime"].replace("Z", "+00:00"))
+        local = date_time.astimezone(ZoneInfo(time["timeZone"]))
+        return "{};TZID={}:{}".format(name, time["timeZone"],
+                local.strftime("%Y%m%dT%H%M%S"))
+
+    timestamp = utc_timestamp(time)
+    return "{}:{}".format(name, datetime.datetime.strptime(timestamp,
+        TIMESTAMP_FORMAT).strftime("%Y%m%dT%H%M%SZ"))
+
+
+def _vtimezone(time_zone, year):
+    """
+    Generator function yielding the lines of a VTIMEZONE component of the
+    time zone. The observances are given as yearly rules, taken from the
+    UTC offset transitions of the year.
+
+    :param time_zone: IANA name, e.g. 'Europe/Berlin'
+    :type time_zone: str
+
+    :type year: int
+
+    :yields str
+    """
+
+    from zoneinfo import ZoneInfo
+    zone = ZoneInfo(time_zone)
+    yield "BEGIN:VTIMEZONE"
+    yield "TZID:{}".format(time_zone)
+
+    transitions = _transitions(zone, year)
+    if not transitions:
+        offset = datetime.datetime(year, 1, 1, tzinfo=zone).utcoffset()
+        yield "BEGIN:STANDARD"
+        yield "DTSTART:19700101T000000"
+        yield "TZOFFSETFROM:{}".format(_format_offset(offset))
+        yield "TZOFFSETTO:{}".format(_format_offset(offset))
+        yield "END:STANDARD"
+
+    for moment, offset_from, offset_to, is_dst in transitions:
+        # local time at the transition, before the offset changes
+        local = (moment + offset_from).replace(tzinfo=None)
+        week = (local.day - 1) // 7 + 1
+        if (local + datetime.timedelta(days=7)).month != local.month:
+            week = -1
+        observance = "DAYLIGHT" if is_dst else "STANDARD"
+        yield "BEGIN:{}".format(observance)
+        yield "DTSTART:{}".format(local.strftime("%Y%m%dT%H%M%S"))
+        yield "TZOFFSETFROM:{}".format(_format_offset(offset_from))
+        yield "TZOFFSETTO:{}".format(_format_offset(offset_to))
+        yield "RRULE:FREQ=YEARLY;BYMONTH={};BYDAY={}{}".format(local.month,
+                week, ("MO", "TU", "WE", "TH", "FR", "SA", "SU")[local.weekday()])
+        yield "END:{}".format(observance)
+
+    yield "END:VTIMEZONE"
+
+
+def _transitions(zone, year):
+    """Return (UTC datetime, offset before, offset after, is DST) of every
+    change of the UTC offset of the zone within the year."""
+    utc = datetime.timezone.utc
+    day = datetime.timedelta(days=1)
+    moment = datetime.datetime(year, 1, 1, tzinfo=utc)
+    transitions = []
+    while moment.year == year:
+        offset = moment.astimezone(zone).utcoffset()
+        if (moment + day).astimezone(zone).utcoffset() != offset:
+            # bisect the day down to the second of the change
+            low, high = moment, moment + day
+            while high - low > datetime.timedelta(seconds=1):
+                middle = low + (high - low) / 2
+                if middle.astimezone(zone).utcoffset() == offset:
+                    low = middle
+                else:
+                    high = middle
+            after = high.astimezone(zone)
+            transitions.append((high.replace(microsecond=0), offset,
+                after.utcoffset(), bool(after.dst())))
+        moment += day
+    return transitions
+
+
+def _format_offset(offset):
+    seconds = int(offset.total_seconds())
+    sign = "-" if seconds < 0 else "+"
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return "{}{:02d}{:02d}{}".format(sign, hours, minutes,
+            "{:02d}".format(seconds) if seconds else "")
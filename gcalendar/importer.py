@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""Idempotent import of events from TXT, CSV and ICS files.
+
+Every imported event gets an ID derived from its calendar and a key of the
+record (by default summary and start), so re-running an import finds the
+events created before. The import fetches the covered date range once and
+only sends the inserts, patches and deletes that are needed, in batches.
+"""
+
+import os
+import csv
+import hashlib
+import logging
+import datetime
+from collections import namedtuple
+
+from . import methods
+from .ics import read_events
+from .utils import utc_timestamp, TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Characters allowed in event IDs (base32hex encoding as of RFC 2938)
+EVENT_ID_ALPHABET = "0123456789abcdefghijklmnopqrstuv"
+
+# Name of the private extended property marking imported events
+IMPORT_PROPERTY = "gcalendarImport"
+
+ImportResult = namedtuple("ImportResult",
+        ["inserted", "updated", "deleted", "unchanged", "failed"])
+
+
+def read_txt(lines, summary, day_start=9):
+    """
+    Generator function yielding a record for every line of the format
+    'dd/mm/yyyy hours', e.g. working hours. Lines starting with '#' are
+    skipped, as are lines that can not be parsed.
+
+    :param lines: lines of the file
+    :type lines: iterable[str]
+
+    :param summary: summary of all events
+    :type summary: str
+
+    :param day_start: hour at which the events start
+    :type day_start: float
+
+    :yields dict of create_event() kwargs
+    """
+
+    for line in lines:
+        if line.startswith("#") or not line.strip():
+            continue
+
+        try:
+            date, hours = line.split()
+            start = datetime.datetime.strptime(date, "%d/%m/%Y") + \
+                datetime.timedelta(hours=day_start)
+            end = start + datetime.timedelta(hours=float(hours))
+        except ValueError as e:
+            logger.warning("Skipping line '{}': {}".format(line.strip(), e))
+            continue
+
+        yield dict(summary=summary, start=_format(start), end=_format(end))
+
+
+def read_csv(lines):
+    """
+    Generator function yielding a record for every row of CSV data. The
+    header row names the columns, out of summary, start, end, location,
+    description and attendees. Start and end are given as
+    dd/mm/yyyy hh:mm:ss, attendees' emails are separated by semicolons.
+
+    :param lines: lines of the file
+    :type lines: iterable[str]
+
+    :yields dict of create_event() kwargs
+    """
+
+    for row in csv.DictReader(lines):
+        record = dict((column, row[column].strip()) for column in
+                ["summary", "start", "end", "location", "description"]
+                if row.get(column))
+        if row.get("attendees"):
+            record["attendees"] = [mail.strip() for mail in
+                    row["attendees"].split(";") if mail.strip()]
+        yield record
+
+
+def read_ics(lines):
+    """
+    Generator function yielding a record for every VEVENT of iCalendar data.
+    SUMMARY, LOCATION, DESCRIPTION, DTSTART and DTEND are read. Times are
+    converted to UTC, floating times are taken as UTC. All-day events keep
+    their dates; without DTEND, they last one day.
+
+    :param lines: lines of the file
+    :type lines: iterable[str]
+
+    :yields dict of create_event() kwargs
+    """
+
+    for event in read_events(lines):
+        record = dict((field, event[field]) for field in
+                ["summary", "location", "description"] if field in event)
+        for field in ("start", "end"):
+            time = event[field]
+            if "date" in time:
+                record[field] = {"date": time["date"]}
+            else:
+                record[field] = _format(datetime.datetime.strptime(
+                    utc_timestamp(time), TIMESTAMP_FORMAT))
+        yield record
+
+
+def read_file(path, **kwargs):
+    """
+    Generator function yielding the records of a TXT, CSV or ICS file,
+    depending on its extension. The file is read line by line.
+
+    :param kwargs: passed to read_txt(), e.g. summary
+
+    :yields dict of create_event() kwargs
+    """
+
+    readers = {".txt": read_txt, ".csv": read_csv, ".ics": read_ics}
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in readers:
+        raise ValueError("Unsupported file type: {}".format(path))
+
+    with open(path, newline="") as f:
+        for record in readers[extension](f, **kwargs):
+            yield record
+
+
+def default_key(record):
+    """Identify a record by its summary and start."""
+    start = record["start"]
+    if isinstance(start, dict):
+        start = start.get("dateTime", start.get("date"))
+    return "{}|{}".format(record.get("summary", ""), start)
+
+
+def derive_event_id(calendarId, key):
+    """
+    Derive a deterministic event ID from the calendar ID and a record key.
+
+    :returns 32 characters of a-v and 0-9
+    :type str
+    """
+
+    digest = hashlib.sha1("{}\0{}".format(calendarId, key).encode("utf-8"))
+    number = int(digest.hexdigest(), 16)
+    characters = []
+    for _ in range(32):
+        number, remainder = divmod(number, 32)
+        characters.append(EVENT_ID_ALPHABET[remainder])
+    return "".join(characters)
+
+
+def import_events(service, records, calendarId='primary', key=default_key,
+        delete_missing=False, tag="gcalendar"):
+    """
+    Create or update the events described by the records. Events that already
+    exist unchanged are skipped.
+
+    :param records: create_event() kwargs of every event, e.g. as yielded by
+        read_file(). Reminders are disabled unless enable_reminders is given.
+    :type records: iterable[dict]
+
+    :param calendarId: ID of the calendar to import to. Default: 'primary'
+    :type calendarId: str
+
+    :param key: callable returning a string that identifies a record. It is
+        used to derive the event ID. Default: summary and start
+    :type key: callable
+
+    :param delete_missing: If true, delete events within the imported date
+        range that were imported with the same tag but are not part of the
+        records anymore.
+    :type delete_missing: bool
+
+    :param tag: value of the private extended property marking the imported
+        events
+    :type tag: str
+
+    :raises AttributeError: if any record lacks start or end
+    :raises Errors of the list request are propagated from the apiclient
+        module.
+
+    :returns numbers of successfully inserted, updated and deleted events,
+        of unchanged events, and (event_id, exception) tuples of failed
+        requests
+    :type ImportResult
+    """
+
+    bodies = {}
+    for record in records:
+        record = dict(record)
+        record.setdefault("enable_reminders", False)
+        record.setdefault("extendedProperties", {"private": {IMPORT_PROPERTY: tag}})
+        event_id = derive_event_id(calendarId, key(record))
+        bodies[event_id] = methods.event_body(event_id=event_id, **record)
+
+    if not bodies:
+        return ImportResult(0, 0, 0, 0, [])
+
+    start = min(utc_timestamp(body["start"]) for body in bodies.values())
+    end = max(utc_timestamp(body["end"]) for body in bodies.values())
+    fields = set(["id"]).union(*bodies.values())
+    existing_events = dict((event["id"], event) for event in methods.iter_events(
+        service, calendarId=calendarId, start=_date(start), end=_date(end),
+        max_results=2500, fields=",".join(sorted(fields))))
+
+    inserts, patches, unchanged = [], {}, 0
+    for event_id, body in bodies.items():
+        if event_id not in existing_events:
+            inserts.append(body)
+            continue
+        changes = _changes(existing_events[event_id], body)
+        if changes:
+            patches[event_id] = changes
+        else:
+            unchanged += 1
+
+    obsolete_ids = []
+    if delete_missing:
+        obsolete_ids = [event_id for event_id, event in existing_events.items()
+                if event_id not in bodies and _tag(event) == tag]
+
+    logger.info("Import: {} inserts, {} patches, {} deletes, {} unchanged".format(
+        len(inserts), len(patches), len(obsolete_ids), unchanged))
+
+    failed = []
+    restores = []
+    inserted = 0
+    requests = [service.events().insert(calendarId=calendarId, body=body)
+            for body in inserts]
+    for body, (_, exception) in zip(inserts, methods.execute_batch(service, requests)):
+        # the ID is taken by an event deleted before, restore that one
+        if exception is not None and exception.resp.status == 409:
+            restores.append(dict(body, status="confirmed"))
+        elif exception is not None:
+            failed.append((body["id"], exception))
+        else:
+            inserted += 1
+
+    for body, result in zip(restores, methods.update_events(service, restores,
+            calendarId=calendarId)):
+        if result.exception is not None:
+            failed.append((body["id"], result.exception))
+        else:
+            inserted += 1
+
+    updated = 0
+    requests = [service.events().patch(calendarId=calendarId, eventId=event_id,
+        body=changes) for event_id, changes in patches.items()]
+    for event_id, (_, exception) in zip(patches, methods.execute_batch(service, requests)):
+        if exception is not None:
+            failed.append((event_id, exception))
+        else:
+            updated += 1
+
+    deleted = 0
+    results = methods.delete_events(service, obsolete_ids, calendarId=calendarId)
+    for event_id, result in zip(obsolete_ids, results):
+        if result.exception is not None:
+            failed.append((event_id, result.exception))
+        else:
+            deleted += 1
+
+    return ImportResult(inserted, updated, deleted, unchanged, failed)
+
+
+def _changes(event, body):
+    """Return the fields of the body that differ from the existing event."""
+    changes = {}
+    for field, value in body.items():
+        current = event.get(field)
+        if not current and not value:
+            # the API omits empty fields, e.g. a location of ''
+            changed = False
+        elif field in ("start", "end"):
+            changed = current is None or utc_timestamp(current) != utc_timestamp(value)
+        elif field == "attendees":
+            changed = sorted(a["email"] for a in current or []) != \
+                sorted(a["email"] for a in value)
+        else:
+            changed = current != value
+        if changed:
+            changes[field] = value
+    return changes
+
+
+def _tag(event):
+    return event.get("extendedProperties", {}).get("private", {}).get(
+            IMPORT_PROPERTY)
+
+
+def _date(timestamp):
+    """Convert a timestamp as returned from utc_timestamp() to dd/mm/yyyy."""
+    return datetime.datetime.strptime(timestamp[:10], "%Y-%m-%d").strftime(
+            "%d/%m/%Y")
+
+
+def _format(date_time):
+    return date_time.strftime("%d/%m/%Y %H:%M:%S")
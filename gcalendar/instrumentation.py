@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""Hooks reporting every API call executed by the scheduler.
+
+A hook is a callable receiving a CallRecord after each call, e.g.
+
+    metrics = instrumentation.Metrics()
+    instrumentation.add_hook(metrics)
+    ...
+    print(metrics.summary())
+
+Calls of batch requests are reported individually with the latency of their
+batch; the batch request itself is reported as method 'batch'. Without hooks,
+calls are not measured at all.
+"""
+
+import threading
+from collections import namedtuple
+from urllib.parse import urlparse, unquote
+
+CallRecord = namedtuple("CallRecord", ["method", "calendarId", "latency",
+    "bytes", "retries", "pages", "error"])
+CallRecord.__doc__ = """Measurements of an API call.
+
+method: API method, e.g. 'calendar.events.list', or 'batch'
+calendarId: calendar addressed by the call, or None
+latency: seconds from sending the first attempt until the final response,
+    including retries
+bytes: size of the response body, or None if unknown (batch calls)
+retries: number of retries
+pages: number of result pages received (1 for list calls, else 0)
+error: exception the call failed with, or None
+"""
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """Register a callable receiving a CallRecord after every API call."""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        _hooks.remove(hook)
+
+
+def enabled():
+    """Return whether any hook is registered."""
+    return bool(_hooks)
+
+
+def emit(record):
+    """Pass the record to all hooks."""
+    for hook in list(_hooks):
+        hook(record)
+
+
+def calendar_id(uri):
+    """Return the calendar ID addressed by a request URI, or None."""
+    parts = urlparse(uri).path.split("/")
+    if "calendars" in parts:
+        index = parts.index("calendars") + 1
+        if index < len(parts):
+            return unquote(parts[index])
+    return None
+
+
+class Metrics(object):
+    """
+    Hook aggregating the calls per API method. The aggregates are available
+    as dict (snapshot()), human-readable table (summary()) or in the
+    OpenMetrics text format (openmetrics()), e.g. for the textfile collector
+    of the Prometheus node exporter.
+    """
+
+    FIELDS = ("calls", "errors", "retries", "pages", "bytes", "latency",
+            "max_latency")
+
+    def __init__(self):
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            method = self._methods.setdefault(record.method,
+                    dict.fromkeys(self.FIELDS, 0))
+            method["calls"] += 1
+            method["errors"] += record.error is not None
+            method["retries"] += record.retries
+            method["pages"] += record.pages
+            method["bytes"] += record.bytes or 0
+            method["latency"] += record.latency
+            method["max_latency"] = max(method["max_latency"], record.latency)
+
+    def snapshot(self):
+        """Return the aggregates by method, e.g. {'calendar.events.list':
+        {'calls': 2, 'errors': 0, 'retries': 1, 'pages': 2, 'bytes': 5120,
+        'latency': 0.8, 'max_latency': 0.5}}. Latencies are in seconds.
+
+        :rtype dict
+        """
+        with self._lock:
+            return dict((method, dict(values))
+                    for method, values in self._methods.items())
+
+    def summary(self):
+        """Return a table of the aggregates.
+
+        :rtype str
+        """
+        lines = ["{:<26}{:>7}{:>7}{:>8}{:>7}{:>10}{:>10}{:>10}".format("method",
+            "calls", "errors", "retries", "pages", "bytes", "avg ms", "max ms")]
+        for method, values in sorted(self.snapshot().items()):
+            lines.append("{:<26}{:>7}{:>7}{:>8}{:>7}{:>10}{:>10.1f}{:>10.1f}"
+                    .format(method, values["calls"], values["errors"],
+                        values["retries"], values["pages"], values["bytes"],
+                        values["latency"] / values["calls"] * 1000,
+                        values["max_latency"] * 1000))
+        return "\n".join(lines)
+
+    def openmetrics(self):
+        """Return the aggregates in the OpenMetrics text format.
+
+        :rtype str
+        """
+        snapshot = sorted(self.snapshot().items())
+        lines = []
+        for name, field, kind, help_text in [
+                ("gcalendar_api_calls", "calls", "counter", "API calls"),
+                ("gcalendar_api_errors", "errors", "counter", "failed API calls"),
+                ("gcalendar_api_retries", "retries", "counter", "retries"),
+                ("gcalendar_api_pages", "pages", "counter",
+                    "result pages received"),
+                ("gcalendar_api_response_bytes", "bytes", "counter",
+                    "bytes of response bodies"),
+                ("gcalendar_api_latency_seconds", "latency", "counter",
+                    "cumulative latency of API calls")]:
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.append("# HELP {} {}".format(name, help_text))
+            for method, values in snapshot:
+                lines.append('{}_total{{method="{}"}} {}'.format(name, method,
+                    values[field]))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+
+"""Deferred writes of events through an on-disk write-ahead journal.
+
+Creating, editing and deleting events through a WriteJournal only records
+the write locally, so it succeeds without network access. The journal is
+drained by flush(), or by a JournalFlusher in the background:
+
+    write_journal = WriteJournal()
+    with JournalFlusher(write_journal, utils.build_service()):
+        event_id = write_journal.create_event(summary="Meeting",
+            start="12/04/2017 08:00:00", end="12/04/2017 09:00:00")
+        write_journal.patch_event(dict(id=event_id), dict(id=event_id,
+            location="Berlin"))
+
+Before sending, the writes of every event are coalesced into a single
+request: consecutive edits are merged, and events created and deleted again
+are never sent. The requests go out in batches (see methods.execute_batch()).
+Writes that fail due to network or server errors stay in the journal and are
+sent again by the next flush.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+
+from . import methods
+from .scheduler import is_retryable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'gcalendar',
+        'journal.sqlite')
+
+# Seconds a JournalFlusher waits after the latest write before flushing, to
+# coalesce edits following each other
+FLUSH_DELAY = 2.0
+# Seconds after which a JournalFlusher retries writes that could not be sent
+RETRY_INTERVAL = 60.0
+
+INSERT = 'insert'
+UPDATE = 'update'
+PATCH = 'patch'
+DELETE = 'delete'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    body TEXT,
+    etag TEXT
+);
+"""
+
+# The body is the event for inserts and updates, and the changed fields for
+# patches. An etag makes the write conditional on the event being unmodified.
+Write = namedtuple("Write", ["operation", "calendarId", "event_id", "body",
+    "etag"])
+
+FlushResult = namedtuple("FlushResult", ["sent", "cancelled", "failed",
+    "pending"])
+
+
+class WriteJournal(object):
+    """
+    Journal of event writes to be sent later, stored in a SQLite database.
+    It is thread-safe.
+
+    :param path: path of the database file, ':memory:' for a non-persistent
+        journal. Default: ~/.cache/gcalendar/journal.sqlite
+    :type path: str
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        if path != ':memory:':
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        # writes being sent must not be sent by another flush
+        self._flush_lock = threading.Lock()
+        # callables invoked after every recorded write, see JournalFlusher
+        self.listeners = []
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        """Number of recorded writes, before coalescing."""
+        with self._lock:
+            return self._connection.execute(
+                    "SELECT COUNT(*) FROM writes").fetchone()[0]
+
+    def create_event(self, calendarId='primary', event_id=None, **kwargs):
+        """
+        Record the creation of an event. See methods.create_event() for the
+        arguments, except for conflicts.
+
+        :returns ID of the event. A random one is assigned if omitted, so
+            that later writes can refer to it.
+        :type str
+        """
+
+        event_id = event_id or uuid.uuid4().hex
+        body = methods.event_body(event_id=event_id, **kwargs)
+        self.record(Write(INSERT, calendarId, event_id, body, None))
+        return event_id
+
+    def update_event(self, event, calendarId='primary'):
+        """Record the replacement of the event with the given complete body,
+        including the 'id'."""
+        self.record(Write(UPDATE, calendarId, event["id"], event, None))
+
+    def patch_event(self, original, modified, calendarId='primary'):
+        """
+        Record the fields that differ between the original and the modified
+        event. See methods.patch_event() for the arguments; the etag of the
+        original is checked when the patch is sent.
+
+        :returns True if any field changed
+        :type bool
+        """
+
+        changes = methods.event_changes(original, modified)
+        if not changes:
+            return False
+        self.record(Write(PATCH, calendarId, original["id"], changes,
+            original.get("etag")))
+        return True
+
+    def delete_event(self, event_id, calendarId='primary'):
+        """Record the deletion of the event."""
+        self.record(Write(DELETE, calendarId, event_id, None, None))
+
+    def record(self, write):
+        """Append the Write to the journal."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                    "INSERT INTO writes (calendar_id, event_id, operation, "
+                    "body, etag) VALUES (?, ?, ?, ?, ?)",
+                    (write.calendarId, write.event_id, write.operation,
+                        None if write.body is None else json.dumps(write.body),
+                        write.etag))
+        logger.debug("Recorded {} of event {}".format(write.operation,
+            write.event_id))
+        for listener in self.listeners:
+            listener()
+
+    def pending(self):
+        """Return the coalesced writes that the next flush would send.
+
+        :returns list[Write]
+        """
+        return [write for write, _ in self._coalesce() if write is not None]
+
+    def flush(self, service):
+        """
+        Send the coalesced writes in batch requests and remove them from the
+        journal. Writes failing with retryable errors (see
+        scheduler.is_retryable()) are kept, other failures are dropped.
+
+        :raises Errors of the batch requests themselves, e.g. if the network
+            is down, are propagated. The journal is left unchanged then.
+
+        :returns numbers of sent and cancelled writes, (Write, exception)
+            tuples of dropped writes and the number of writes kept
+        :type FlushResult
+        """
+
+        with self._flush_lock:
+            return self._flush(service)
+
+    def _flush(self, service):
+        entries = self._coalesce()
+        done = [seq for write, seqs in entries if write is None
+                for seq in seqs]
+        cancelled = len([write for write, _ in entries if write is None])
+        entries = [(write, seqs) for write, seqs in entries
+                if write is not None]
+
+        failed, pending, restores = [], 0, []
+        results = methods.execute_batch(service,
+                [_request(service, write) for write, _ in entries])
+        for (write, seqs), (_, exception) in zip(entries, results):
+            status = getattr(getattr(exception, "resp", None), "status", None)
+            if write.operation == INSERT and status == 409:
+                # the ID is taken by a deleted event, restore that one
+                restores.append((write._replace(operation=UPDATE,
+                    body=dict(write.body, status="confirmed")), seqs))
+                continue
+            if exception is None or (write.operation == DELETE and
+                    status in (404, 410)):
+                done.extend(seqs)
+            elif is_retryable(exception):
+                pending += 1
+            else:
+                logger.warning("Dropping {} of event {}: {}".format(
+                    write.operation, write.event_id, exception))
+                failed.append((write, exception))
+                done.extend(seqs)
+
+        if restores:
+            results = methods.execute_batch(service,
+                    [_request(service, write) for write, _ in restores])
+            for (write, seqs), (_, exception) in zip(restores, results):
+                if exception is not None and is_retryable(exception):
+                    pending += 1
+                    continue
+                if exception is not None:
+                    failed.append((write, exception))
+                done.extend(seqs)
+
+        self._remove(done)
+        sent = len(entries) - len(failed) - pending
+        logger.info("Flushed journal: {} sent, {} cancelled, {} failed, {} "
+                "pending".format(sent, cancelled, len(failed), pending))
+        return FlushResult(sent, cancelled, failed, pending)
+
+    def _coalesce(self):
+        """Return (Write or None, seqs) per event: the writes recorded for
+        the event merged into one, None if they cancel out."""
+        with self._lock:
+            rows = self._connection.execute(
+                    "SELECT seq, calendar_id, event_id, operation, body, etag "
+                    "FROM writes ORDER BY seq").fetchall()
+
+        entries = OrderedDict()
+        for seq, calendarId, event_id, operation, body, etag in rows:
+            write = Write(operation, calendarId, event_id,
+                    None if body is None else json.loads(body), etag)
+            previous, seqs = entries.get((calendarId, event_id), (None, []))
+            entries[(calendarId, event_id)] = (merge(previous, write),
+                    seqs + [seq])
+        return list(entries.values())
+
+    def _remove(self, seqs):
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM writes WHERE seq = ?",
+                    [(seq,) for seq in seqs])
+
+
+def merge(previous, write):
+    """
+    Merge two successive writes of the same event into one.
+
+    :param previous: the earlier write, None if there is none or if earlier
+        writes cancelled out
+    :type previous: Write
+
+    :type write: Write
+
+    :returns the merged Write, or None if the event need not be written,
+        i.e. if it is created and deleted again
+    """
+
+    if previous is None:
+        return write
+
+    if write.operation == DELETE:
+        if previous.operation == INSERT:
+            return None
+        return write
+
+    if previous.operation == DELETE:
+        if write.operation == PATCH:
+            logger.warning("Ignoring patch of deleted event {}".format(
+                write.event_id))
+            return previous
+        # recreating takes over the ID of the deleted event
+        return write._replace(operation=UPDATE,
+                body=dict(write.body, status="confirmed"))
+
+    if write.operation == PATCH:
+        if previous.operation == PATCH:
+            return previous._replace(body=dict(previous.body, **write.body))
+        return previous._replace(body=_apply(previous.body, write.body))
+
+    # an insert or update replacing a created or modified event
+    operation = INSERT if previous.operation == INSERT else UPDATE
+    return write._replace(operation=operation, etag=None)
+
+
+def _apply(body, changes):
+    """Return the body with the changed fields of a patch."""
+    body = dict(body, **changes)
+    return dict((field, value) for field, value in body.items()
+            if value is not None)
+
+
+def _request(service, write):
+    events = service.events()
+    if write.operation == INSERT:
+        return events.insert(calendarId=write.calendarId, body=write.body)
+    if write.operation == UPDATE:
+        request = events.update(calendarId=write.calendarId,
+                eventId=write.event_id, body=write.body)
+    elif write.operation == PATCH:
+        request = events.patch(calendarId=write.calendarId,
+                eventId=write.event_id, body=write.body)
+    else:
+        request = events.delete(calendarId=write.calendarId,
+                eventId=write.event_id)
+    if write.etag is not None:
+        request.headers["If-Match"] = write.etag
+    return request
+
+
+class JournalFlusher(object):
+    """
+    Flushes a WriteJournal in a background thread FLUSH_DELAY seconds after
+    the latest write. While writes can not be sent, e.g. when offline, the
+    flush is retried every RETRY_INTERVAL seconds. Use it as context manager,
+    or call start() and stop().
+
+    :param write_journal: journal to flush
+    :type write_journal: WriteJournal
+
+    :param service: Calendar service used by the flusher only, since its
+        Http object is not thread-safe
+    """
+
+    def __init__(self, write_journal, service, delay=FLUSH_DELAY,
+            retry_interval=RETRY_INTERVAL):
+        self.journal = write_journal
+        self.service = service
+        self.delay = delay
+        self.retry_interval = retry_interval
+        self._clock = time.monotonic
+        self._condition = threading.Condition()
+        # monotonic time of the next flush, None if nothing is due
+        self._due = None
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self.journal.listeners.append(self.notify)
+        if len(self.journal):
+            # writes left over from an earlier run
+            self._due = self._clock()
+        self._thread = threading.Thread(target=self._run,
+                name="gcalendar-journal-flusher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        """Stop the thread. If flush is true, the journal is flushed a last
+        time; writes that can not be sent remain in the journal."""
+        self.journal.listeners.remove(self.notify)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        if flush and len(self.journal):
+            self._flush()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def notify(self):
+        """Schedule a flush after the delay, postponing a scheduled one."""
+        with self._condition:
+            self._due = self._clock() + self.delay
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (self._due is None or
+                        self._clock() < self._due):
+                    self._condition.wait(None if self._due is None else
+                            self._due - self._clock())
+                if self._stopped:
+                    return
+                self._due = None
+
+            if not self._flush():
+                with self._condition:
+                    if self._due is None:
+                        self._due = self._clock() + self.retry_interval
+
+    def _flush(self):
+        """Flush the journal; return whether nothing is left to retry."""
+        try:
+            return self.journal.flush(self.service).pending == 0
+        except Exception as e:
+            logger.warning("Flushing journal failed, retrying in {:.0f}s: {}"
+                    .format(self.retry_interval, e))
+            return False
@@ -1,47 +1,409 @@
 #!/usr/bin/env python
 from __future__ import print_function
+import re
 import sys
+import copy
+import json
+import logging
+import argparse
 
 import datetime
 from time import timezone
 from math import fabs
 
-from gcalendar import methods, utils
+from gcalendar import cache, filters, ics, instrumentation, journal, methods, \
+        utils
 
+logger = logging.getLogger(__name__)
+
+# Commands that record their writes in the journal if --defer is given
+DEFERRED_COMMANDS = ('create', 'delete', 'edit')
 
-def main():
-    """Shows basic usage of the Google Calendar API.
 
-    Creates a Google Calendar API service object and outputs a list of the next
-    10 events on the user's calendar.
+def main(argv=None):
+    """Entry point of the gcalendar command.
+
+    Without subcommand, the interactive menu is started. Otherwise the
+    subcommand is executed and its output is written to stdout as JSON, or as
+    NDJSON (one JSON object per line) for commands returning several items.
+    Arguments not known to the subcommands are passed to the OAuth2 flow.
     """
-    service = utils.build_service()
-
-    while 1:		#Menu Driven program to allow user to execute the required function
-        try:
-            print('\n', '-'*50)
-            choice = int(input('What would you like to do?\n\t1. Read Events\t\t2. Get Details of an Event\n\t3. Create Event\t\t4. Delete Event\n\t5. Edit Events\t\t6. Exit\nYour Choice: '))
-        except ValueError:
-            choice = 7
-
-        if choice == 1:
-            read(service)
-        elif choice == 2:
-            elaborate(service)
-        elif choice == 3:
-            create(service)
-        elif choice == 4:
-            delevent(service)
-        elif choice == 5:
-            edit(service)
-        elif choice == 6:
-            print('\nExiting. Have a nice day!')
-            sys.exit()
+    args, oauth_args = build_parser().parse_known_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(format='%(name)s: %(message)s',
+                level=logging.DEBUG if args.verbose > 1 else logging.INFO)
+
+    metrics = None
+    if args.stats or args.metrics_file:
+        metrics = instrumentation.Metrics()
+        instrumentation.add_hook(metrics)
+
+    try:
+        if args.command is None:
+            menu(oauth_args, journal.WriteJournal() if args.defer else None)
+        elif args.defer and args.command in DEFERRED_COMMANDS:
+            write_journal = journal.WriteJournal()
+            status = run_command(None, args, write_journal=write_journal)
+            flush_journal(write_journal, oauth_args)
+            sys.exit(status)
         else:
-             print('Kindly enter a valid number between 1-6.')
+            service = utils.build_service(utils.parse_flags(oauth_args))
+            sys.exit(run_command(service, args))
+    finally:
+        if metrics is not None:
+            instrumentation.remove_hook(metrics)
+            report_metrics(metrics, args)
+
+
+def flush_journal(write_journal, oauth_args=None):
+    """Try to send the writes of the journal. If that fails, e.g. when
+    offline, they are kept for the next flush."""
+    try:
+        service = utils.build_service(utils.parse_flags(oauth_args))
+        write_journal.flush(service)
+    except Exception as e:
+        print('Writes are kept in the journal and sent by the next flush '
+                'command: {}'.format(e), file=sys.stderr)
+
+
+def report_metrics(metrics, args):
+    """Print the summary of the API calls to stderr and write the metrics
+    file, as requested by the arguments."""
+    if args.stats:
+        print(metrics.summary(), file=sys.stderr)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w') as f:
+            f.write(metrics.openmetrics())
+
+
+def build_parser():
+    """Create the parser of the gcalendar subcommands."""
+    parser = argparse.ArgumentParser(prog='gcalendar',
+            description='Manage Google Calendar from the terminal. Starts '
+            'an interactive menu if no command is given.')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+            help='log progress to stderr, repeat for debug output')
+    parser.add_argument('--stats', action='store_true',
+            help='print a summary of the API calls to stderr on exit')
+    parser.add_argument('--metrics-file', metavar='PATH',
+            help='write metrics of the API calls in OpenMetrics text format '
+            'to the file on exit')
+    parser.add_argument('--defer', action='store_true',
+            help='record created, edited and deleted events in a local '
+            'journal and send them when possible, see the flush command')
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    calendar_parser = argparse.ArgumentParser(add_help=False)
+    calendar_parser.add_argument('-c', '--calendar', default='primary',
+            dest='calendarId', help='calendar ID (default: primary)')
+
+    format_parser = argparse.ArgumentParser(add_help=False)
+    format_parser.add_argument('--format', choices=['ndjson', 'json'],
+            default='ndjson', help='output one object per line (default) or '
+            'a JSON array')
+
+    subparsers.add_parser('calendars', parents=[format_parser],
+            help='list summary and ID of all calendars')
+
+    list_parser = subparsers.add_parser('list',
+            parents=[calendar_parser, format_parser],
+            help='list events between two dates')
+    list_parser.add_argument('start', help='start date (dd/mm/yyyy)')
+    list_parser.add_argument('end', nargs='?',
+            help='end date (dd/mm/yyyy), included. Default: start date')
+    list_parser.add_argument('--fields',
+            help="comma-separated event fields, e.g. 'id,summary,start'")
+    list_parser.add_argument('--max-results', type=int, default=250,
+            help='number of events per requested page (default: 250)')
+    list_parser.add_argument('-q', '--query',
+            help='free text the events must contain, matched by the server')
+    list_parser.add_argument('--property', action='append', default=[],
+            metavar='KEY=VALUE', dest='properties',
+            help='private extended property the events must have set')
+    list_parser.add_argument('--updated-min', metavar='DATE',
+            help='only events modified after the date, including deleted ones')
+    list_parser.add_argument('--show-deleted', action='store_true',
+            help='include deleted events')
+    list_parser.add_argument('--match', action='append', default=[],
+            metavar='FIELD=REGEX', dest='matches',
+            help="regular expression a field must match, e.g. "
+            "'summary=^Standup$' or 'organizer.email=@example\\.com'. "
+            "Matched locally")
+
+    get_parser = subparsers.add_parser('get', parents=[calendar_parser],
+            help='show an event')
+    get_parser.add_argument('event_id')
+
+    create_parser = subparsers.add_parser('create', parents=[calendar_parser],
+            help='create an event')
+    create_parser.add_argument('start', help='dd/mm/yyyy hh:mm:ss')
+    create_parser.add_argument('end', help='dd/mm/yyyy hh:mm:ss')
+    create_parser.add_argument('-s', '--summary', default='')
+    create_parser.add_argument('-l', '--location', default='')
+    create_parser.add_argument('-d', '--description', default='')
+    create_parser.add_argument('-a', '--attendee', action='append',
+            dest='attendees', help='email of an attendee, can be repeated')
+    create_parser.add_argument('--id', dest='event_id',
+            help='event ID (5-1024 characters of a-v and 0-9)')
+    create_parser.add_argument('--no-reminders', action='store_false',
+            dest='enable_reminders')
+
+    delete_parser = subparsers.add_parser('delete', parents=[calendar_parser],
+            help='delete events')
+    delete_parser.add_argument('event_ids', nargs='+', metavar='event_id')
+
+    edit_parser = subparsers.add_parser('edit', parents=[calendar_parser],
+            help='modify fields of an event')
+    edit_parser.add_argument('event_id')
+    edit_parser.add_argument('changes', nargs='+', metavar='field=value',
+            help='new value of the event field, parsed as JSON if possible, '
+            "e.g. location=Berlin or 'attendees=[{\"email\": \"a@b.c\"}]'")
+
+    export_parser = subparsers.add_parser('export', parents=[calendar_parser],
+            help='write events between two dates as iCalendar file')
+    export_parser.add_argument('start', help='start date (dd/mm/yyyy)')
+    export_parser.add_argument('end', nargs='?',
+            help='end date (dd/mm/yyyy), included. Default: start date')
+    export_parser.add_argument('-o', '--output', default='-',
+            help='path of the ICS file (default: stdout)')
+
+    import_parser = subparsers.add_parser('import', parents=[calendar_parser],
+            help='import the events of an iCalendar file')
+    import_parser.add_argument('file', help="path of the ICS file, '-' for stdin")
+
+    subparsers.add_parser('flush',
+            help='send the writes recorded in the journal by --defer')
+
+    return parser
+
+
+def run_command(service, args, stream=None, write_journal=None):
+    """Execute the subcommand specified by the parsed arguments and write the
+    results to the stream (default: stdout). If a journal is given, the
+    DEFERRED_COMMANDS record their writes in it instead of sending them.
+
+    :returns exit status
+    :type int
+    """
+
+    from apiclient.errors import HttpError
+
+    if stream is None:
+        stream = sys.stdout
+
+    try:
+        if args.command == 'calendars':
+            items = (dict(summary=summary, id=calendarId) for summary, calendarId
+                    in methods.list_calendars(service))
+            _write_items(stream, items, args.format)
+
+        elif args.command == 'list':
+            where = None
+            for match in args.matches:
+                field, pattern = _split_pair(match, 'FIELD=REGEX')
+                condition = filters.matches(field, pattern)
+                where = condition if where is None else where & condition
+            events = methods.iter_events(service, calendarId=args.calendarId,
+                    start=args.start, end=args.end,
+                    max_results=args.max_results, fields=args.fields,
+                    q=args.query, private_properties=dict(
+                        _split_pair(p, 'KEY=VALUE') for p in args.properties),
+                    updated_min=args.updated_min,
+                    show_deleted=args.show_deleted, where=where)
+            _write_items(stream, events, args.format)
+
+        elif args.command == 'get':
+            _write(stream, methods.get_event(service, args.event_id,
+                calendarId=args.calendarId))
+
+        elif write_journal is not None and args.command in DEFERRED_COMMANDS:
+            _record(write_journal, args, stream)
+
+        elif args.command == 'create':
+            event_id = methods.create_event(service, calendarId=args.calendarId,
+                    event_id=args.event_id, summary=args.summary,
+                    location=args.location, description=args.description,
+                    start=args.start, end=args.end, attendees=args.attendees,
+                    enable_reminders=args.enable_reminders)
+            _write(stream, dict(id=event_id))
+
+        elif args.command == 'delete':
+            results = methods.delete_events(service, args.event_ids,
+                    calendarId=args.calendarId)
+            status = 0
+            for event_id, result in zip(args.event_ids, results):
+                item = dict(id=event_id, deleted=result.exception is None)
+                if result.exception is not None:
+                    item['error'] = str(result.exception)
+                    status = 1
+                _write(stream, item)
+            return status
+
+        elif args.command == 'edit':
+            changes = dict(_parse_change(change) for change in args.changes)
+            changes['id'] = args.event_id
+            event = methods.patch_event(service, dict(id=args.event_id),
+                    changes, calendarId=args.calendarId)
+            _write(stream, event)
+
+        elif args.command == 'export':
+            lines = ics.export_lines(service, calendarId=args.calendarId,
+                    start=args.start, end=args.end)
+            if args.output == '-':
+                stream.writelines(lines)
+                stream.flush()
+            else:
+                with open(args.output, 'w', newline='') as f:
+                    f.writelines(lines)
+
+        elif args.command == 'import':
+            if args.file == '-':
+                result = ics.import_lines(service, sys.stdin,
+                        calendarId=args.calendarId)
+            else:
+                with open(args.file, newline='') as f:
+                    result = ics.import_lines(service, f,
+                            calendarId=args.calendarId)
+            for uid, exception in result.failed:
+                _write(stream, dict(iCalUID=uid, error=str(exception)))
+            _write(stream, dict(imported=result.imported,
+                failed=len(result.failed)))
+            return 1 if result.failed else 0
+
+        elif args.command == 'flush':
+            if write_journal is None:
+                write_journal = journal.WriteJournal()
+            result = write_journal.flush(service)
+            for write, exception in result.failed:
+                _write(stream, dict(id=write.event_id,
+                    operation=write.operation, error=str(exception)))
+            _write(stream, dict(sent=result.sent, cancelled=result.cancelled,
+                failed=len(result.failed), pending=result.pending))
+            return 1 if result.failed else 0
+
+    except (HttpError, AttributeError, ValueError, IOError, re.error) as e:
+        print('Error: {}'.format(e), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def _record(write_journal, args, stream):
+    if args.command == 'create':
+        event_ids = [write_journal.create_event(calendarId=args.calendarId,
+                event_id=args.event_id, summary=args.summary,
+                location=args.location, description=args.description,
+                start=args.start, end=args.end, attendees=args.attendees,
+                enable_reminders=args.enable_reminders)]
+    elif args.command == 'delete':
+        event_ids = args.event_ids
+        for event_id in event_ids:
+            write_journal.delete_event(event_id, calendarId=args.calendarId)
+    else:
+        changes = dict(_parse_change(change) for change in args.changes)
+        changes['id'] = args.event_id
+        write_journal.patch_event(dict(id=args.event_id), changes,
+                calendarId=args.calendarId)
+        event_ids = [args.event_id]
+
+    for event_id in event_ids:
+        _write(stream, dict(id=event_id, queued=True))
+
+
+def _split_pair(pair, form):
+    key, sep, value = pair.partition('=')
+    if not sep or not key:
+        raise ValueError("Expected {}, got '{}'".format(form, pair))
+    return key, value
+
+
+def _parse_change(change):
+    field, value = _split_pair(change, 'field=value')
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return field, value
+
+
+def _write(stream, item):
+    stream.write(json.dumps(item))
+    stream.write('\n')
+    stream.flush()
+
+
+def _write_items(stream, items, output_format):
+    """Write every item as soon as it is available."""
+    if output_format == 'ndjson':
+        for item in items:
+            _write(stream, item)
+        return
+
+    stream.write('[')
+    for index, item in enumerate(items):
+        if index:
+            stream.write(', ')
+        stream.write(json.dumps(item))
+        stream.flush()
+    stream.write(']\n')
+    stream.flush()
 
 
-def read(service):
+def menu(oauth_args=None, write_journal=None):
+    """Shows basic usage of the Google Calendar API.
+
+    Menu driven program that creates a Google Calendar API service object on
+    first use. Events to read, show or edit are looked up in the local
+    cache.EventCache after an incremental sync. If a journal is given,
+    created, edited and deleted events are recorded in it and sent in
+    background by a journal.JournalFlusher.
+    """
+    # the service is built on first use to show the menu without delay
+    service = None
+    event_cache = None
+    flusher = None
+
+    try:
+        while 1:		#Menu Driven program to allow user to execute the required function
+            try:
+                print('\n', '-'*50)
+                choice = int(input('What would you like to do?\n\t1. Read Events\t\t2. Get Details of an Event\n\t3. Create Event\t\t4. Delete Event\n\t5. Edit Events\t\t6. Exit\nYour Choice: '))
+            except ValueError:
+                choice = 7
+
+            if choice in range(1, 6) and service is None:
+                service = utils.build_service(utils.parse_flags(oauth_args))
+                event_cache = cache.EventCache()
+                if write_journal is not None:
+                    # with a service of its own, Http objects are not thread-safe
+                    flusher = journal.JournalFlusher(write_journal,
+                            utils.build_service(utils.parse_flags(oauth_args))
+                            ).start()
+
+            if choice == 1:
+                read(service, event_cache)
+            elif choice == 2:
+                elaborate(service, event_cache)
+            elif choice == 3:
+                create(service, write_journal)
+            elif choice == 4:
+                delevent(service, write_journal)
+            elif choice == 5:
+                edit(service, write_journal, event_cache)
+            elif choice == 6:
+                print('\nExiting. Have a nice day!')
+                sys.exit()
+            else:
+                 print('Kindly enter a valid number between 1-6.')
+    finally:
+        if flusher is not None:
+            flusher.stop()
+        if event_cache is not None:
+            event_cache.close()
+
+
+def read(service, event_cache=None):
     #Allows user to see all the events on the given day in calendar
     try:
         start_date = input('\nDate to read from (dd/mm/yyyy): ')
@@ -50,10 +412,14 @@ def read(service):
         print('Illegal Date Format. Kindly enter the date in dd/mm/yyyy format.')
         return
 
-    events = methods.fetch_events(service,
-            start=start_date,
-            end=finish_date
-            )
+    if event_cache is None:
+        events = methods.fetch_events(service,
+                start=start_date,
+                end=finish_date
+                )
+    else:
+        sync_cache(service, event_cache)
+        events = event_cache.fetch_events(start=start_date, end=finish_date)
 
     if not events:
         print('No upcoming events found.')
@@ -64,11 +430,43 @@ def read(service):
     for event in events:
         print('\tID:', event['id'], '  ---  ', 'Title:', event['summary'])
 
-def elaborate(service):
+def sync_cache(service, event_cache):
+    """Sync the primary calendar of the cache. If that fails, e.g. when
+    offline, the stored events stay in use."""
+    try:
+        event_cache.sync(service)
+    except Exception as e:
+        logger.warning("Sync failed, using stored events: {}".format(e))
+
+
+def lookup_event(service, event_id, event_cache=None):
+    """
+    Return the event with the given ID of the primary calendar. If a cache is
+    given, it is synced and the event is read from it. Events not in the
+    cache, e.g. recurring events (the cache holds their instances), are
+    requested from the server.
+
+    :type event_cache: cache.EventCache
+
+    :raises Errors of the get request are propagated from the apiclient
+        module.
+
+    :returns dict
+    """
+
+    if event_cache is not None:
+        sync_cache(service, event_cache)
+        event = event_cache.get_event(event_id)
+        if event is not None:
+            return event
+    return methods.get_event(service, event_id)
+
+
+def elaborate(service, event_cache=None):
     #Allows user to see details of a particular event in the calendar. Specially modified for the attendees field of an event
     eventId = input('\nEnter required event\'s ID: ')
     try:
-    	event = service.events().get(calendarId='primary', eventId=eventId).execute()
+    	event = lookup_event(service, eventId, event_cache)
     except:
     	print('Invalid ID. Please try again.')
     	return
@@ -98,11 +496,11 @@ def elaborate(service):
         	print('No such detail exists. Please enter valid parameters of the \'event\' object. eg: description, location, attendees, visibility, colorId, recurrence etc.')
 
 
-def edit(service):
+def edit(service, write_journal=None, event_cache=None):
     #Allows user to edit details of a particular event in the calendar. Specially modified for the attendees, start and end fields of an event
     eventId = input('\nEnter ID of event to be edited: ')
     try:
-    	event = service.events().get(calendarId='primary', eventId=eventId).execute()
+    	event = lookup_event(service, eventId, event_cache)
     except:
     	print('Invalid ID. Please try again.')
     	return
@@ -111,6 +509,9 @@ def edit(service):
     end = event['end'].get('dateTime', event['end'].get('date'))
     print (event['summary'], 'from', start.split('T')[0], ',', start.split('T')[1].split('+')[0], 'till', end.split('T')[0], ', ',  end.split('T')[1].split('+')[0])
 
+    # changes are collected and sent in a single request on exit
+    original = copy.deepcopy(event)
+
     master = 1
     while master == 1:
         param = input('\nWhich detail would you like to modify? (Enter "see" to see all current details, "none" to exit): ')
@@ -166,14 +567,24 @@ def edit(service):
             	event[param] = ''
             event[param] = input('Enter value to be stored with this parameter: ')
 
-        try:
-            event = service.events().update(calendarId='primary', eventId=event['id'], body=event).execute()
-            if param not in ['see', 'none']:
-                print('Event Modified!')
-        except:
-          	print ('Please check the parameter and value entered. Ensure valid parameters of the \'event\' object are entered. eg: description, location, attendees, visibility, colorId, recurrence etc. Also ensure value entered for the parameter is typesafe.')
+        if param not in ['see', 'none']:
+            print('Change recorded, it will be saved on exit.')
 
-def create(service):
+    try:
+        if write_journal is not None:
+            if write_journal.patch_event(original, event):
+                print('Event Modified! The changes will be sent in background.')
+            return
+        event = methods.patch_event(service, original, event)
+        if event is not original:
+            print('Event Modified!')
+    except Exception as e:
+        if getattr(getattr(e, 'resp', None), 'status', None) == 412:
+            print('The event was modified meanwhile. Please edit it again.')
+        else:
+            print ('Please check the parameter and value entered. Ensure valid parameters of the \'event\' object are entered. eg: description, location, attendees, visibility, colorId, recurrence etc. Also ensure value entered for the parameter is typesafe.')
+
+def create(service, write_journal=None):
 	#Allows users to create new event. Specially modified for start/end date-times, number of attendees, title, location, id and description
     print('\nEnter details for the new event.')
     e_id = input('\nID (length between 5-1024 using lowercase a-v & 0-9): ')
@@ -200,20 +611,28 @@ def create(service):
         attendees.append(input('Enter email of Attendee #'+str(i+1)+': '))
 
     try:
-        methods.create_event(service, event_id=e_id, summary=summary,
-                location=location, description=description, start=start,
-                end=end, attendees=attendees)
+        if write_journal is not None:
+            write_journal.create_event(event_id=e_id, summary=summary,
+                    location=location, description=description, start=start,
+                    end=end, attendees=attendees)
+        else:
+            methods.create_event(service, event_id=e_id, summary=summary,
+                    location=location, description=description, start=start,
+                    end=end, attendees=attendees)
         print('Event has been added!')
     except AttributeError:
         raise
     except Exception as e:
         print("Error creating event: {}".format(e))
 
-def delevent(service):
+def delevent(service, write_journal=None):
     #Allows user to delete an event according to event ID
     eventId = input('Enter ID of the event to be deleted: ')
     try:
-        methods.delete_event(service, eventId)
+        if write_journal is not None:
+            write_journal.delete_event(eventId)
+        else:
+            methods.delete_event(service, eventId)
         print('Event deleted!')
     except Exception as e:
         print("Error deleting event: {}".format(e))
@@ -4,22 +4,27 @@
 calendars."""
 
 import uuid
+import heapq
 import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-import maya
-
-from .utils import convert_datetime
+from . import scheduler
+from .event import Event
+from .utils import convert_datetime, utc_timestamp, build_http
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-handler = logging.StreamHandler()
-handler.setLevel(logging.DEBUG)
-logger.addHandler(handler)
+
+# Maximum number of calls the Calendar API accepts in one batch request
+BATCH_SIZE = 50
+
+BatchResult = namedtuple("BatchResult", ["response", "exception"])
 
 
 def create_event(service, calendarId='primary', event_id=None, summary="",
         location="", description="", start=None, end=None, attendees=None,
-        enable_reminders=True, **body_kwargs):
+        enable_reminders=True, conflicts=None, **body_kwargs):
     """
     Create an event request object and insert it in the calendar's events.
 
@@ -29,10 +34,13 @@ def create_event(service, calendarId='primary', event_id=None, summary="",
     :param event_id: unique ID to identify the event. Created by Google if omitted
     :type event_id: str
 
-    :param start: event starting datetime in format dd/mm/yyyy hh:mm:ss.
-    :type start: str
-    :param end: event ending datetime in format dd/mm/yyyy hh:mm:ss.
-    :type end: str
+    :param start: event starting datetime in format dd/mm/yyyy hh:mm:ss, or
+        a start field as in the API, e.g. {'date': '2017-04-14'} for all-day
+        events
+    :type start: str or dict
+    :param end: event ending datetime in format dd/mm/yyyy hh:mm:ss, or an
+        end field as in the API. All-day events end on the following day.
+    :type end: str or dict
 
     :param attendees: list of attendees' emails
     :type attendees: list[str]
@@ -41,23 +49,87 @@ def create_event(service, calendarId='primary', event_id=None, summary="",
         event and display a popup 10 minutes in advance.
     :type enable_reminders: bool
 
+    :param conflicts: if given, the event is only created if it does not
+        overlap any interval of the index, e.g. existing events.
+    :type conflicts: availability.IntervalIndex
+
     :param body_kwargs: Its contents are added to the event body. This allows
         for adding custom fields acc. to the specification, e.g. recurrence.
         This will also overwrite fields that are redefined.
         (https://developers.google.com/resources/api-libraries/documentation/calendar/v3/python/latest/calendar_v3.events.html#insert)
 
     :raises AttributeError: if any argument of summary, start or end is unspecified
+    :raises availability.ConflictError: if the event overlaps any interval of
+        the conflicts index
     :raises Errors are propagated from the apiclient module.
 
     :returns event_id: ID of the created event, if successful
     :type event_id: str
     """
 
+    event = event_body(event_id=event_id, summary=summary,
+            location=location, description=description, start=start, end=end,
+            attendees=attendees, enable_reminders=enable_reminders,
+            **body_kwargs)
+
+    if conflicts is not None:
+        conflicts.check(event['start'], event['end'])
+
+    logger.info("About to create event")
+    response = execute(service.events().insert(calendarId=calendarId, body=event))
+    event_id = response["id"]
+    logger.info("Successfully created event with ID={}".format(event_id))
+
+    return event_id
+
+
+def create_events(service, events, calendarId='primary'):
+    """
+    Create several events using batch requests of up to BATCH_SIZE calls.
+
+    :param events: keyword arguments of create_event() for every event, e.g.
+        [{'summary': 'Foo', 'start': '11/04/2017 08:00', 'end': ...}, ...]
+    :type events: iterable[dict]
+
+    :param calendarId: ID of the calendar to insert the events. Default: 'primary'
+    :type calendarId: str
+
+    :raises AttributeError: if any event lacks start or end. No request is
+        sent in that case.
+
+    :returns list[BatchResult] in the order of the given events. The response
+        is the ID of the created event if successful, otherwise the exception
+        holds the HttpError.
+    """
+
+    requests = [
+        service.events().insert(calendarId=calendarId, body=event_body(**kwargs))
+        for kwargs in events
+        ]
+
+    logger.info("About to create {} events".format(len(requests)))
+    results = [
+        BatchResult(None if response is None else response["id"], exception)
+        for response, exception in execute_batch(service, requests)
+        ]
+    _log_batch_results(results)
+
+    return results
+
+
+def event_body(event_id=None, summary="", location="", description="",
+        start=None, end=None, attendees=None, enable_reminders=True,
+        **body_kwargs):
+    """Create the request body of a new event. See create_event() for the
+    arguments."""
+
     if not all([start, end]):
         raise AttributeError("Missing mandatory argument")
 
-    datetime_start = convert_datetime(start)
-    datetime_end = convert_datetime(end)
+    time_start = start if isinstance(start, dict) else \
+        {'dateTime': convert_datetime(start)}
+    time_end = end if isinstance(end, dict) else \
+        {'dateTime': convert_datetime(end)}
 
     attendee_emails = [] if attendees is None else [{"email": mail} for mail in attendees]
 
@@ -65,12 +137,8 @@ def create_event(service, calendarId='primary', event_id=None, summary="",
         'summary': summary,
         'location': location,
         'description': description,
-        'start': {
-          'dateTime': datetime_start,
-        },
-        'end': {
-          'dateTime': datetime_end,
-        },
+        'start': time_start,
+        'end': time_end,
         'attendees': attendee_emails,
         }
 
@@ -88,18 +156,60 @@ def create_event(service, calendarId='primary', event_id=None, summary="",
 
     event.update(body_kwargs)
 
-    logger.info("About to create event")
-    response = service.events().insert(calendarId=calendarId, body=event).execute()
-    event_id = response["id"]
-    logger.info("Successfully created event with ID={}".format(event_id))
+    return event
 
-    return event_id
 
+def get_event(service, event_id, calendarId='primary'):
+    """
+    Get event specified by ID from calendar.
+
+    :param event_id: ID of the event
+    :type event_id: str
+
+    :param calendarId: ID of the calendar holding the event. Default: 'primary'
+    :type calendarId: str
+
+    :raises Errors are propagated from the apiclient module (e.g. HTTPError if
+        the event_id is not found.)
+
+    :returns dict
+    """
+
+    return execute(service.events().get(calendarId=calendarId, eventId=event_id))
 
-def fetch_events(service, calendarId='primary', start=None, end=None):
+
+def fetch_events(service, calendarId='primary', start=None, end=None,
+        max_results=250, fields=None, http=None, compact=False,
+        expand_locally=False, q=None, private_properties=None,
+        updated_min=None, show_deleted=False, where=None):
     """
     Fetch events of the specified calendar between start and end date.
 
+    All result pages are requested; see iter_events() for the arguments. Use
+    iter_events() directly to avoid holding all events in memory.
+
+    :returns list[dict] or list[Event]
+    """
+
+    events = list(iter_events(service, calendarId=calendarId, start=start,
+        end=end, max_results=max_results, fields=fields, http=http,
+        compact=compact, expand_locally=expand_locally, q=q,
+        private_properties=private_properties, updated_min=updated_min,
+        show_deleted=show_deleted, where=where))
+    logger.info("Nr. of events found: {}".format(len(events)))
+
+    return events
+
+
+def iter_events(service, calendarId='primary', start=None, end=None,
+        max_results=250, fields=None, http=None, compact=False,
+        expand_locally=False, q=None, private_properties=None,
+        updated_min=None, show_deleted=False, where=None):
+    """
+    Generator function yielding the events of the specified calendar between
+    start and end date. Result pages are requested lazily by following the
+    nextPageToken of the response.
+
     :param calendarId: ID of the calendar to insert the event. Default: 'primary'
     :type calendarId: str
 
@@ -110,7 +220,193 @@ def fetch_events(service, calendarId='primary', start=None, end=None):
         24 hours after the start date.
     :type end: str
 
-    :returns list[dict]
+    :param max_results: maximum number of events per result page (at most 2500)
+    :type max_results: int
+
+    :param fields: comma-separated event fields to retrieve, e.g.
+        'id,summary,start'. By default, all fields are retrieved.
+    :type fields: str
+
+    :param http: Http object to send the requests with instead of the one of
+        the service
+    :type http: httplib2.Http
+
+    :param compact: If true, yield Event objects instead of dicts. 'start' and
+        'end' are added to the requested fields then. Cancelled events lacking
+        these, e.g. deleted instances of recurring events, are skipped.
+    :type compact: bool
+
+    :param expand_locally: If true, recurring events are requested once as
+        master events and their instances are generated locally instead of
+        by the server, see recurrence.RecurringEvents.
+    :type expand_locally: bool
+
+    :param q: free text that events must contain in summary, description,
+        location, attendees etc. Matched by the server.
+    :type q: str
+
+    :param private_properties: private extended properties the events must
+        have set, matched by the server
+    :type private_properties: dict
+
+    :param updated_min: only events modified after this date, e.g.
+        '11/04/2017 10:00'. Deleted events are included then.
+    :type updated_min: str
+
+    :param show_deleted: If true, include cancelled events. Not supported with
+        expand_locally.
+    :type show_deleted: bool
+
+    :param where: local predicate that events must satisfy, e.g. composed of
+        the functions of the filters module. The fields it reads are added to
+        the requested fields.
+    :type where: filters.Filter or callable
+
+    :raises ValueError: if both show_deleted and expand_locally are given
+
+    :yields dict or Event
+    """
+
+    if show_deleted and expand_locally:
+        raise ValueError("show_deleted is not supported with expand_locally")
+
+    logger.info("Reading events from {} to {}".format(start, end))
+
+    if fields is not None and getattr(where, "fields", None):
+        fields = ",".join(sorted(set(fields.split(",")).union(where.fields)))
+    if fields is not None and compact:
+        fields = ",".join(sorted(set(fields.split(",")).union(["start", "end"])))
+
+    filter_kwargs = {}
+    if q is not None:
+        filter_kwargs["q"] = q
+    if private_properties:
+        filter_kwargs["privateExtendedProperty"] = ["{}={}".format(key, value)
+                for key, value in sorted(private_properties.items())]
+    if updated_min is not None:
+        filter_kwargs["updatedMin"] = convert_datetime(updated_min)
+
+    if expand_locally:
+        from .recurrence import RecurringEvents
+        events = RecurringEvents.fetch(service, calendarId=calendarId,
+                start=start, end=end, max_results=max_results, fields=fields,
+                http=http, **filter_kwargs).events(start, end)
+    else:
+        if show_deleted:
+            filter_kwargs["showDeleted"] = True
+        time_min, time_max = time_range(start, end)
+        events = list_events(service, http=http, calendarId=calendarId,
+                timeMin=time_min, timeMax=time_max, singleEvents=True,
+                orderBy='startTime', maxResults=max_results, fields=fields,
+                **filter_kwargs)
+
+    if where is not None:
+        events = (event for event in events if where(event))
+
+    for event in events:
+        if not compact:
+            yield event
+        elif "start" in event and "end" in event:
+            yield Event(event)
+        else:
+            logger.debug("Skipping event {} without start or end".format(
+                event.get("id")))
+
+
+def list_events(service, http=None, fields=None, **list_kwargs):
+    """
+    Generator function yielding the events of an events().list request,
+    following the nextPageToken of the responses.
+
+    :param fields: comma-separated event fields to retrieve
+    :type fields: str
+
+    :param list_kwargs: parameters of the request, e.g. calendarId, timeMin,
+        singleEvents
+
+    :yields dict
+    """
+
+    if fields is not None:
+        list_kwargs["fields"] = "nextPageToken,items({})".format(fields)
+
+    page_token = None
+    while True:
+        response = execute(service.events().list(pageToken=page_token,
+                **list_kwargs), http=http)
+
+        for event in response.get('items', []):
+            yield event
+
+        page_token = response.get('nextPageToken')
+        if page_token is None:
+            break
+
+
+def fetch_events_many(service, calendar_ids, start=None, end=None,
+        max_workers=8, http_factory=build_http, **kwargs):
+    """
+    Fetch events of several calendars between start and end date concurrently.
+
+    Every worker thread sends its requests with an Http object of its own since
+    these are not thread-safe.
+
+    :param calendar_ids: IDs of the calendars to read
+    :type calendar_ids: iterable[str]
+
+    :param max_workers: maximum number of concurrent requests
+    :type max_workers: int
+
+    :param http_factory: callable returning a new authorized Http object.
+        Default: utils.build_http
+    :type http_factory: callable
+
+    :param kwargs: further arguments of fetch_events(). If fields are
+        specified, they must include 'start'.
+
+    :raises Errors are propagated from the apiclient module.
+
+    :returns list of (calendarId, event) tuples ordered by event start
+    :type list[tuple(str, dict)]
+    """
+
+    local = threading.local()
+
+    def fetch(calendarId):
+        if not hasattr(local, "http"):
+            local.http = http_factory()
+        events = fetch_events(service, calendarId=calendarId, start=start,
+                end=end, http=local.http, **kwargs)
+        return [(_start_key(e), calendarId, e) for e in events]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch, calendar_ids))
+
+    return [(calendarId, event) for _, calendarId, event in
+            heapq.merge(*results, key=lambda result: result[0])]
+
+
+def _start_key(event):
+    if isinstance(event, Event):
+        return event.start
+    return utc_timestamp(event["start"])
+
+
+def time_range(start, end=None):
+    """
+    Convert the start and end date of a query to timestamps. The end date is
+    included entirely.
+
+    :param start: start date of the query in format dd/mm/yyyy
+    :type start: str
+
+    :param end: end date of the query in format dd/mm/yyyy. By default, this is
+        24 hours after the start date.
+    :type end: str
+
+    :raises AttributeError: if start is unspecified
+
+    :returns tuple(str, str)
     """
 
     if start is None:
@@ -119,19 +415,62 @@ def fetch_events(service, calendarId='primary', start=None, end=None):
     if end is None:
         end = start
 
-    logger.info("Reading events from {} to {}".format(start, end))
-
     # include events of entire end day, day_first!!
-    end = convert_datetime(end, hours=24)
+    return convert_datetime(start), convert_datetime(end, hours=24)
 
-    response = service.events().list(
-            calendarId=calendarId, timeMin=convert_datetime(start),
-            timeMax=end, singleEvents=True, orderBy='startTime').execute()
 
-    events = response['items']
-    logger.info("Nr. of events found: {}".format(len(events)))
+def patch_event(service, original, modified, calendarId='primary'):
+    """
+    Send the fields that differ between the original and the modified event
+    to the calendar. If the original event carries an ETag, the patch is only
+    applied if the event was not modified meanwhile.
 
-    return events
+    :param original: event as fetched from the calendar, including the 'id'
+    :type original: dict
+
+    :param modified: modified copy of the original event. Fields missing in
+        the copy are cleared.
+    :type modified: dict
+
+    :param calendarId: ID of the calendar holding the event. Default: 'primary'
+    :type calendarId: str
+
+    :raises Errors are propagated from the apiclient module (e.g. HttpError
+        with status 412 if the event was modified meanwhile.)
+
+    :returns the patched event, or the original if nothing changed
+    :type dict
+    """
+
+    changes = event_changes(original, modified)
+    if not changes:
+        logger.info("Event with ID={} unchanged".format(original["id"]))
+        return original
+
+    logger.info("About to patch fields {} of event with ID={}".format(
+        ", ".join(sorted(changes)), original["id"]))
+    request = service.events().patch(calendarId=calendarId,
+            eventId=original["id"], body=changes)
+    if "etag" in original:
+        request.headers["If-Match"] = original["etag"]
+    event = execute(request)
+    logger.info("Successfully patched event")
+
+    return event
+
+
+def event_changes(original, modified):
+    """
+    Return the top-level fields of the modified event that differ from the
+    original one. Removed fields are mapped to None.
+
+    :rtype dict
+    """
+
+    changes = dict((field, value) for field, value in modified.items()
+            if original.get(field) != value)
+    changes.update((field, None) for field in original if field not in modified)
+    return changes
 
 
 def delete_event(service, event_id, calendarId='primary'):
@@ -149,10 +488,184 @@ def delete_event(service, event_id, calendarId='primary'):
     """
 
     logger.info("About to delete event with ID={}".format(event_id))
-    service.events().delete(calendarId=calendarId, eventId=event_id).execute()
+    execute(service.events().delete(calendarId=calendarId, eventId=event_id))
     logger.info("Successfully deleted event")
 
 
+def delete_events(service, event_ids, calendarId='primary'):
+    """
+    Delete several events using batch requests of up to BATCH_SIZE calls.
+
+    :param event_ids: IDs of the events to be deleted
+    :type event_ids: iterable[str]
+
+    :param calendarId: ID of the calendar to delete the events from.
+        Default: 'primary'
+    :type calendarId: str
+
+    :returns list[BatchResult] in the order of the given IDs. The exception
+        holds the HttpError if deleting the event failed (e.g. if the event_id
+        is not found.)
+    """
+
+    requests = [
+        service.events().delete(calendarId=calendarId, eventId=event_id)
+        for event_id in event_ids
+        ]
+
+    logger.info("About to delete {} events".format(len(requests)))
+    results = [BatchResult(*result) for result in execute_batch(service, requests)]
+    _log_batch_results(results)
+
+    return results
+
+
+def update_events(service, events, calendarId='primary'):
+    """
+    Update several events using batch requests of up to BATCH_SIZE calls.
+
+    :param events: complete event bodies including the 'id' field, e.g. as
+        returned from fetch_events() and modified afterwards.
+    :type events: iterable[dict]
+
+    :param calendarId: ID of the calendar holding the events. Default: 'primary'
+    :type calendarId: str
+
+    :returns list[BatchResult] in the order of the given events. The response
+        is the updated event if successful, otherwise the exception holds the
+        HttpError.
+    """
+
+    requests = [
+        service.events().update(calendarId=calendarId, eventId=event["id"],
+            body=event)
+        for event in events
+        ]
+
+    logger.info("About to update {} events".format(len(requests)))
+    results = [BatchResult(*result) for result in execute_batch(service, requests)]
+    _log_batch_results(results)
+
+    return results
+
+
+def watch_events(service, address, calendarId='primary', channel_id=None,
+        token=None, ttl=None, http=None):
+    """
+    Open a notification channel: the Calendar API sends a POST request to the
+    address whenever events of the calendar change. See
+    notifications.CalendarWatcher for a receiver.
+
+    :param address: HTTPS URL receiving the notifications
+    :type address: str
+
+    :param calendarId: ID of the calendar to watch. Default: 'primary'
+    :type calendarId: str
+
+    :param channel_id: unique ID of the channel. Default: a random UUID
+    :type channel_id: str
+
+    :param token: string sent along with every notification to verify them
+    :type token: str
+
+    :param ttl: requested lifetime of the channel in seconds. The server
+        decides about the actual expiration.
+    :type ttl: int
+
+    :param http: Http object to send the request with instead of the one of
+        the service
+    :type http: httplib2.Http
+
+    :raises Errors are propagated from the apiclient module.
+
+    :returns the channel resource, holding the id, resourceId and expiration
+        (milliseconds since epoch) of the channel
+    :type dict
+    """
+
+    body = {"id": channel_id or str(uuid.uuid4()), "type": "web_hook",
+            "address": address}
+    if token is not None:
+        body["token"] = token
+    if ttl is not None:
+        body["params"] = {"ttl": str(ttl)}
+
+    channel = execute(service.events().watch(calendarId=calendarId, body=body),
+            http=http)
+    logger.info("Watching calendar {} on channel {}".format(calendarId,
+        channel["id"]))
+    return channel
+
+
+def stop_channel(service, channel_id, resource_id, http=None):
+    """
+    Stop the notifications of a channel opened by watch_events().
+
+    :param channel_id: ID of the channel
+    :type channel_id: str
+
+    :param resource_id: resourceId of the channel resource
+    :type resource_id: str
+
+    :param http: Http object to send the request with instead of the one of
+        the service
+    :type http: httplib2.Http
+
+    :raises Errors are propagated from the apiclient module.
+    """
+
+    execute(service.channels().stop(body={"id": channel_id,
+        "resourceId": resource_id}), http=http)
+    logger.info("Stopped channel {}".format(channel_id))
+
+
+def execute(request, http=None):
+    """
+    Execute an API request through the scheduler.default_scheduler that
+    limits the request rate and retries on rate limit or server errors.
+
+    :param request: request object, e.g. service.events().get(...)
+    :type request: apiclient.http.HttpRequest
+
+    :param http: Http object to send the request with instead of the one of
+        the service
+    :type http: httplib2.Http
+
+    :raises Errors are propagated from the apiclient module.
+
+    :returns the deserialized response
+    """
+
+    return scheduler.default_scheduler.execute(request, http=http)
+
+
+def execute_batch(service, requests):
+    """
+    Execute API requests as batch requests of up to BATCH_SIZE calls each,
+    through the scheduler.default_scheduler. Calls failing due to rate limit
+    or server errors are retried.
+
+    :param requests: request objects as returned from e.g.
+        service.events().insert(...)
+    :type requests: list[apiclient.http.HttpRequest]
+
+    :returns list of (response, exception) tuples in the order of the given
+        requests. Errors of single calls are not raised but returned as
+        exception, the response is None then.
+    :raises Errors of the batch request itself are propagated from the
+        apiclient module.
+    """
+
+    return scheduler.default_scheduler.execute_batch(service, requests,
+            BATCH_SIZE)
+
+
+def _log_batch_results(results):
+    nr_failed = sum(1 for result in results if result.exception is not None)
+    logger.info("Batch finished: {} succeeded, {} failed".format(
+        len(results) - nr_failed, nr_failed))
+
+
 def list_calendars(service):
     """
     Generator function yielding a (summary, ID) tuple for every calendar.
@@ -163,7 +676,7 @@ def list_calendars(service):
     :yields tuple(str, str)
     """
 
-    response = service.calendarList().list().execute()
+    response = execute(service.calendarList().list())
     logger.info("Nr. of calendars found: {}".format(len(response["items"])))
 
     for item in response["items"]:
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""Receiver of Calendar API push notifications that keeps an EventCache
+current without polling.
+
+A CalendarWatcher opens a notification channel per watched calendar (see
+methods.watch_events()) and serves an HTTP endpoint for the notifications.
+Each notification triggers an incremental sync of the affected calendar only,
+in a background thread:
+
+    with CalendarWatcher(service, cache, address="https://example.com/hook",
+            port=8080) as watcher:
+        watcher.watch("primary")
+        ...
+
+Google only delivers notifications to HTTPS addresses reachable from the
+internet, hence the local endpoint usually sits behind a reverse proxy or
+tunnel whose URL is given as address. fake.FakeCalendarHttp sends
+notifications to local addresses for tests.
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import methods
+
+logger = logging.getLogger(__name__)
+
+# Headers of notification requests
+CHANNEL_ID_HEADER = "X-Goog-Channel-ID"
+CHANNEL_TOKEN_HEADER = "X-Goog-Channel-Token"
+CHANNEL_EXPIRATION_HEADER = "X-Goog-Channel-Expiration"
+RESOURCE_ID_HEADER = "X-Goog-Resource-ID"
+RESOURCE_URI_HEADER = "X-Goog-Resource-URI"
+RESOURCE_STATE_HEADER = "X-Goog-Resource-State"
+MESSAGE_NUMBER_HEADER = "X-Goog-Message-Number"
+
+# Resource state of the first message of a channel, not indicating a change
+SYNC_STATE = "sync"
+
+# Fraction of the lifetime of a channel after which it is renewed
+RENEWAL_FRACTION = 0.9
+# Seconds to wait before retrying a failed renewal
+RENEWAL_RETRY = 60
+
+Notification = namedtuple("Notification", ["channel_id", "resource_id",
+    "state", "message_number", "token", "resource_uri"])
+
+Channel = namedtuple("Channel", ["id", "resourceId", "calendarId", "token",
+    "expiration"])
+
+
+class WebhookReceiver(object):
+    """
+    HTTP server passing every received notification to a callback. Use it
+    as context manager, or call start() and stop().
+
+    :param callback: called with a Notification from a server thread. The
+        request is answered with 403 if it returns False, otherwise with 200.
+    :type callback: callable
+
+    :param port: Default: any free port
+    :type port: int
+    """
+
+    def __init__(self, callback, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), _NotificationHandler)
+        self._server.daemon_threads = True
+        self._server.callback = callback
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL of the receiver, e.g. 'http://127.0.0.1:8080/'."""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                name="gcalendar-webhook", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length", 0))
+        if length:
+            # notifications of the events collection have no body
+            self.rfile.read(length)
+
+        notification = Notification(
+                channel_id=self.headers.get(CHANNEL_ID_HEADER),
+                resource_id=self.headers.get(RESOURCE_ID_HEADER),
+                state=self.headers.get(RESOURCE_STATE_HEADER),
+                message_number=int(self.headers.get(MESSAGE_NUMBER_HEADER, 0)),
+                token=self.headers.get(CHANNEL_TOKEN_HEADER),
+                resource_uri=self.headers.get(RESOURCE_URI_HEADER))
+
+        try:
+            accepted = self.server.callback(notification) is not False
+        except Exception:
+            logger.exception("Handling notification failed")
+            accepted = True
+        self.send_response(200 if accepted else 403)
+        self.send_header("content-length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CalendarWatcher(object):
+    """
+    Keeps the events of watched calendars in an EventCache current by syncing
+    a calendar whenever a notification about it is received. Notifications
+    arriving while a sync is pending are coalesced into it. Channels are
+    renewed by the sync thread before they expire.
+
+    :param service: Calendar service
+    :param cache: store to sync the calendars into
+    :type cache: cache.EventCache
+
+    :param address: URL the API sends the notifications to. Default: the URL
+        of the local receiver
+    :type address: str
+
+    :param host, port: address of the local receiver. Default: any free port
+        on localhost
+
+    :param http_factory: callable returning an Http object for the sync
+        thread. Required if the service is used by other threads meanwhile,
+        since Http objects are not thread-safe (e.g. utils.build_http).
+    :type http_factory: callable
+
+    :param on_sync: called with (calendarId, number of changes) after every
+        sync, e.g. to refresh a view
+    :type on_sync: callable
+    """
+
+    def __init__(self, service, cache, address=None, host="127.0.0.1", port=0,
+            http_factory=None, on_sync=None):
+        self.service = service
+        self.cache = cache
+        self.receiver = WebhookReceiver(self._notify, host=host, port=port)
+        self.address = address or self.receiver.url
+        self._http_factory = http_factory
+        self._on_sync = on_sync
+        self._channels = {}
+        # ttl by calendarId, channel renewal times by channel ID
+        self._ttls = {}
+        self._renewals = {}
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self.receiver.start()
+        self._thread = threading.Thread(target=self._run,
+                name="gcalendar-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop all channels, the receiver and the sync thread."""
+        for channel in list(self._channels.values()):
+            self.unwatch(channel.calendarId)
+        self.receiver.stop()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def channels(self):
+        """Open channels by ID."""
+        return dict(self._channels)
+
+    def watch(self, calendarId='primary', ttl=None):
+        """
+        Open a channel for the calendar and sync it once to catch up on
+        changes that happened before.
+
+        :param ttl: requested lifetime of the channel in seconds
+        :type ttl: int
+
+        :raises Errors are propagated from the apiclient module.
+
+        :returns Channel
+        """
+
+        self._ttls[calendarId] = ttl
+        return self._open(calendarId, ttl)
+
+    def unwatch(self, calendarId='primary'):
+        """Stop the channels of the calendar. Errors are logged."""
+
+        self._ttls.pop(calendarId, None)
+        for channel in list(self._channels.values()):
+            if channel.calendarId == calendarId:
+                self._close(channel)
+
+    def _open(self, calendarId, ttl, http=None):
+        token = uuid.uuid4().hex
+        # register before opening, the first message may arrive before the
+        # response
+        channel_id = str(uuid.uuid4())
+        self._channels[channel_id] = Channel(channel_id, None, calendarId,
+                token, None)
+        try:
+            response = methods.watch_events(self.service, self.address,
+                    calendarId=calendarId, channel_id=channel_id, token=token,
+                    ttl=ttl, http=http)
+        except Exception:
+            del self._channels[channel_id]
+            raise
+
+        channel = Channel(channel_id, response["resourceId"], calendarId,
+                token, int(response["expiration"])
+                if "expiration" in response else None)
+        self._channels[channel_id] = channel
+        if channel.expiration is not None:
+            now = time.time()
+            with self._condition:
+                self._renewals[channel_id] = now + RENEWAL_FRACTION * (
+                        channel.expiration / 1000 - now)
+        self._schedule(calendarId)
+        return channel
+
+    def _close(self, channel, http=None):
+        from apiclient.errors import HttpError
+
+        self._channels.pop(channel.id, None)
+        with self._condition:
+            self._renewals.pop(channel.id, None)
+        try:
+            methods.stop_channel(self.service, channel.id, channel.resourceId,
+                    http=http)
+        except HttpError as e:
+            logger.warning("Stopping channel {} failed: {}".format(
+                channel.id, e))
+
+    def _renew(self, channel, http):
+        """Replace the channel by a new one, stopping it only afterwards to
+        not miss notifications in between."""
+        if channel.calendarId not in self._ttls:
+            # unwatched meanwhile
+            return
+        try:
+            self._open(channel.calendarId, self._ttls[channel.calendarId],
+                    http=http)
+        except Exception as e:
+            logger.warning("Renewing channel {} failed: {}".format(
+                channel.id, e))
+            with self._condition:
+                if channel.id in self._renewals:
+                    self._renewals[channel.id] = time.time() + RENEWAL_RETRY
+            return
+        self._close(channel, http=http)
+
+    def _notify(self, notification):
+        channel = self._channels.get(notification.channel_id)
+        if channel is None:
+            logger.warning("Notification of unknown channel {}".format(
+                notification.channel_id))
+            return True
+        if notification.token != channel.token:
+            logger.warning("Notification of channel {} with invalid token"
+                    .format(channel.id))
+            return False
+
+        logger.debug("Notification {} of channel {}: {}".format(
+            notification.message_number, channel.id, notification.state))
+        if notification.state != SYNC_STATE:
+            self._schedule(channel.calendarId)
+        return True
+
+    def _schedule(self, calendarId):
+        with self._condition:
+            if calendarId not in self._pending:
+                self._pending.append(calendarId)
+                self._condition.notify()
+
+    def _run(self):
+        http = self._http_factory() if self._http_factory is not None else None
+        while True:
+            with self._condition:
+                channel = self._due_channel()
+                while not self._pending and channel is None and \
+                        not self._stopped:
+                    self._condition.wait(self._renewal_timeout())
+                    channel = self._due_channel()
+                if self._stopped:
+                    return
+                if channel is None:
+                    calendarId = self._pending.pop(0)
+                else:
+                    # moved ahead until the renewal is done
+                    self._renewals[channel.id] = float("inf")
+
+            if channel is not None:
+                self._renew(channel, http)
+                continue
+
+            try:
+                nr_changes = self.cache.sync(self.service, calendarId,
+                        http=http)
+            except Exception as e:
+                # retried on the next notification
+                logger.warning("Sync of calendar {} failed: {}".format(
+                    calendarId, e))
+                continue
+            if self._on_sync is not None:
+                self._on_sync(calendarId, nr_changes)
+
+    def _due_channel(self):
+        """Return an open channel due for renewal, or None."""
+        now = time.time()
+        for channel_id, renewal in self._renewals.items():
+            if renewal <= now and channel_id in self._channels:
+                return self._channels[channel_id]
+        return None
+
+    def _renewal_timeout(self):
+        """Return the seconds until the next renewal, or None if there is
+        none."""
+        if not self._renewals:
+            return None
+        return max(0, min(self._renewals.values()) - time.time())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+"""Calendar services of many accounts, e.g. for workers syncing calendars on
+behalf of several users.
+
+A ServicePool builds the service of an account on first use and keeps it,
+together with its credentials, for later jobs. All services of a pool are
+built from one discovery document. The least recently used entries are
+evicted once the pool is full:
+
+    pool = ServicePool(max_size=100)
+    service = pool.get(Account(credentials_file='/var/lib/alice.json'))
+
+SyncRunner spreads jobs of many accounts across processes, each with a pool
+of its own:
+
+    with SyncRunner(max_workers=4) as runner:
+        for result in runner.map(sync_account, accounts):
+            ...
+"""
+
+import os
+import json
+import pickle
+import logging
+import threading
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from . import credentials
+from .utils import API_URL_VARIABLE, BUNDLED_DISCOVERY_FILE, \
+        load_discovery_document
+
+logger = logging.getLogger(__name__)
+
+# Default maximum number of services kept per pool
+MAX_SIZE = 128
+
+# An account is identified by the file of its stored user credentials, or by
+# the key file of a service account and the user it acts for
+Account = namedtuple("Account", ["credentials_file", "service_account",
+    "subject"], defaults=(None, None, None))
+
+JobResult = namedtuple("JobResult", ["account", "result", "exception"])
+
+
+class ServicePool(object):
+    """
+    Services by account, built on first access and evicted least recently
+    used. It is thread-safe, but the services are only if their transports
+    are, see transport_factory.
+
+    :param max_size: maximum number of services kept
+    :type max_size: int
+
+    :param transport_factory: callable returning the transport of a new
+        service, e.g. transport.HttpPool. Default: httplib2.Http
+    :type transport_factory: callable
+
+    :param root_url: URL of an API server to use instead of Google's, see
+        utils.build_service(). Requests are sent unauthorized then.
+    :type root_url: str
+
+    :param credential_cache: cache of the credentials of the pooled services.
+        Default: a cache of the pool
+    :type credential_cache: credentials.CredentialCache
+    """
+
+    def __init__(self, max_size=MAX_SIZE, transport_factory=None,
+            root_url=None, credential_cache=None):
+        self.max_size = max_size
+        self._transport_factory = transport_factory
+        if root_url is None:
+            root_url = os.environ.get(API_URL_VARIABLE)
+        self.root_url = root_url
+        self._credential_cache = credential_cache if credential_cache is not \
+            None else credentials.CredentialCache()
+        self._document = None
+        # (service, credentials) by account, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # the discovery document is completed in place while building
+        self._build_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, account):
+        return account in self._entries
+
+    def get(self, account):
+        """
+        Return the service of the account, building it if not pooled.
+
+        :type account: Account
+
+        :raises Errors of loading the credentials or the discovery document
+            are propagated.
+
+        :returns Calendar service
+        """
+
+        with self._lock:
+            entry = self._entries.get(account)
+            if entry is not None:
+                self._entries.move_to_end(account)
+                return entry[0]
+
+        entry = self._build(account)
+
+        with self._lock:
+            # another thread may have built it meanwhile
+            if account in self._entries:
+                self._entries.move_to_end(account)
+                self._discard(entry)
+                return self._entries[account][0]
+            self._entries[account] = entry
+            while len(self._entries) > self.max_size:
+                evicted, evicted_entry = self._entries.popitem(last=False)
+                logger.debug("Evicting service of {}".format(evicted))
+                self._discard(evicted_entry)
+        return entry[0]
+
+    def clear(self):
+        """Remove all services and forget their credentials."""
+        with self._lock:
+            for entry in self._entries.values():
+                self._discard(entry)
+            self._entries.clear()
+
+    def _build(self, account):
+        from apiclient import discovery
+
+        if self._transport_factory is None:
+            import httplib2
+            http = httplib2.Http()
+        else:
+            http = self._transport_factory()
+
+        account_credentials = None
+        if self.root_url is None:
+            account_credentials = self._credentials(account)
+            http = account_credentials.authorize(http)
+
+        document = self.discovery_document()
+        with self._build_lock:
+            service = discovery.build_from_document(document, http=http)
+        logger.debug("Built service of {}".format(account))
+        return service, account_credentials
+
+    def _credentials(self, account):
+        if account.service_account is not None:
+            return credentials.service_account_credentials(
+                    account.service_account, account.subject,
+                    cache=self._credential_cache)
+        return credentials.user_credentials(
+                path=account.credentials_file or credentials.CREDENTIALS_FILE,
+                cache=self._credential_cache)
+
+    def _discard(self, entry):
+        if entry[1] is not None:
+            self._credential_cache.discard(entry[1])
+
+    def discovery_document(self):
+        """Return the discovery document shared by the services, loading it
+        on first call."""
+        if self._document is None:
+            if self.root_url is None:
+                document = load_discovery_document()
+            else:
+                with open(BUNDLED_DISCOVERY_FILE) as f:
+                    document = json.load(f)
+                document['rootUrl'] = self.root_url.rstrip('/') + '/'
+            self._document = document
+        return self._document
+
+
+# pool of the current worker process of a SyncRunner
+_worker_pool = None
+
+
+def _init_worker(pool_kwargs):
+    global _worker_pool
+    _worker_pool = ServicePool(**pool_kwargs)
+
+
+def _run_job(job, account, args):
+    try:
+        return JobResult(account, job(_worker_pool.get(account), account,
+            *args), None)
+    except Exception as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            # e.g. HttpError can not be restored from its args
+            e = RuntimeError("{}: {}".format(type(e).__name__, e))
+        return JobResult(account, None, e)
+
+
+class SyncRunner(object):
+    """
+    Runs jobs of many accounts in worker processes. Each process keeps a
+    ServicePool, so services are built once per process and account instead
+    of once per job. Use it as context manager, or call shutdown().
+
+    :param max_workers: number of processes. Default: number of CPUs
+    :type max_workers: int
+
+    :param pool_kwargs: arguments of the ServicePool of every process
+    """
+
+    def __init__(self, max_workers=None, **pool_kwargs):
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                initializer=_init_worker, initargs=(pool_kwargs,))
+
+    def map(self, job, accounts, *args):
+        """
+        Run job(service, account, *args) for every account.
+
+        :param job: function taking the service of the account, the account
+            and args. It must be picklable, i.e. defined at module level, and
+            so must be its arguments and return value.
+        :type job: callable
+
+        :type accounts: iterable[Account]
+
+        :returns list[JobResult] in the order of the accounts. Errors of jobs
+            are not raised but returned as exception.
+        """
+
+        futures = [self._executor.submit(_run_job, job, account, args)
+                for account in accounts]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""Local expansion of recurring events.
+
+Instead of letting the server expand every recurring event into its
+instances (singleEvents=True), the master events are fetched once with their
+RRULE, RDATE and EXDATE data and expanded locally, and lazily, for any
+window. Modified and cancelled instances (exceptions) replace or remove the
+respective generated ones.
+
+    recurring = RecurringEvents.fetch(service, start='01/01/2017',
+        end='31/12/2017')
+    for event in recurring.events('11/04/2017', '17/04/2017'):
+        ...
+
+Instances look like the ones returned by the server: their ID is the
+master's ID followed by the original start, and they carry recurringEventId
+and originalStartTime. Needs the python-dateutil package.
+"""
+
+import heapq
+import logging
+import datetime
+
+from . import methods
+from .utils import utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Fields that must be fetched for the expansion
+REQUIRED_FIELDS = ("id", "status", "start", "end", "recurrence",
+        "recurringEventId", "originalStartTime")
+
+
+class RecurringEvents(object):
+    """
+    Events of a calendar with recurring events kept as masters. The instances
+    are generated on every call of events(), without further requests.
+
+    Exceptions of instances are only known within the range the events were
+    fetched for, hence the windows should lie within that range.
+
+    :param events: events as returned from the API with singleEvents=False,
+        including cancelled exceptions (showDeleted=True)
+    :type events: iterable[dict]
+    """
+
+    def __init__(self, events):
+        self.masters = []
+        self.singles = []
+        # original start timestamps of modified or cancelled instances
+        self._exceptions = {}
+
+        for event in events:
+            if "recurringEventId" in event:
+                self._exceptions.setdefault(event["recurringEventId"], set()).add(
+                        utc_timestamp(event["originalStartTime"]))
+                if event.get("status") != "cancelled":
+                    self.singles.append(event)
+            elif event.get("status") == "cancelled":
+                continue
+            elif event.get("recurrence"):
+                self.masters.append(event)
+            else:
+                self.singles.append(event)
+
+        self.singles.sort(key=_start_key)
+
+    @classmethod
+    def fetch(cls, service, calendarId='primary', start=None, end=None,
+            max_results=250, fields=None, http=None, **list_kwargs):
+        """
+        Fetch the master, single and exception events of the calendar between
+        start and end date. See methods.iter_events() for the arguments; the
+        fields are extended by the ones needed for the expansion. Further
+        list_kwargs, e.g. q, are passed to the list requests.
+
+        :rtype RecurringEvents
+        """
+
+        time_min, time_max = methods.time_range(start, end)
+        if fields is not None:
+            fields = ",".join(sorted(set(fields.split(",")).union(
+                REQUIRED_FIELDS)))
+        return cls(methods.list_events(service, http=http, fields=fields,
+            calendarId=calendarId, timeMin=time_min, timeMax=time_max,
+            singleEvents=False, showDeleted=True, maxResults=max_results,
+            **list_kwargs))
+
+    def events(self, start=None, end=None):
+        """
+        Generator function yielding the single events and the instances of
+        the recurring events between start and end date, ordered by start.
+
+        :param start: start date in format dd/mm/yyyy
+        :type start: str
+
+        :param end: end date in format dd/mm/yyyy, included. Default: start
+            date
+        :type end: str
+
+        :yields dict
+        """
+
+        time_min, time_max = (utc_timestamp(timestamp) for timestamp in
+                methods.time_range(start, end))
+        singles = (event for event in self.singles
+                if _overlaps(event, time_min, time_max))
+        instances = [expand(master, time_min, time_max,
+            self._exceptions.get(master["id"], ())) for master in self.masters]
+        return heapq.merge(singles, *instances, key=_start_key)
+
+
+def expand(master, time_min, time_max, exceptions=()):
+    """
+    Generator function yielding the instances of a recurring event that
+    overlap [time_min, time_max), ordered by start.
+
+    :param master: recurring event with 'recurrence' field
+    :type master: dict
+
+    :param time_min: start of the window as UTC timestamp, see
+        utils.utc_timestamp()
+    :type time_min: str
+    :type time_max: str
+
+    :param exceptions: UTC timestamps of the original starts of instances
+        that are not generated
+    :type exceptions: set[str]
+
+    :yields dict
+    """
+
+    from dateutil import rrule
+
+    time_zone = master["start"].get("timeZone")
+    start, all_day = _parse_time(master["start"], time_zone)
+    end, _ = _parse_time(master["end"], time_zone)
+    duration = end - start
+
+    try:
+        rules = rrule.rrulestr("\n".join(master["recurrence"]), dtstart=start,
+                forceset=True, unfold=True)
+    except (ValueError, TypeError) as e:
+        logger.warning("Skipping recurring event {}: {}".format(master["id"], e))
+        return
+
+    window_start, window_end = (_window_bound(timestamp, all_day) for timestamp
+            in (time_min, time_max))
+
+    # instances starting after window_start - duration end within the window
+    for occurrence in rules.xafter(window_start - duration, inc=False):
+        if occurrence >= window_end:
+            break
+        original_start = _time_field(occurrence, all_day, time_zone)
+        if utc_timestamp(original_start) in exceptions:
+            continue
+
+        instance = dict(master)
+        del instance["recurrence"]
+        instance["id"] = "{}_{}".format(master["id"], _id_suffix(occurrence,
+            all_day))
+        instance["recurringEventId"] = master["id"]
+        instance["originalStartTime"] = original_start
+        instance["start"] = original_start
+        instance["end"] = _time_field(occurrence + duration, all_day, time_zone)
+        yield instance
+
+
+def _parse_time(time, time_zone):
+    """Parse the start or end field of an event. All-day dates are parsed to
+    naive datetimes, times to aware ones in the event's time zone if known.
+
+    :returns tuple(datetime.datetime, bool) datetime and whether all-day
+    """
+    if "dateTime" not in time:
+        return datetime.datetime.strptime(time["date"], "%Y-%m-%d"), True
+
+    date_time = datetime.datetime.fromisoformat(
+            time["dateTime"].replace("Z", "+00:00"))
+    if time_zone is not None:
+        from zoneinfo import ZoneInfo
+        # keep the wall time of the instances across DST changes
+        date_time = date_time.astimezone(ZoneInfo(time_zone))
+    return date_time, False
+
+
+def _window_bound(timestamp, all_day):
+    """Convert a UTC timestamp to a datetime comparable to the occurrences.
+    All-day events are regarded to start at midnight UTC."""
+    date_time = datetime.datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return date_time.replace(tzinfo=None) if all_day else date_time
+
+
+def _time_field(date_time, all_day, time_zone):
+    if all_day:
+        return {"date": date_time.strftime("%Y-%m-%d")}
+    field = {"dateTime": date_time.isoformat()}
+    if time_zone is not None:
+        field["timeZone"] = time_zone
+    return field
+
+
+def _id_suffix(occurrence, all_day):
+    if all_day:
+        return occurrence.strftime("%Y%m%d")
+    return occurrence.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _start_key(event):
+    return utc_timestamp(event["start"])
+
+
+def _overlaps(event, time_min, time_max):
+    return utc_timestamp(event["end"]) > time_min and \
+        utc_timestamp(event["start"]) < time_max
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+"""Central execution of API requests with client-side rate limiting and
+retries with exponential backoff."""
+
+import json
+import time
+import random
+import socket
+import logging
+import threading
+
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes of errors that are worth retrying
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# Reasons of 403 errors caused by exceeding the quota
+RATE_LIMIT_REASONS = frozenset(["rateLimitExceeded", "userRateLimitExceeded"])
+
+# Default quota of the Calendar API: 600 requests per minute and user
+DEFAULT_RATE = 10.0
+# Calls of the default scheduler that may be sent at once, one second's worth
+DEFAULT_BURST = 10
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket refilled at a constant rate.
+
+    :param rate: tokens added per second
+    :type rate: float
+
+    :param capacity: maximum number of tokens. Default: rate, i.e. bursts of
+        one second
+    :type capacity: float
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic,
+            sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Take tokens from the bucket, waiting until enough are available.
+        Requests for more tokens than the capacity are served in parts."""
+        while tokens > 0:
+            part = min(tokens, self.capacity)
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity,
+                        self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                self._tokens -= part
+                wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            if wait:
+                self._sleep(wait)
+            tokens -= part
+
+
+class RequestScheduler(object):
+    """
+    Executes API requests and retries the ones failing due to rate limits,
+    server or transport errors. Numbers of requests, retries and failures are
+    counted per API method (e.g. 'calendar.events.list').
+
+    :param rate: maximum number of API calls per second, e.g. the per-user
+        quota. Default: unlimited
+    :type rate: float
+
+    :param burst: number of calls that may be sent at once. Default: rate
+    :type burst: int
+
+    :param max_retries: maximum number of retries of a failed call
+    :type max_retries: int
+
+    :param base_delay: delay in seconds before the first retry. It is doubled
+        on every further retry, up to max_delay. The actual delay is drawn
+        uniformly between zero and that value (full jitter).
+    :type base_delay: float
+    :type max_delay: float
+    """
+
+    def __init__(self, rate=None, burst=None, max_retries=5, base_delay=1.0,
+            max_delay=32.0, sleep=time.sleep, clock=time.monotonic,
+            random=random.random):
+        self.bucket = None if rate is None else TokenBucket(rate, burst,
+                clock=clock, sleep=sleep)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._random = random
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def execute(self, request, http=None):
+        """
+        Execute the request, retrying it on retryable errors.
+
+        :param request: request object, e.g. service.events().get(...)
+        :type request: apiclient.http.HttpRequest
+
+        :param http: Http object to use instead of the request's one
+        :type http: httplib2.Http
+
+        :raises Errors are propagated from the apiclient module after the
+            last retry, or immediately if not retryable.
+
+        :returns the deserialized response
+        """
+
+        return self._execute(request, http, acquire=True)
+
+    def _execute(self, request, http, acquire):
+        if not instrumentation.enabled():
+            return self._retry(request, http, acquire, [])
+
+        attempts, sizes = [], []
+        postproc = getattr(request, "postproc", None)
+        if postproc is not None:
+            # measure the size of the response body before deserialization
+            def measure(resp, content):
+                sizes.append(len(content))
+                return postproc(resp, content)
+            request.postproc = measure
+
+        method = getattr(request, "methodId", None) or "batch"
+        response = error = None
+        start = time.perf_counter()
+        try:
+            response = self._retry(request, http, acquire, attempts)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if postproc is not None:
+                request.postproc = postproc
+            instrumentation.emit(instrumentation.CallRecord(method=method,
+                calendarId=instrumentation.calendar_id(getattr(request, "uri", "")),
+                latency=time.perf_counter() - start,
+                bytes=sizes[-1] if sizes else None, retries=len(attempts) - 1,
+                pages=int(response is not None and method.endswith(".list")),
+                error=error))
+
+    def _retry(self, request, http, acquire, attempts):
+        """Execute the request until it succeeds or fails finally. Every
+        attempt is appended to the attempts list."""
+        endpoint = getattr(request, "methodId", None)
+        for attempt in range(self.max_retries + 1):
+            attempts.append(attempt)
+            if acquire and self.bucket is not None:
+                self.bucket.acquire()
+            self._count(endpoint, "requests")
+            try:
+                return request.execute(http=http)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    self._count(endpoint, "failures")
+                    raise
+                self._count(endpoint, "retries")
+                self._backoff(endpoint, attempt, e)
+
+    def execute_batch(self, service, requests, batch_size):
+        """
+        Execute the requests as batch requests of up to batch_size calls each.
+        Calls failing with retryable errors are retried in new batches.
+
+        :param requests: request objects as returned from e.g.
+            service.events().insert(...)
+        :type requests: list[apiclient.http.HttpRequest]
+
+        :returns list of (response, exception) tuples in the order of the
+            given requests
+        :raises Errors of the batch request itself are propagated from the
+            apiclient module.
+        """
+
+        results = [None] * len(requests)
+        measured = instrumentation.enabled()
+        retries = [0] * len(requests)
+        latencies = [0.0] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        pending = list(range(len(requests)))
+        for attempt in range(self.max_retries + 1):
+            for offset in range(0, len(pending), batch_size):
+                indices = pending[offset:offset + batch_size]
+                if self.bucket is not None:
+                    self.bucket.acquire(len(indices))
+                batch = service.new_batch_http_request(callback=callback)
+                for index in indices:
+                    self._count(requests[index].methodId, "requests")
+                    batch.add(requests[index], request_id=str(index))
+                # the calls of the batch count against the quota, not the batch
+                start = time.perf_counter()
+                self._execute(batch, None, acquire=False)
+                for index in indices:
+                    latencies[index] = time.perf_counter() - start
+
+            pending = [index for index in pending
+                    if is_retryable(results[index][1])]
+            if not pending or attempt == self.max_retries:
+                break
+            for index in pending:
+                self._count(requests[index].methodId, "retries")
+                retries[index] += 1
+            self._backoff("batch", attempt, results[pending[0]][1])
+
+        for index in range(len(requests)):
+            if results[index][1] is not None:
+                self._count(requests[index].methodId, "failures")
+            if measured:
+                instrumentation.emit(instrumentation.CallRecord(
+                    method=requests[index].methodId,
+                    calendarId=instrumentation.calendar_id(requests[index].uri),
+                    latency=latencies[index], bytes=None,
+                    retries=retries[index],
+                    pages=int(results[index][1] is None and
+                        requests[index].methodId.endswith(".list")),
+                    error=results[index][1]))
+        return results
+
+    def counters(self):
+        """
+        Return the numbers of requests, retries and failures per API method,
+        e.g. {'calendar.events.list': {'requests': 3, 'retries': 1,
+        'failures': 0}}. Batch requests are counted as method 'batch'.
+
+        :rtype dict
+        """
+
+        with self._lock:
+            return dict((endpoint, dict(counter))
+                    for endpoint, counter in self._counters.items())
+
+    def _count(self, endpoint, name):
+        with self._lock:
+            counter = self._counters.setdefault(endpoint or "batch",
+                    {"requests": 0, "retries": 0, "failures": 0})
+            counter[name] += 1
+
+    def _backoff(self, endpoint, attempt, error):
+        delay = self._random() * min(self.max_delay,
+                self.base_delay * 2 ** attempt)
+        logger.warning("Retrying {} in {:.1f}s after error: {}".format(
+            endpoint or "batch", delay, error))
+        self._sleep(delay)
+
+
+def is_retryable(error):
+    """Return whether the request failing with the error should be retried:
+    rate limit and server errors, and transport errors."""
+    if error is None:
+        return False
+
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        status = int(status)
+        if status in RETRY_STATUSES:
+            return True
+        return status == 403 and _error_reason(error) in RATE_LIMIT_REASONS
+
+    return isinstance(error, (ConnectionError, socket.timeout))
+
+
+def _error_reason(error):
+    content = getattr(error, "content", b"")
+    try:
+        if not isinstance(content, str):
+            content = content.decode("utf-8")
+        return json.loads(content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+# Scheduler used by the functions of the gcalendar modules, limited to the
+# per-user quota. Replace it to configure rate limit and retries, e.g.
+# RequestScheduler(rate=5) for a project with a lower quota
+default_scheduler = RequestScheduler(rate=DEFAULT_RATE, burst=DEFAULT_BURST)
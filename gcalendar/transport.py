@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Thread-safe HTTP transports with persistent connections that can replace
+the single httplib2.Http object of a service.
+
+A transport provides the request() method of httplib2.Http and can be passed
+to utils.build_service(), e.g.
+
+    service = utils.build_service(transport=HttpPool(size=8,
+        cache_dir='~/.cache/gcalendar/http'))
+
+Since the transports are thread-safe, the authorized transport of a service
+can be shared by threads, e.g. as http_factory of methods.fetch_events_many().
+"""
+
+import os
+import queue
+import threading
+
+# Default number of connections kept open per transport
+POOL_SIZE = 10
+
+# httplib2.DEFAULT_MAX_REDIRECTS, without importing httplib2
+DEFAULT_MAX_REDIRECTS = 5
+
+
+class HttpPool(object):
+    """
+    Pool of httplib2.Http objects, each keeping its connections alive. Every
+    request is sent by an Http object that is not in use by another thread;
+    at most `size` requests are sent concurrently.
+
+    :param size: maximum number of Http objects
+    :type size: int
+
+    :param cache_dir: directory of the httplib2 response cache. Cached
+        responses are revalidated with conditional requests using their ETag.
+        Default: no caching
+    :type cache_dir: str
+
+    :param timeout: socket timeout in seconds
+    :type timeout: float
+
+    :param factory: callable creating the pooled Http objects. Overrides
+        cache_dir and timeout.
+    :type factory: callable
+    """
+
+    def __init__(self, size=POOL_SIZE, cache_dir=None, timeout=None,
+            factory=None):
+        if factory is None:
+            import httplib2
+            cache = None
+            if cache_dir is not None:
+                cache = httplib2.FileCache(os.path.expanduser(cache_dir))
+            factory = lambda: httplib2.Http(cache=cache, timeout=timeout)
+
+        self._factory = factory
+        # last-in first-out to reuse the most recently opened connections
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def request(self, uri, method='GET', body=None, headers=None,
+            redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+        """Send the request with an idle Http object. See httplib2.Http."""
+        with self._slots:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = self._factory()
+            try:
+                return http.request(uri, method=method, body=body,
+                        headers=headers, redirections=redirections,
+                        connection_type=connection_type)
+            finally:
+                self._idle.put(http)
+
+
+class HttpxTransport(object):
+    """
+    Transport based on an httpx.Client, supporting HTTP/2 multiplexing. Needs
+    the optional httpx package (pip install 'httpx[http2]').
+
+    :param http2: If true (default), use HTTP/2 if the server supports it.
+    :type http2: bool
+
+    :param max_connections: maximum number of open connections
+    :type max_connections: int
+
+    :param timeout: timeout in seconds
+    :type timeout: float
+    """
+
+    def __init__(self, http2=True, max_connections=POOL_SIZE, timeout=60.0):
+        import httpx
+        self._client = httpx.Client(http2=http2, timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections,
+                    max_keepalive_connections=max_connections))
+
+    def request(self, uri, method='GET', body=None, headers=None,
+            redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+        """Send the request. See httplib2.Http for arguments and return value."""
+        import httplib2
+
+        response = self._client.request(method, uri, content=body,
+                headers=headers, follow_redirects=redirections > 0)
+
+        info = dict(response.headers)
+        # the content is decoded already
+        info.pop('content-encoding', None)
+        info.pop('content-length', None)
+        info['status'] = str(response.status_code)
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self._client.close()
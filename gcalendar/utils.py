@@ -1,19 +1,31 @@
 #!/usr/bin/env python
 
 import os
+import json
+import time
+import logging
+import argparse
+import datetime
+import functools
+import threading
 
-import maya
-import httplib2
-from apiclient import discovery
-from oauth2client import client
-from oauth2client import tools
-from oauth2client.file import Storage
+logger = logging.getLogger(__name__)
+
+# Formats of the dd/mm/yyyy[ hh:mm[:ss]] dates that are parsed without maya
+DATETIME_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+
+_TIMEDELTA_KWARGS = frozenset(
+        ["weeks", "days", "hours", "minutes", "seconds", "milliseconds",
+            "microseconds"])
 
 
 def convert_datetime(date, day_first=True, **timedeltas):
     """Create timestamp from datetime string. Optionally timedeltas can be
     passed, they will be added after parsing the date string.
 
+    Dates in any of the DATETIME_FORMATS are parsed directly, other formats
+    are passed to maya.parse(). Results are memoized.
+
     :param date: Date to create the timestamp from
     :type date: str
 
@@ -25,56 +37,246 @@ def convert_datetime(date, day_first=True, **timedeltas):
     :type timedeltas: float
     """
 
+    return _convert_datetime(date, day_first, tuple(sorted(timedeltas.items())))
+
+
+@functools.lru_cache(maxsize=4096)
+def _convert_datetime(date, day_first, timedeltas):
+    if day_first and _TIMEDELTA_KWARGS.issuperset(k for k, _ in timedeltas):
+        for datetime_format in DATETIME_FORMATS:
+            try:
+                date_time = datetime.datetime.strptime(date.strip(), datetime_format)
+            except ValueError:
+                continue
+            date_time += datetime.timedelta(**dict(timedeltas))
+            return '{}Z'.format(date_time.isoformat())
+
+    import maya
     date = maya.parse(date, day_first=day_first)
 
     if timedeltas:
-        date = date.add(**timedeltas)
+        date = date.add(**dict(timedeltas))
 
     return date.iso8601()
 
 
-try:
-    import argparse
-    flags = argparse.ArgumentParser(parents=[tools.argparser]).parse_args()
-except ImportError:
-    flags = None
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def utc_timestamp(time):
+    """Convert an RFC3339 timestamp, or the start/end field of an event, to a
+    UTC timestamp that is comparable as string. All-day events are regarded
+    to start at midnight UTC.
+
+    :param time: e.g. '2017-04-11T10:00:00+02:00' or {'date': '2017-04-11'}
+    :type time: str or dict
+
+    :returns str
+    """
+
+    if isinstance(time, dict):
+        time = time.get('dateTime', time.get('date'))
+
+    if 'T' not in time:
+        time += 'T00:00:00Z'
+    time = datetime.datetime.fromisoformat(time.replace('Z', '+00:00'))
+    return time.astimezone(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
 
 # If modifying these scopes, delete your previously saved credentials
 # at ~/.credentials/calendar-python-quickstart.json
 SCOPES = 'https://www.googleapis.com/auth/calendar'
-CLIENT_SECRET_FILE = os.path.join('..', 'client_secret.json')
 APPLICATION_NAME = 'Google Calendar API Python Quickstart'
 
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest'
+# Cached discovery documents are named after the API version they describe
+DISCOVERY_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache',
+        'gcalendar', 'discovery-calendar-v3.json')
+# Age in seconds after which the cached document is refreshed in background
+DISCOVERY_MAX_AGE = 24 * 60 * 60
+DISCOVERY_REFRESH_THREAD = 'gcalendar-discovery-refresh'
+# Discovery document shipped with the package, used for other API servers
+BUNDLED_DISCOVERY_FILE = os.path.join(os.path.dirname(os.path.abspath(
+    __file__)), 'data', 'calendar.v3.json')
+# Environment variable holding the URL of an API server to use instead of
+# Google's, e.g. of a fake.FakeCalendarServer
+API_URL_VARIABLE = 'GCALENDAR_API_URL'
 
-def get_credentials():
-    """Gets valid user credentials from storage.
 
-    If nothing has been stored, or if the stored credentials are invalid,
-    the OAuth2 flow is completed to obtain the new credentials.
+def parse_flags(args=None):
+    """Parse the command line flags of the OAuth2 flow, e.g.
+    --noauth_local_webserver.
+
+    :param args: arguments to parse. Default: sys.argv[1:]
+    :type args: list[str]
+
+    :returns argparse.Namespace
+    """
+    from oauth2client import tools
+    return argparse.ArgumentParser(parents=[tools.argparser]).parse_args(args)
+
+
+def get_credentials(flags=None, client_secret=None, service_account=None,
+        subject=None):
+    """Gets valid credentials, cached in-process and refreshed in background
+    before they expire (see the credentials module).
+
+    User credentials are read from ~/.credentials. If nothing has been
+    stored, or if the stored credentials are invalid, the OAuth2 flow is
+    completed to obtain new ones. Service-account credentials are used
+    instead if a key file is given, or set by GCALENDAR_SERVICE_ACCOUNT.
+
+    Args:
+        flags: argparse.Namespace, flags of the OAuth2 flow as returned from
+            parse_flags(). Defaults are used if omitted.
+        client_secret: path of the client secret file. Defaults to the value
+            of GCALENDAR_CLIENT_SECRET or ~/.credentials/client_secret.json.
+        service_account: path of the JSON key file of a service account
+        subject: email of the user a service account acts for
 
     Returns:
         Credentials, the obtained credential.
     """
-    home_dir = os.path.expanduser('~')
-    credential_dir = os.path.join(home_dir, '.credentials')
-    if not os.path.exists(credential_dir):
-        os.makedirs(credential_dir)
-    credential_path = os.path.join(credential_dir,'calendar-python-quickstart.json')
-    store = Storage(credential_path)
-    credentials = store.get()
-    if not credentials or credentials.invalid:
-        flow = client.flow_from_clientsecrets(CLIENT_SECRET_FILE, SCOPES)
-        flow.user_agent = APPLICATION_NAME
-        if flags:
-            credentials = tools.run_flow(flow, store, flags)
-        else: # Needed only for compatibility with Python 2.6
-            credentials = tools.run(flow, store)
-        print('Storing credentials to ' + credential_path)
-    return credentials
-
-
-def build_service():
-    """Get credentials, authorize and build a service."""
-    credentials = get_credentials()
-    http = credentials.authorize(httplib2.Http())
-    return discovery.build('calendar', 'v3', http=http)
+    from . import credentials
+
+    if service_account or os.environ.get(credentials.SERVICE_ACCOUNT_VARIABLE):
+        return credentials.service_account_credentials(service_account, subject)
+    return credentials.user_credentials(flags, client_secret)
+
+
+def build_http(flags=None, transport=None):
+    """Get credentials and return an authorized Http object.
+
+    Args:
+        flags: argparse.Namespace, flags of the OAuth2 flow, see get_credentials()
+        transport: object providing the request() method of httplib2.Http,
+            e.g. a transport.HttpPool. Defaults to a new httplib2.Http object,
+            which is not thread-safe: every thread needs its own one then.
+    """
+    if transport is None:
+        import httplib2
+        transport = httplib2.Http()
+    credentials = get_credentials(flags)
+    return credentials.authorize(transport)
+
+
+def build_service(flags=None, transport=None, root_url=None):
+    """Get credentials, authorize the transport (see build_http()) and build a
+    service from the cached discovery document.
+
+    Args:
+        root_url: URL of an API server to send the requests to instead of
+            Google's, e.g. 'http://127.0.0.1:8080/' of a fake.FakeCalendarServer.
+            Defaults to the value of the GCALENDAR_API_URL environment
+            variable. The requests are sent unauthorized then, using the
+            discovery document bundled with the package.
+    """
+    from apiclient import discovery
+
+    if root_url is None:
+        root_url = os.environ.get(API_URL_VARIABLE)
+    if root_url is None:
+        return discovery.build_from_document(load_discovery_document(),
+                http=build_http(flags, transport))
+
+    if transport is None:
+        import httplib2
+        transport = httplib2.Http()
+    with open(BUNDLED_DISCOVERY_FILE) as f:
+        document = json.load(f)
+    document['rootUrl'] = root_url.rstrip('/') + '/'
+    return discovery.build_from_document(document, http=transport)
+
+
+def load_discovery_document(path=DISCOVERY_CACHE_FILE,
+        max_age=DISCOVERY_MAX_AGE, http=None):
+    """Return the Calendar API discovery document from the on-disk cache.
+
+    The document is downloaded if not cached yet; if that fails, e.g. when
+    offline, the document bundled with the package is used. If the cached
+    document is older than max_age, it is used nevertheless and refreshed in
+    a background thread.
+
+    :param path: path of the cache file
+    :type path: str
+
+    :param max_age: age in seconds after which the cache is refreshed
+    :type max_age: float
+
+    :param http: Http object to download the document with. It must not be
+        used elsewhere while a background refresh is running. By default, a
+        new httplib2.Http object is used.
+    :type http: httplib2.Http
+
+    :returns dict
+    """
+
+    try:
+        with open(path) as f:
+            document = json.load(f)
+        age = time.time() - os.path.getmtime(path)
+    except (IOError, OSError, ValueError):
+        import httplib2
+        try:
+            return refresh_discovery_document(path, http)
+        except (httplib2.HttpLib2Error, OSError) as e:
+            logger.warning("Using bundled discovery document, download "
+                    "failed: {}".format(e))
+            with open(BUNDLED_DISCOVERY_FILE) as f:
+                return json.load(f)
+
+    if age > max_age:
+        threading.Thread(target=_refresh_in_background, args=(path, http),
+                name=DISCOVERY_REFRESH_THREAD, daemon=True).start()
+
+    return document
+
+
+def refresh_discovery_document(path=DISCOVERY_CACHE_FILE, http=None):
+    """Download the Calendar API discovery document and store it in the cache
+    file. An unchanged revision of the document only renews the cache file's
+    modification time.
+
+    :returns dict
+    """
+
+    if http is None:
+        import httplib2
+        http = httplib2.Http()
+
+    response, content = http.request(DISCOVERY_URL)
+    if response.status != 200:
+        import httplib2
+        raise httplib2.HttpLib2Error("Discovery document request failed "
+                "with status {}".format(response.status))
+    document = json.loads(content.decode('utf-8'))
+
+    try:
+        with open(path) as f:
+            revision = json.load(f).get('revision')
+    except (IOError, OSError, ValueError):
+        revision = None
+
+    if revision is not None and revision == document.get('revision'):
+        os.utime(path, None)
+        return document
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    # replace atomically since other processes might read the cache
+    temporary_path = '{}.{}-{}.tmp'.format(path, os.getpid(),
+            threading.current_thread().ident)
+    with open(temporary_path, 'w') as f:
+        json.dump(document, f)
+    os.replace(temporary_path, path)
+
+    return document
+
+
+def _refresh_in_background(path, http):
+    try:
+        refresh_discovery_document(path, http)
+    except Exception:
+        # the cached document stays in use, retry on next start
+        pass
@@ -10,8 +10,13 @@ setup(
         license='GPLv3',
         #classifiers=[],
         packages=find_packages(exclude=['test', 'doc']),
+        package_data={'gcalendar': ['data/*.json']},
         entry_points = {
             'console_scripts': ['gcalendar = gcalendar.main:main']
             },
-        install_requires=[]
+        install_requires=[],
+        extras_require={
+            'http2': ['httpx[http2]'],
+            'async': ['httpx[http2]'],
+            },
         )
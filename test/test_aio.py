@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+import asyncio
+import unittest
+
+from gcalendar.fake import FakeCalendarHttp, FakeCalendarServer
+
+try:
+    import httpx
+    from gcalendar import aio
+except ImportError:
+    httpx = None
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@unittest.skipIf(httpx is None, "httpx not installed")
+class AsyncClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar = FakeCalendarHttp({"primary": "Primary", "work": "Work"})
+        self.server = FakeCalendarServer(self.calendar).start()
+        self.addCleanup(self.server.stop)
+
+    def client(self, **kwargs):
+        kwargs.setdefault("sleep", lambda _: asyncio.sleep(0))
+        return aio.Client(root_url=self.server.url, http2=False, **kwargs)
+
+    def test_create_fetch_delete(self):
+        async def scenario():
+            async with self.client(max_concurrency=8) as client:
+                event_ids = await asyncio.gather(*(aio.create_event(client,
+                    calendarId="work", summary="Event {}".format(i),
+                    start="11/04/2017 {:02d}:00".format(i),
+                    end="11/04/2017 {:02d}:30".format(i)) for i in range(20)))
+
+                pages = [page async for page in aio.fetch_events(client,
+                    calendarId="work", start="11/04/2017", max_results=8)]
+
+                await asyncio.gather(*(aio.delete_event(client, event_id,
+                    calendarId="work") for event_id in event_ids[:5]))
+                remaining = [event async for page in aio.fetch_events(client,
+                    calendarId="work", start="11/04/2017") for event in page]
+                return event_ids, pages, remaining
+
+        event_ids, pages, remaining = run(scenario())
+        self.assertEqual(len(set(event_ids)), 20)
+        self.assertEqual([len(page) for page in pages], [8, 8, 4])
+        self.assertEqual([e["summary"] for page in pages for e in page],
+                ["Event {}".format(i) for i in range(20)])
+        self.assertEqual(len(remaining), 15)
+
+    def test_list_calendars(self):
+        async def scenario():
+            async with self.client() as client:
+                return [item async for item in aio.list_calendars(client)]
+        self.assertEqual(run(scenario()), [("Primary", "primary"), ("Work", "work")])
+
+    def test_retry_and_errors(self):
+        from apiclient.errors import HttpError
+
+        self.calendar.fail_next(503, count=2)
+        async def scenario():
+            async with self.client() as client:
+                calendars = [item async for item in aio.list_calendars(client)]
+                with self.assertRaises(HttpError) as context:
+                    await aio.delete_event(client, "unknown")
+                return calendars, context.exception
+        calendars, error = run(scenario())
+        self.assertEqual(len(calendars), 2)
+        self.assertEqual(error.resp.status, 404)
+
+    def test_concurrency_limit(self):
+        self.calendar.latency = 0.05
+        in_flight = []
+
+        async def scenario():
+            async with self.client(max_concurrency=4) as client:
+                send = client._client.request
+
+                async def tracking_send(*args, **kwargs):
+                    in_flight.append(None)
+                    peaks.append(len(in_flight))
+                    try:
+                        return await send(*args, **kwargs)
+                    finally:
+                        in_flight.pop()
+
+                client._client.request = tracking_send
+                await asyncio.gather(*(aio.create_event(client, summary=str(i),
+                    start="11/04/2017 10:00", end="11/04/2017 11:00")
+                    for i in range(12)))
+
+        peaks = []
+        run(scenario())
+        self.assertEqual(len(self.calendar.events()), 12)
+        self.assertEqual(max(peaks), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import random
+import datetime
+import unittest
+
+from gcalendar import availability, methods
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+def timestamp(hour, minute=0):
+    return "2017-04-11T{:02d}:{:02d}:00.000000Z".format(hour, minute)
+
+
+class IntervalIndexTestCase(unittest.TestCase):
+    def test_overlapping(self):
+        index = availability.IntervalIndex([
+            (timestamp(8), timestamp(10), "a"),
+            (timestamp(9), timestamp(9, 30), "b"),
+            (timestamp(10), timestamp(11), "c"),
+            (timestamp(7), timestamp(18), "d"),
+            ])
+        self.assertEqual(index.overlapping(timestamp(9, 45), timestamp(10)),
+                ["d", "a"])
+        self.assertEqual(index.overlapping(timestamp(10), timestamp(10, 1)),
+                ["d", "c"])
+        self.assertEqual(index.overlapping(timestamp(18), timestamp(19)), [])
+        self.assertEqual(len(index), 4)
+
+    def test_matches_linear_scan(self):
+        generator = random.Random(42)
+        intervals = []
+        for i in range(500):
+            start = generator.randrange(0, 24 * 60 - 1)
+            end = start + generator.randrange(1, 240)
+            intervals.append((start, min(end, 24 * 60), i))
+        index = availability.IntervalIndex(intervals)
+
+        for _ in range(200):
+            start = generator.randrange(0, 24 * 60)
+            end = start + generator.randrange(1, 60)
+            expected = sorted((s, e, i) for s, e, i in intervals
+                    if s < end and e > start)
+            self.assertEqual(sorted(index.overlapping(start, end)),
+                    sorted(i for _, _, i in expected))
+
+    def test_free_slots(self):
+        index = availability.IntervalIndex([
+            (timestamp(9), timestamp(10), "a"),
+            (timestamp(9, 30), timestamp(11), "b"),
+            (timestamp(13), timestamp(13, 15), "c"),
+            ])
+        self.assertEqual(index.free_slots(timestamp(8), timestamp(14)), [
+            (timestamp(8), timestamp(9)),
+            (timestamp(11), timestamp(13)),
+            (timestamp(13, 15), timestamp(14)),
+            ])
+        self.assertEqual(index.free_slots(timestamp(8), timestamp(14),
+            min_duration=datetime.timedelta(hours=1)), [
+            (timestamp(8), timestamp(9)),
+            (timestamp(11), timestamp(13)),
+            ])
+
+
+class AvailabilityTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp({"alice": "Alice", "bob": "Bob"})
+        self.service = build_fake_service(self.http)
+        self.http.add_event("alice", summary="Standup",
+                start={"dateTime": "2017-04-11T09:00:00Z"},
+                end={"dateTime": "2017-04-11T09:15:00Z"})
+        self.http.add_event("bob", summary="Lunch",
+                start={"dateTime": "2017-04-11T12:00:00Z"},
+                end={"dateTime": "2017-04-11T13:00:00Z"})
+        self.http.add_event("bob", summary="Reminder", transparency="transparent",
+                start={"dateTime": "2017-04-11T15:00:00Z"},
+                end={"dateTime": "2017-04-11T16:00:00Z"})
+
+    def test_find_free_slots(self):
+        slots = availability.find_free_slots(self.service, ["alice", "bob"],
+                start="11/04/2017")
+        self.assertEqual(slots, [
+            ("2017-04-11T00:00:00.000000Z", "2017-04-11T09:00:00.000000Z"),
+            ("2017-04-11T09:15:00.000000Z", "2017-04-11T12:00:00.000000Z"),
+            ("2017-04-11T13:00:00.000000Z", "2017-04-12T00:00:00.000000Z"),
+            ])
+        self.assertEqual(len(self.http.requests), 1)
+
+    def test_busy_items_are_calendars(self):
+        index = availability.query_busy(self.service, ["alice", "bob", "carol"],
+                start="11/04/2017")
+        self.assertEqual(index.overlapping("2017-04-11T08:00:00.000000Z",
+            "2017-04-11T12:30:00.000000Z"), ["alice", "bob"])
+
+    def test_busy_times_with_offsets(self):
+        self.http.add_event("alice", summary="Early call",
+                start={"dateTime": "2017-04-11T10:00:00+05:00"},
+                end={"dateTime": "2017-04-11T10:30:00+05:00"})
+        self.http.add_event("alice", summary="Late call",
+                start={"dateTime": "2017-04-12T01:00:00+02:00"},
+                end={"dateTime": "2017-04-12T01:30:00+02:00"})
+        response = self.service.freebusy().query(body={
+            "timeMin": "2017-04-11T00:00:00Z",
+            "timeMax": "2017-04-12T00:00:00Z",
+            "items": [{"id": "alice"}]}).execute()
+        self.assertEqual(response["calendars"]["alice"]["busy"], [
+            {"start": timestamp(5), "end": timestamp(5, 30)},
+            {"start": timestamp(9), "end": timestamp(9, 15)},
+            {"start": timestamp(23), "end": timestamp(23, 30)},
+            ])
+
+    def test_create_event_conflict_check(self):
+        index = availability.IntervalIndex.from_events(methods.fetch_events(
+            self.service, calendarId="bob", start="11/04/2017"))
+        nr_requests = len(self.http.requests)
+
+        with self.assertRaises(availability.ConflictError) as context:
+            methods.create_event(self.service, calendarId="bob",
+                    start="11/04/2017 12:30:00", end="11/04/2017 14:00:00",
+                    conflicts=index)
+        self.assertEqual([e["summary"] for e in context.exception.conflicts],
+                ["Lunch"])
+        self.assertEqual(len(self.http.requests), nr_requests)
+
+        methods.create_event(self.service, calendarId="bob",
+                start="11/04/2017 15:00:00", end="11/04/2017 16:00:00",
+                conflicts=index)
+        self.assertEqual(len(self.http.requests), nr_requests + 1)
+
+        # all-day events overlap every interval of their day
+        with self.assertRaises(availability.ConflictError):
+            methods.create_event(self.service, calendarId="bob",
+                    start={"date": "2017-04-11"}, end={"date": "2017-04-12"},
+                    conflicts=index)
+        methods.create_event(self.service, calendarId="bob",
+                start={"date": "2017-04-12"}, end={"date": "2017-04-13"},
+                conflicts=index)
+        self.assertEqual(len(self.http.requests), nr_requests + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
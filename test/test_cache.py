@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gcalendar.cache import EventCache
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+class EventCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.cache = EventCache(":memory:")
+        self.morning = self.http.add_event(summary="Morning",
+                start={"dateTime": "2017-04-11T10:00:00+02:00"},
+                end={"dateTime": "2017-04-11T11:00:00+02:00"})
+        self.http.add_event(summary="Holiday", start={"date": "2017-04-12"},
+                end={"date": "2017-04-13"})
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_full_sync(self):
+        self.assertEqual(self.cache.sync(self.service), 2)
+        events = self.cache.fetch_events(start="11/04/2017", end="12/04/2017")
+        self.assertEqual([e["summary"] for e in events], ["Morning", "Holiday"])
+        self.assertEqual(self.cache.get_event(self.morning["id"]), self.morning)
+        self.assertIsNone(self.cache.get_event("nonexisting"))
+
+    def test_range_query_is_local(self):
+        self.cache.sync(self.service)
+        nr_requests = len(self.http.requests)
+        events = self.cache.fetch_events(start="12/04/2017")
+        self.assertEqual([e["summary"] for e in events], ["Holiday"])
+        self.assertEqual(len(self.http.requests), nr_requests)
+
+    def test_incremental_sync(self):
+        self.cache.sync(self.service)
+        self.http.delete_event("primary", self.morning["id"])
+        self.http.add_event(summary="Evening",
+                start={"dateTime": "2017-04-11T18:00:00Z"},
+                end={"dateTime": "2017-04-11T19:00:00Z"})
+
+        self.assertEqual(self.cache.sync(self.service), 2)
+        params = self.http.requests[-1][2]
+        self.assertIn("syncToken", params)
+        events = self.cache.fetch_events(start="11/04/2017")
+        self.assertEqual([e["summary"] for e in events], ["Evening"])
+
+        self.assertEqual(self.cache.sync(self.service), 0)
+
+    def test_expired_sync_token(self):
+        self.cache.sync(self.service)
+        self.cache._connection.execute("UPDATE sync_tokens SET token = 'stale'")
+        self.assertEqual(self.cache.sync(self.service), 2)
+        self.assertNotEqual(self.cache.sync_token(), "stale")
+        self.assertEqual(len(self.cache.fetch_events(start="11/04/2017",
+            end="12/04/2017")), 2)
+
+    def test_persistence(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "sub", "events.sqlite")
+
+        cache = EventCache(path)
+        cache.sync(self.service)
+        cache.close()
+
+        cache = EventCache(path)
+        self.assertIsNotNone(cache.sync_token())
+        self.assertEqual(len(cache.fetch_events(start="11/04/2017")), 1)
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
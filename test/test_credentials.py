@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import os
+import fcntl
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+from oauth2client import client
+
+from gcalendar import credentials, utils
+
+NOW = datetime.datetime(2017, 4, 11, 10, 0)
+
+
+class FakeCredentials(object):
+    def __init__(self, expires_in=3600, fail=False):
+        self.access_token = "token"
+        self.token_expiry = NOW + datetime.timedelta(seconds=expires_in)
+        self.invalid = False
+        self.fail = fail
+        self.refreshes = 0
+
+    def refresh(self, http):
+        if self.fail:
+            raise client.HttpAccessTokenRefreshError("refresh failed")
+        self.refreshes += 1
+        self.token_expiry = NOW + datetime.timedelta(seconds=3600)
+
+
+class CredentialCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = credentials.CredentialCache(refresh_margin=300,
+                http_factory=object, utcnow=lambda: NOW)
+        self.addCleanup(self.cache.clear)
+
+    def test_loaded_once(self):
+        loads = []
+        def load():
+            loads.append(FakeCredentials())
+            return loads[-1]
+        first = self.cache.get("key", load)
+        self.assertIs(self.cache.get("key", load), first)
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(first.refreshes, 0)
+
+    def test_refreshed_before_expiry(self):
+        expiring = self.cache.get("key", lambda: FakeCredentials(expires_in=60))
+        self.assertEqual(expiring.refreshes, 1)
+
+        timer = self.cache._timers["key"]
+        self.assertEqual(timer.interval, 3600 - 300)
+        self.assertTrue(timer.daemon)
+
+        self.cache._refresh_in_background("key", expiring)
+        self.assertEqual(expiring.refreshes, 2)
+        self.assertIsNot(self.cache._timers["key"], timer)
+        # the previous timer is cancelled
+        self.assertTrue(timer.finished.is_set())
+
+    def test_failed_background_refresh_is_retried(self):
+        failing = self.cache.get("key", lambda: FakeCredentials())
+        failing.fail = True
+        with self.assertLogs("gcalendar.credentials", "WARNING"):
+            self.cache._refresh_in_background("key", failing)
+        self.assertEqual(self.cache._timers["key"].interval,
+                credentials.RETRY_INTERVAL)
+
+    def test_clear(self):
+        self.cache.get("key", lambda: FakeCredentials())
+        timer = self.cache._timers["key"]
+        self.cache.clear()
+        self.assertTrue(timer.finished.is_set())
+        self.assertEqual(self.cache._timers, {})
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "credentials.json")
+        self.stored = client.OAuth2Credentials("token", "client-id", "secret",
+                "refresh-token", datetime.datetime.utcnow() +
+                datetime.timedelta(hours=1), "https://example.com/token", None)
+        credentials.locked_storage(self.path).put(self.stored)
+
+    def test_locked_against_other_processes(self):
+        storage = credentials.locked_storage(self.path)
+        storage.acquire_lock()
+        try:
+            # a separate open file description, as in another process
+            with open(self.path + ".lock", "a") as f:
+                self.assertRaises(BlockingIOError, fcntl.flock, f,
+                        fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            storage.release_lock()
+
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_user_credentials_cached(self):
+        cache = credentials.CredentialCache()
+        self.addCleanup(cache.clear)
+        first = credentials.user_credentials(path=self.path, cache=cache)
+        self.assertEqual(first.access_token, "token")
+        os.remove(self.path)
+        self.assertIs(credentials.user_credentials(path=self.path, cache=cache),
+                first)
+
+
+class SelectionTestCase(unittest.TestCase):
+    def test_client_secret_file(self):
+        with mock.patch.dict(os.environ, {credentials.CLIENT_SECRET_VARIABLE:
+                "/etc/gcalendar/secret.json"}):
+            self.assertEqual(credentials.client_secret_file(),
+                    "/etc/gcalendar/secret.json")
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(credentials.client_secret_file(),
+                    credentials.CLIENT_SECRET_FILE)
+        self.assertNotIn("..", credentials.CLIENT_SECRET_FILE)
+
+    def test_service_account_from_environment(self):
+        cache = credentials.CredentialCache(utcnow=lambda: NOW)
+        self.addCleanup(cache.clear)
+        account = FakeCredentials()
+        account.create_delegated = lambda subject: account
+
+        with mock.patch.dict(os.environ, {credentials.SERVICE_ACCOUNT_VARIABLE:
+                "/keys/worker.json"}), \
+                mock.patch.object(credentials, "default_cache", cache), \
+                mock.patch("oauth2client.service_account.ServiceAccountCredentials"
+                    ".from_json_keyfile_name", return_value=account) as load:
+            self.assertIs(utils.get_credentials(subject="a@b.com"), account)
+            self.assertIs(utils.get_credentials(subject="a@b.com"), account)
+        load.assert_called_once_with("/keys/worker.json", utils.SCOPES)
+
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertRaises(ValueError, credentials.service_account_credentials)
+
+
+if __name__ == '__main__':
+    unittest.main()
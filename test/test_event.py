@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+import sys
+import datetime
+import unittest
+
+from gcalendar import methods
+from gcalendar.event import Event
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+UTC = datetime.timezone.utc
+
+
+def api_event(event_id="e1", hour=9, **fields):
+    event = {
+        "id": event_id,
+        "summary": "Meeting",
+        "status": "confirmed",
+        "location": "Room 1",
+        "start": {"dateTime": "2017-04-11T{:02d}:00:00+02:00".format(hour)},
+        "end": {"dateTime": "2017-04-11T{:02d}:00:00Z".format(hour)},
+        }
+    event.update(fields)
+    return event
+
+
+class EventTestCase(unittest.TestCase):
+    def test_parsed_times(self):
+        event = Event(api_event())
+        self.assertEqual(event.start, datetime.datetime(2017, 4, 11, 7, tzinfo=UTC))
+        self.assertEqual(event.end, datetime.datetime(2017, 4, 11, 9, tzinfo=UTC))
+        self.assertEqual(event.duration(), datetime.timedelta(hours=2))
+        self.assertFalse(event.all_day)
+
+        event = Event(api_event(start={"date": "2017-04-11"},
+            end={"date": "2017-04-12"}))
+        self.assertTrue(event.all_day)
+        self.assertEqual(event.start, datetime.datetime(2017, 4, 11, tzinfo=UTC))
+
+    def test_lazy_fields(self):
+        raw = api_event(attendees=[{"email": "a@b.com"}])
+        event = Event(raw)
+        self.assertEqual(event.summary, "Meeting")
+        self.assertEqual(event.location, "Room 1")
+        self.assertEqual(event.attendees, [{"email": "a@b.com"}])
+        self.assertIsNone(event.get("description"))
+        self.assertRaises(AttributeError, getattr, event, "description")
+        self.assertEqual(event.raw(), raw)
+
+        event = Event(raw, keep_raw=False)
+        self.assertEqual(event.summary, "Meeting")
+        self.assertRaises(AttributeError, getattr, event, "location")
+
+    def test_slots(self):
+        event = Event(api_event())
+        self.assertFalse(hasattr(event, "__dict__"))
+        self.assertRaises(AttributeError, setattr, event, "foo", 1)
+        # smaller than the nested dicts of the raw event
+        raw = api_event()
+        raw_size = sys.getsizeof(raw) + sum(sys.getsizeof(value)
+                for value in raw.values())
+        self.assertLess(sys.getsizeof(event), raw_size)
+
+    def test_ordering(self):
+        events = [Event(api_event("b", hour=10)), Event(api_event("a", hour=10)),
+                Event(api_event("c", hour=8))]
+        self.assertEqual([event.id for event in sorted(events)], ["c", "a", "b"])
+        self.assertEqual(Event(api_event()), Event(api_event()))
+        self.assertTrue(events[0].overlaps(datetime.datetime(2017, 4, 11, 9,
+            tzinfo=UTC), datetime.datetime(2017, 4, 11, 12, tzinfo=UTC)))
+
+
+class CompactFetchTestCase(unittest.TestCase):
+    def test_fetch_events_compact(self):
+        http = FakeCalendarHttp()
+        for hour in (9, 11):
+            http.add_event(summary="Event {}".format(hour),
+                    start={"dateTime": "2017-04-11T{:02d}:00:00Z".format(hour)},
+                    end={"dateTime": "2017-04-11T{:02d}:30:00Z".format(hour)})
+        service = build_fake_service(http)
+
+        events = methods.fetch_events(service, start="11/04/2017",
+                max_results=1, compact=True)
+        self.assertTrue(all(isinstance(event, Event) for event in events))
+        self.assertEqual([event.summary for event in events],
+                ["Event 9", "Event 11"])
+        self.assertEqual(events[0].start.hour, 9)
+
+        results = methods.fetch_events_many(service, ["primary"],
+                start="11/04/2017", http_factory=lambda: http, compact=True)
+        self.assertEqual([event.summary for _, event in results],
+                ["Event 9", "Event 11"])
+
+
+if __name__ == '__main__':
+    unittest.main()
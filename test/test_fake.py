@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import unittest
+from unittest import mock
+
+import httplib2
+
+from gcalendar import methods, scheduler, utils
+from gcalendar.fake import FakeCalendarHttp, FakeCalendarServer, DISCOVERY_PATH
+
+
+class FakeCalendarServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar = FakeCalendarHttp({"primary": "Primary", "work": "Work"})
+        self.server = FakeCalendarServer(self.calendar).start()
+        self.addCleanup(self.server.stop)
+        self.service = utils.build_service(root_url=self.server.url)
+
+    def test_events_over_http(self):
+        for i in range(5):
+            methods.create_event(self.service, summary="Event {}".format(i),
+                    start="11/04/2017 {:02d}:00".format(8 + i),
+                    end="11/04/2017 {:02d}:30".format(8 + i))
+        self.assertEqual(len(self.calendar.events()), 5)
+
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                max_results=2)
+        self.assertEqual([e["summary"] for e in events],
+                ["Event {}".format(i) for i in range(5)])
+        # three pages
+        self.assertEqual(sum(1 for method, path, _ in self.calendar.requests
+            if method == "GET" and path.endswith("/events")), 3)
+
+        results = methods.delete_events(self.service, [e["id"] for e in events])
+        self.assertTrue(all(result.exception is None for result in results))
+        self.assertEqual(methods.fetch_events(self.service, start="11/04/2017"), [])
+
+    def test_calendar_list(self):
+        self.assertEqual(list(methods.list_calendars(self.service)),
+                [("Primary", "primary"), ("Work", "work")])
+
+    def test_discovery_document(self):
+        response, content = httplib2.Http().request(self.server.url +
+                DISCOVERY_PATH.lstrip("/"))
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(content.decode("utf-8"))["rootUrl"],
+                self.server.url)
+
+    def test_environment_variable(self):
+        with mock.patch.dict(os.environ, {utils.API_URL_VARIABLE: self.server.url}):
+            service = utils.build_service()
+        self.assertEqual(len(list(methods.list_calendars(service))), 2)
+
+
+class FaultInjectionTestCase(unittest.TestCase):
+    def test_latency(self):
+        http = FakeCalendarHttp(latency=0.05)
+        start = time.time()
+        http.request("/calendar/v3/users/me/calendarList")
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+    def test_error_rate(self):
+        http = FakeCalendarHttp(error_rate=0.5, seed=1)
+        statuses = [http.request("/calendar/v3/users/me/calendarList")[0].status
+                for _ in range(100)]
+        self.assertTrue(20 < statuses.count(503) < 80)
+        self.assertEqual(statuses.count(503) + statuses.count(200), 100)
+
+    def test_retried_through_server(self):
+        calendar = FakeCalendarHttp(error_rate=0.3, seed=3)
+        with FakeCalendarServer(calendar) as server:
+            service = utils.build_service(root_url=server.url)
+            with mock.patch.object(methods.scheduler, "default_scheduler",
+                    scheduler.RequestScheduler(max_retries=10, sleep=lambda _: None)):
+                for i in range(10):
+                    methods.create_event(service, summary=str(i),
+                            start="11/04/2017 10:00", end="11/04/2017 11:00")
+        self.assertEqual(len(calendar.events()), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import re
+import unittest
+
+from gcalendar import filters
+
+EVENT = {
+    "id": "event1",
+    "summary": "Weekly Standup",
+    "location": "Room 1",
+    "organizer": {"email": "alice@example.com"},
+    "start": {"dateTime": "2017-04-11T10:00:00+02:00"},
+    "end": {"dateTime": "2017-04-11T10:15:00+02:00"},
+    "extendedProperties": {"private": {"source": "import"}},
+    }
+
+
+class FilterTestCase(unittest.TestCase):
+    def test_predicates(self):
+        self.assertTrue(filters.equals("organizer.email",
+            "alice@example.com")(EVENT))
+        self.assertFalse(filters.equals("organizer.name", "Alice")(EVENT))
+        self.assertTrue(filters.one_of("id", ["event1", "event2"])(EVENT))
+        self.assertTrue(filters.exists("location")(EVENT))
+        self.assertFalse(filters.exists("description")(EVENT))
+        self.assertTrue(filters.contains("summary", "standup")(EVENT))
+        self.assertFalse(filters.contains("summary", "standup",
+            ignore_case=False)(EVENT))
+        self.assertTrue(filters.matches("summary", "^weekly", re.I)(EVENT))
+        self.assertFalse(filters.matches("description", ".")(EVENT))
+        self.assertTrue(filters.private_property("source", "import")(EVENT))
+        self.assertTrue(filters.starts_before("2017-04-11T08:30:00Z")(EVENT))
+        self.assertFalse(filters.ends_after("2017-04-11T08:15:00Z")(EVENT))
+
+    def test_composition(self):
+        standup = filters.contains("summary", "standup")
+        remote = filters.contains("location", "online")
+        self.assertTrue((standup & ~remote)(EVENT))
+        self.assertFalse((standup & remote)(EVENT))
+        self.assertTrue((remote | standup)(EVENT))
+        self.assertEqual((standup & ~filters.equals("organizer.email",
+            "bob@example.com") | remote).fields,
+            frozenset(["summary", "organizer/email", "location"]))
+
+        custom = filters.where(lambda event: len(event["summary"]) > 10,
+                "summary")
+        self.assertTrue(custom(EVENT))
+        self.assertEqual(custom.fields, frozenset(["summary"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gcalendar import ics, main, methods, scheduler
+from gcalendar.utils import utc_timestamp
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+ICS_DATA = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VEVENT\r
+UID:talk-1@example.com\r
+SUMMARY:Talk\\, part 1\r
+DESCRIPTION:A long desc\r
+ ription\r
+DTSTART;TZID=Europe/Berlin:20170411T100000\r
+DTEND:20170411T090000Z\r
+ATTENDEE;CN=Alice:mailto:alice@example.com\r
+BEGIN:VALARM\r
+ACTION:DISPLAY\r
+DESCRIPTION:Reminder\r
+END:VALARM\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Holiday\r
+DTSTART;VALUE=DATE:20170414\r
+TRANSP:TRANSPARENT\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:standup@example.com\r
+SUMMARY:Standup\r
+DTSTART;TZID=Europe/Berlin:20170410T090000\r
+DTEND;TZID=Europe/Berlin:20170410T091500\r
+RRULE:FREQ=DAILY;COUNT=5\r
+EXDATE;TZID=Europe/Berlin:20170412T090000\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+OUTLOOK_DATA = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VTIMEZONE\r
+TZID:W. Europe Standard Time\r
+X-MICROSOFT-CDO-TZID:4\r
+BEGIN:STANDARD\r
+DTSTART:16010101T030000\r
+TZOFFSETFROM:+0200\r
+TZOFFSETTO:+0100\r
+RRULE:FREQ=YEARLY;INTERVAL=1;BYDAY=-1SU;BYMONTH=10\r
+END:STANDARD\r
+BEGIN:DAYLIGHT\r
+DTSTART:16010101T020000\r
+TZOFFSETFROM:+0100\r
+TZOFFSETTO:+0200\r
+RRULE:FREQ=YEARLY;INTERVAL=1;BYDAY=-1SU;BYMONTH=3\r
+END:DAYLIGHT\r
+END:VTIMEZONE\r
+BEGIN:VEVENT\r
+UID:review@example.com\r
+SUMMARY:Review\r
+DTSTART;TZID="W. Europe Standard Time":20170411T100000\r
+DTEND;TZID="W. Europe Standard Time":20170411T110000\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:jour-fixe@example.com\r
+SUMMARY:Jour fixe\r
+DTSTART;TZID=W. Europe Standard Time:20170110T090000\r
+DTEND;TZID=W. Europe Standard Time:20170110T100000\r
+RRULE:FREQ=WEEKLY;COUNT=4\r
+EXDATE;TZID=W. Europe Standard Time:20170117T090000\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+UID:call@example.com\r
+SUMMARY:Call\r
+DTSTART;TZID=Undefined Time:20170412T100000\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class ReadEventsTestCase(unittest.TestCase):
+    def test_read_events(self):
+        talk, holiday, standup = ics.read_events(io.StringIO(ICS_DATA))
+
+        self.assertEqual(talk["iCalUID"], "talk-1@example.com")
+        self.assertEqual(talk["summary"], "Talk, part 1")
+        self.assertEqual(talk["description"], "A long description")
+        self.assertEqual(talk["start"], {"dateTime": "2017-04-11T10:00:00+02:00",
+            "timeZone": "Europe/Berlin"})
+        self.assertEqual(talk["end"], {"dateTime": "2017-04-11T09:00:00Z"})
+        self.assertEqual(talk["attendees"], [{"email": "alice@example.com"}])
+
+        self.assertEqual(holiday["start"], {"date": "2017-04-14"})
+        self.assertEqual(holiday["end"], {"date": "2017-04-15"})
+        self.assertEqual(holiday["transparency"], "transparent")
+        self.assertTrue(holiday["iCalUID"].endswith("@gcalendar"))
+
+        self.assertEqual(standup["recurrence"], ["RRULE:FREQ=DAILY;COUNT=5",
+            "EXDATE;TZID=Europe/Berlin:20170412T090000"])
+
+    def test_time_zones_of_vtimezone(self):
+        with self.assertLogs("gcalendar.ics", "WARNING") as logs:
+            review, jour_fixe, call = ics.read_events(
+                    io.StringIO(OUTLOOK_DATA))
+        self.assertEqual(review["start"], {"dateTime": "2017-04-11T08:00:00Z"})
+        self.assertEqual(review["end"], {"dateTime": "2017-04-11T09:00:00Z"})
+
+        # in winter, expanded in UTC as the API requires a time zone
+        self.assertEqual(jour_fixe["start"], {"dateTime":
+            "2017-01-10T08:00:00Z", "timeZone": "UTC"})
+        self.assertEqual(jour_fixe["recurrence"], ["RRULE:FREQ=WEEKLY;COUNT=4",
+            "EXDATE:20170117T080000Z"])
+
+        self.assertEqual(call["start"], {"dateTime": "2017-04-12T10:00:00Z"})
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("Undefined Time", logs.output[0])
+
+    def test_lazy(self):
+        def lines():
+            yield "BEGIN:VEVENT\r\n"
+            yield "DTSTART:20170411T100000Z\r\n"
+            yield "END:VEVENT\r\n"
+            # one line is read ahead to unfold
+            yield "BEGIN:VEVENT\r\n"
+            raise AssertionError("read too far")
+        self.assertEqual(next(ics.read_events(lines()))["start"],
+                {"dateTime": "2017-04-11T10:00:00Z"})
+
+
+class WriteEventsTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        events = list(ics.read_events(io.StringIO(ICS_DATA)))
+        lines = list(ics.write_events(events))
+        self.assertEqual(lines[0], "BEGIN:VCALENDAR\r\n")
+        self.assertEqual(lines[-1], "END:VCALENDAR\r\n")
+        # single events in UTC, recurring ones in their time zone
+        self.assertIn("DTSTART:20170411T080000Z\r\n", lines)
+        self.assertIn("DTSTART;TZID=Europe/Berlin:20170410T090000\r\n", lines)
+        self.assertIn("SUMMARY:Talk\\, part 1\r\n", lines)
+        self.assertIn("DTSTART;VALUE=DATE:20170414\r\n", lines)
+
+        self.assertEqual(lines.count("BEGIN:VTIMEZONE\r\n"), 1)
+        vtimezone = lines[lines.index("BEGIN:VTIMEZONE\r\n"):
+                lines.index("END:VTIMEZONE\r\n")]
+        self.assertLess(lines.index("END:VTIMEZONE\r\n"),
+                lines.index("DTSTART;TZID=Europe/Berlin:20170410T090000\r\n"))
+        self.assertIn("TZID:Europe/Berlin\r\n", vtimezone)
+        self.assertIn("RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU\r\n", vtimezone)
+        self.assertIn("TZOFFSETTO:+0200\r\n", vtimezone)
+
+        again = list(ics.read_events(lines))
+        self.assertEqual(len(again), 3)
+        for field in ("iCalUID", "summary", "recurrence", "attendees"):
+            self.assertEqual([e.get(field) for e in again],
+                    [e.get(field) for e in events])
+        for field in ("start", "end"):
+            self.assertEqual([utc_timestamp(e[field]) for e in again],
+                    [utc_timestamp(e[field]) for e in events])
+        self.assertEqual(again[2]["start"], events[2]["start"])
+
+    def test_cancelled_instances(self):
+        series = {"id": "standup", "iCalUID": "standup@example.com",
+                "summary": "Standup", "recurrence": ["RRULE:FREQ=DAILY"],
+                "start": {"dateTime": "2017-04-10T09:00:00+02:00",
+                    "timeZone": "Europe/Berlin"},
+                "end": {"dateTime": "2017-04-10T09:15:00+02:00",
+                    "timeZone": "Europe/Berlin"}}
+        cancelled = {"id": "standup_20170412T070000Z", "status": "cancelled",
+                "recurringEventId": "standup", "originalStartTime": {
+                    "dateTime": "2017-04-12T09:00:00+02:00",
+                    "timeZone": "Europe/Berlin"}}
+        deleted = {"id": "single", "status": "cancelled"}
+
+        # listed before its recurring event
+        lines = list(ics.write_events([cancelled, deleted, series]))
+        text = "".join(lines)
+        self.assertEqual(text.count("BEGIN:VEVENT"), 2)
+        self.assertEqual(text.count("UID:standup@example.com"), 2)
+        instance = lines[lines.index("STATUS:CANCELLED\r\n") - 5:]
+        self.assertEqual(instance[:5], ["BEGIN:VEVENT\r\n",
+            "UID:standup@example.com\r\n", instance[2],
+            "RECURRENCE-ID;TZID=Europe/Berlin:20170412T090000\r\n",
+            "DTSTART;TZID=Europe/Berlin:20170412T090000\r\n"])
+
+        _, override = ics.read_events(lines)
+        self.assertEqual((override["status"], override["originalStartTime"]),
+                ("cancelled", cancelled["originalStartTime"]))
+
+    def test_fold(self):
+        line = "DESCRIPTION:" + "ä" * 100
+        folded = ics.fold(line)
+        parts = folded.split("\r\n")[:-1]
+        self.assertTrue(all(len(part.encode("utf-8")) <= 75 for part in parts))
+        self.assertEqual("".join(part[1:] if index else part
+            for index, part in enumerate(parts)), line)
+        self.assertEqual(ics.fold("SUMMARY:short"), "SUMMARY:short\r\n")
+
+
+class ImportExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        # the fake has no quota, send without rate limit
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_import_in_batches(self):
+        data = "".join("BEGIN:VEVENT\r\nUID:{0}@example.com\r\nSUMMARY:Event {0}\r\n"
+                "DTSTART:20170411T{1:02d}0000Z\r\nEND:VEVENT\r\n".format(i, i % 24)
+                for i in range(120))
+        result = ics.import_lines(self.service, io.StringIO(data))
+        self.assertEqual(result, (120, []))
+        self.assertEqual(len(self.http.events()), 120)
+        self.assertEqual(len(self.http.requests), 3)
+
+        # importing again updates the events
+        result = ics.import_lines(self.service, io.StringIO(data))
+        self.assertEqual(result.imported, 120)
+        self.assertEqual(len(self.http.events()), 120)
+
+    def test_import_non_iana_time_zones(self):
+        with self.assertLogs("gcalendar.ics", "WARNING"):
+            result = ics.import_lines(self.service, io.StringIO(OUTLOOK_DATA))
+        self.assertEqual(result, (3, []))
+        events = methods.fetch_events(self.service, start="11/04/2017")
+        self.assertEqual([(e["summary"], e["start"]) for e in events],
+                [("Review", {"dateTime": "2017-04-11T08:00:00Z"})])
+
+    def test_export_import_commands(self):
+        ics.import_lines(self.service, io.StringIO(ICS_DATA))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "export.ics")
+
+        args = main.build_parser().parse_args(["export", "10/04/2017",
+            "20/04/2017", "-o", path])
+        self.assertEqual(main.run_command(self.service, args), 0)
+        with open(path, newline="") as f:
+            exported = list(ics.read_events(f))
+        self.assertEqual(sorted(e["summary"] for e in exported),
+                ["Holiday", "Standup", "Talk, part 1"])
+
+        other = FakeCalendarHttp()
+        stream = io.StringIO()
+        args = main.build_parser().parse_args(["import", path])
+        self.assertEqual(main.run_command(build_fake_service(other), args,
+            stream), 0)
+        self.assertEqual(stream.getvalue(), '{"imported": 3, "failed": 0}\n')
+
+        instances = methods.fetch_events(build_fake_service(other),
+                start="10/04/2017", end="20/04/2017")
+        self.assertEqual([e["summary"] for e in instances],
+                ["Standup", "Standup", "Talk, part 1", "Standup", "Holiday",
+                    "Standup"])
+
+    def test_round_trip_of_modified_instances(self):
+        ics.import_lines(self.service, io.StringIO(ICS_DATA))
+        standup = next(event for event in self.http.events().values()
+                if event["summary"] == "Standup")
+        events = self.service.events()
+        events.delete(calendarId="primary",
+                eventId="{}_20170411T070000Z".format(standup["id"])).execute()
+        events.patch(calendarId="primary",
+                eventId="{}_20170413T070000Z".format(standup["id"]),
+                body={"summary": "Retro"}).execute()
+
+        lines = list(ics.export_lines(self.service, start="10/04/2017",
+            end="20/04/2017"))
+        self.assertIn("STATUS:CANCELLED\r\n", lines)
+
+        other = FakeCalendarHttp()
+        result = ics.import_lines(build_fake_service(other), lines)
+        self.assertEqual(result, (5, []))
+        instances = methods.fetch_events(build_fake_service(other),
+                start="10/04/2017", end="20/04/2017", q="Standup")
+        self.assertEqual([e["start"]["dateTime"][:10] for e in instances],
+                ["2017-04-10", "2017-04-14"])
+        retro = methods.fetch_events(build_fake_service(other),
+                start="13/04/2017", q="Retro")
+        self.assertEqual([e["start"]["dateTime"] for e in retro],
+                ["2017-04-13T09:00:00+02:00"])
+
+        # importing again finds the applied overrides
+        result = ics.import_lines(build_fake_service(other), lines)
+        self.assertEqual(result, (5, []))
+        self.assertEqual(len(methods.fetch_events(build_fake_service(other),
+            start="10/04/2017", end="20/04/2017", q="Standup")), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
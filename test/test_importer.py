@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+import io
+import unittest
+from unittest import mock
+
+from gcalendar import importer, scheduler
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+WORKING_HOURS = """# date hours
+10/04/2017 8
+11/04/2017 7.5
+invalid line
+12/04/2017 4
+"""
+
+CSV_DATA = """summary,start,end,location,attendees
+Meeting,11/04/2017 10:00:00,11/04/2017 11:00:00,Room 1,a@b.c; d@e.f
+Lunch,11/04/2017 12:00:00,11/04/2017 13:00:00,,
+"""
+
+ICS_DATA = """BEGIN:VCALENDAR\r
+BEGIN:VEVENT\r
+SUMMARY:Talk\\, part 1\r
+DESCRIPTION:A long desc\r
+ ription\r
+DTSTART;TZID=Europe/Berlin:20170411T100000\r
+DTEND:20170411T090000Z\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Holiday\r
+DTSTART;VALUE=DATE:20170414\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class ReaderTestCase(unittest.TestCase):
+    def test_read_txt(self):
+        records = list(importer.read_txt(io.StringIO(WORKING_HOURS), "Work"))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[1], dict(summary="Work",
+            start="11/04/2017 09:00:00", end="11/04/2017 16:30:00"))
+
+    def test_read_csv(self):
+        records = list(importer.read_csv(io.StringIO(CSV_DATA)))
+        self.assertEqual(records[0]["attendees"], ["a@b.c", "d@e.f"])
+        self.assertEqual(records[0]["location"], "Room 1")
+        self.assertEqual(records[1], dict(summary="Lunch",
+            start="11/04/2017 12:00:00", end="11/04/2017 13:00:00"))
+
+    def test_read_ics(self):
+        records = list(importer.read_ics(io.StringIO(ICS_DATA)))
+        self.assertEqual(records[0], dict(summary="Talk, part 1",
+            description="A long description", start="11/04/2017 08:00:00",
+            end="11/04/2017 09:00:00"))
+        self.assertEqual(records[1], dict(summary="Holiday",
+            start={"date": "2017-04-14"}, end={"date": "2017-04-15"}))
+
+    def test_derive_event_id(self):
+        event_id = importer.derive_event_id("primary", "key")
+        self.assertEqual(event_id, importer.derive_event_id("primary", "key"))
+        self.assertNotEqual(event_id, importer.derive_event_id("other", "key"))
+        self.assertEqual(len(event_id), 32)
+        self.assertTrue(set(event_id) <= set(importer.EVENT_ID_ALPHABET))
+
+
+class ImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.records = list(importer.read_txt(io.StringIO(WORKING_HOURS), "Work"))
+        # the fake has no quota, send without rate limit
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def date_key(self, record):
+        return record["start"].split()[0]
+
+    def test_rerun_is_single_list_call(self):
+        result = importer.import_events(self.service, self.records)
+        self.assertEqual(result, importer.ImportResult(3, 0, 0, 0, []))
+        self.assertEqual(len(self.http.events()), 3)
+
+        del self.http.requests[:]
+        result = importer.import_events(self.service, self.records)
+        self.assertEqual(result, importer.ImportResult(0, 0, 0, 3, []))
+        self.assertEqual([r[0] for r in self.http.requests], ["GET"])
+
+    def test_changed_records_are_patched(self):
+        importer.import_events(self.service, self.records, key=self.date_key)
+        self.records[0]["end"] = "10/04/2017 18:00:00"
+        self.records[1]["location"] = "Home"
+
+        del self.http.requests[:]
+        result = importer.import_events(self.service, self.records,
+                key=self.date_key)
+        self.assertEqual(result, importer.ImportResult(0, 2, 0, 1, []))
+        # one list and one batch request
+        self.assertEqual(len(self.http.requests), 2)
+        event_id = importer.derive_event_id("primary", "10/04/2017")
+        self.assertEqual(self.http.events()[event_id]["end"]["dateTime"],
+                "2017-04-10T18:00:00Z")
+
+    def test_delete_missing_and_restore(self):
+        importer.import_events(self.service, self.records)
+        other = self.http.add_event(summary="Unrelated",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+
+        result = importer.import_events(self.service,
+                [self.records[0], self.records[2]], delete_missing=True)
+        self.assertEqual(result, importer.ImportResult(0, 0, 1, 2, []))
+        self.assertEqual(self.http.events()[other["id"]]["status"], "confirmed")
+
+        result = importer.import_events(self.service, self.records)
+        self.assertEqual(result.inserted, 1)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(len(importer.methods.fetch_events(self.service,
+            start="10/04/2017", end="12/04/2017")), 4)
+
+    def test_all_day_events(self):
+        records = list(importer.read_ics(io.StringIO(ICS_DATA)))
+        result = importer.import_events(self.service, records)
+        self.assertEqual(result, importer.ImportResult(2, 0, 0, 0, []))
+        event_id = importer.derive_event_id("primary", importer.default_key(
+            records[1]))
+        event = self.http.events()[event_id]
+        self.assertEqual((event["start"], event["end"]), ({"date":
+            "2017-04-14"}, {"date": "2017-04-15"}))
+
+        result = importer.import_events(self.service, records)
+        self.assertEqual(result, importer.ImportResult(0, 0, 0, 2, []))
+
+    def test_failed_inserts_are_not_counted(self):
+        self.http.fail_next(400, reason="invalid")
+        with mock.patch.object(importer.methods, "iter_events",
+                return_value=[]):
+            result = importer.import_events(self.service, self.records)
+        self.assertEqual(result.inserted, 2)
+        self.assertEqual([exception.resp.status for _, exception in
+            result.failed], [400])
+
+    def test_failed_patches_are_not_counted(self):
+        importer.import_events(self.service, self.records, key=self.date_key)
+        existing = importer.methods.fetch_events(self.service,
+                start="10/04/2017", end="12/04/2017")
+        self.records[0]["location"] = "Home"
+        self.records[1]["location"] = "Home"
+
+        self.http.fail_next(400, reason="invalid")
+        with mock.patch.object(importer.methods, "iter_events",
+                return_value=existing):
+            result = importer.import_events(self.service, self.records[:2],
+                    key=self.date_key, delete_missing=True)
+        self.assertEqual(result[:4], (0, 1, 1, 0))
+        self.assertEqual([(event_id, exception.resp.status) for event_id,
+            exception in result.failed], [(importer.derive_event_id(
+                "primary", "10/04/2017"), 400)])
+
+        # the patch and the delete fail
+        existing = importer.methods.fetch_events(self.service,
+                start="10/04/2017", end="12/04/2017")
+        self.http.fail_next(400, count=2, reason="invalid")
+        with mock.patch.object(importer.methods, "iter_events",
+                return_value=existing):
+            result = importer.import_events(self.service, self.records[:1],
+                    key=self.date_key, delete_missing=True)
+        self.assertEqual(result[:4], (0, 0, 0, 0))
+        self.assertEqual([event_id for event_id, _ in result.failed],
+                [importer.derive_event_id("primary", date) for date in
+                    ("10/04/2017", "11/04/2017")])
+
+    def test_empty_import(self):
+        result = importer.import_events(self.service, [])
+        self.assertEqual(result, importer.ImportResult(0, 0, 0, 0, []))
+        self.assertEqual(self.http.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from gcalendar import instrumentation, main, methods, scheduler, utils
+from gcalendar.fake import FakeCalendarHttp, FakeCalendarServer, build_fake_service
+
+
+class HookTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp({"primary": "Primary", "work": "Work"})
+        self.service = build_fake_service(self.http)
+        for hour in range(8, 13):
+            self.http.add_event("work", summary="Event {}".format(hour),
+                    start={"dateTime": "2017-04-11T{:02d}:00:00Z".format(hour)},
+                    end={"dateTime": "2017-04-11T{:02d}:30:00Z".format(hour)})
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler(sleep=lambda _: None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.records = []
+        instrumentation.add_hook(self.records.append)
+        self.addCleanup(instrumentation.remove_hook, self.records.append)
+
+    def test_list_pages(self):
+        self.http.fail_next(503)
+        methods.fetch_events(self.service, calendarId="work", start="11/04/2017",
+                max_results=2)
+        self.assertEqual(len(self.records), 3)
+        self.assertTrue(all(r.method == "calendar.events.list" and
+            r.calendarId == "work" and r.pages == 1 and r.bytes > 0 and
+            r.error is None for r in self.records))
+        self.assertEqual([r.retries for r in self.records], [1, 0, 0])
+
+    def test_error(self):
+        self.assertRaises(Exception, methods.get_event, self.service, "unknown")
+        record, = self.records
+        self.assertEqual(record.method, "calendar.events.get")
+        self.assertEqual(record.calendarId, "primary")
+        self.assertEqual(record.error.resp.status, 404)
+        self.assertEqual(record.pages, 0)
+
+    def test_batch_calls(self):
+        event_ids = list(self.http.events("work"))[:3]
+        self.http.fail_next(503)
+        methods.delete_events(self.service, event_ids + ["unknown"],
+                calendarId="work")
+        deletes = [r for r in self.records if r.method == "calendar.events.delete"]
+        self.assertEqual([r.retries for r in deletes], [1, 0, 0, 0])
+        self.assertEqual([r.error is None for r in deletes],
+                [True, True, True, False])
+        self.assertEqual(len([r for r in self.records if r.method == "batch"]), 2)
+
+    def test_metrics(self):
+        metrics = instrumentation.Metrics()
+        instrumentation.add_hook(metrics)
+        self.addCleanup(instrumentation.remove_hook, metrics)
+        methods.fetch_events(self.service, calendarId="work", start="11/04/2017",
+                max_results=2)
+        list(methods.list_calendars(self.service))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["calendar.events.list"]["calls"], 3)
+        self.assertEqual(snapshot["calendar.events.list"]["pages"], 3)
+        self.assertEqual(snapshot["calendar.calendarList.list"]["calls"], 1)
+
+        text = metrics.openmetrics()
+        self.assertIn('gcalendar_api_calls_total{method="calendar.events.list"} 3',
+                text)
+        self.assertTrue(text.endswith("# EOF\n"))
+        self.assertIn("calendar.calendarList.list", metrics.summary())
+
+    def test_calendar_id(self):
+        self.assertEqual(instrumentation.calendar_id(
+            "https://www.googleapis.com/calendar/v3/calendars/a%40b.com/events"
+            "?alt=json"), "a@b.com")
+        self.assertIsNone(instrumentation.calendar_id(
+            "https://www.googleapis.com/calendar/v3/users/me/calendarList"))
+
+
+class CommandMetricsTestCase(unittest.TestCase):
+    def test_stats_and_metrics_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "metrics.prom")
+        with FakeCalendarServer() as server, \
+                mock.patch.dict(os.environ, {utils.API_URL_VARIABLE: server.url}), \
+                mock.patch("sys.stdout", io.StringIO()), \
+                mock.patch("sys.stderr", io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as context:
+                main.main(["--stats", "--metrics-file", path, "calendars"])
+        self.assertEqual(context.exception.code, 0)
+        self.assertIn("calendar.calendarList.list", stderr.getvalue())
+        with open(path) as f:
+            self.assertIn("gcalendar_api_calls_total", f.read())
+        self.assertFalse(instrumentation.enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from gcalendar import journal, main, scheduler
+from gcalendar.journal import Write, INSERT, UPDATE, PATCH, DELETE
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+START = "11/04/2017 10:00:00"
+END = "11/04/2017 11:00:00"
+
+
+class MergeTestCase(unittest.TestCase):
+    def test_merge(self):
+        insert = Write(INSERT, "primary", "a", {"id": "a", "summary": "A",
+            "location": "Room"}, None)
+        patch = Write(PATCH, "primary", "a", {"summary": "B",
+            "location": None}, '"2"')
+        delete = Write(DELETE, "primary", "a", None, None)
+
+        self.assertEqual(journal.merge(None, patch), patch)
+        self.assertEqual(journal.merge(insert, patch).body,
+                {"id": "a", "summary": "B"})
+        self.assertIsNone(journal.merge(insert, delete))
+        self.assertEqual(journal.merge(patch, delete), delete)
+
+        first = patch._replace(body={"summary": "C", "colorId": "1"},
+                etag='"1"')
+        merged = journal.merge(first, patch)
+        self.assertEqual(merged, Write(PATCH, "primary", "a", {"summary": "B",
+            "location": None, "colorId": "1"}, '"1"'))
+
+        restored = journal.merge(delete, insert)
+        self.assertEqual(restored.operation, UPDATE)
+        self.assertEqual(restored.body["status"], "confirmed")
+        with self.assertLogs("gcalendar.journal", "WARNING"):
+            self.assertEqual(journal.merge(delete, patch), delete)
+
+
+class WriteJournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.journal = journal.WriteJournal(":memory:")
+        self.addCleanup(self.journal.close)
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler(max_retries=1, sleep=lambda _: None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_coalesced_into_one_batch(self):
+        existing = self.http.add_event(id="existing", summary="Existing",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+        event_id = self.journal.create_event(summary="Draft", start=START,
+                end=END)
+        self.journal.patch_event(dict(id=event_id), dict(id=event_id,
+            summary="Meeting"))
+        self.journal.patch_event(dict(id=event_id), dict(id=event_id,
+            location="Berlin"))
+        for summary in ("E", "Ed", "Edited"):
+            self.journal.patch_event(existing, dict(existing, summary=summary))
+        cancelled_id = self.journal.create_event(summary="Typo", start=START,
+                end=END)
+        self.journal.delete_event(cancelled_id)
+
+        self.assertEqual(len(self.journal), 8)
+        self.assertEqual([(w.operation, w.event_id) for w in
+            self.journal.pending()], [(INSERT, event_id), (PATCH, "existing")])
+
+        result = self.journal.flush(self.service)
+        self.assertEqual(result, (2, 1, [], 0))
+        self.assertEqual(len(self.journal), 0)
+        self.assertEqual(len(self.http.requests), 1)
+
+        created = self.http.events()[event_id]
+        self.assertEqual((created["summary"], created["location"]),
+                ("Meeting", "Berlin"))
+        self.assertEqual(self.http.events()["existing"]["summary"], "Edited")
+        self.assertNotIn(cancelled_id, self.http.events())
+
+    def test_failures(self):
+        self.http.add_event(id="modified", summary="Modified",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+        stale = {"id": "modified", "etag": '"0"'}
+        self.journal.patch_event(stale, dict(stale, summary="Stale"))
+        self.journal.delete_event("nonexisting")
+        with self.assertLogs("gcalendar.journal", "WARNING"):
+            result = self.journal.flush(self.service)
+        self.assertEqual(result.sent, 1)
+        self.assertEqual([(write.event_id, exception.resp.status) for write,
+            exception in result.failed], [("modified", 412)])
+        self.assertEqual(len(self.journal), 0)
+
+    def test_kept_while_offline(self):
+        self.journal.create_event(event_id="offline1", summary="Offline",
+                start=START, end=END)
+        with mock.patch.object(self.http, "request",
+                side_effect=ConnectionError("network is unreachable")):
+            self.assertRaises(ConnectionError, self.journal.flush, self.service)
+        self.assertEqual(len(self.journal), 1)
+
+        self.http.fail_next(503, count=2)
+        self.assertEqual(self.journal.flush(self.service).pending, 1)
+        self.assertEqual(len(self.journal), 1)
+
+        self.assertEqual(self.journal.flush(self.service).sent, 1)
+        self.assertIn("offline1", self.http.events())
+
+    def test_recreate_deleted_event(self):
+        self.http.add_event(id="restored", summary="Old",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+        self.http.delete_event("primary", "restored")
+        self.journal.create_event(event_id="restored", summary="New",
+                start=START, end=END)
+        self.assertEqual(self.journal.flush(self.service).sent, 1)
+        event = self.http.events()["restored"]
+        self.assertEqual((event["summary"], event["status"]),
+                ("New", "confirmed"))
+
+    def test_persistent(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "journal.sqlite")
+        first = journal.WriteJournal(path)
+        first.delete_event("event1")
+        first.close()
+        second = journal.WriteJournal(path)
+        self.addCleanup(second.close)
+        self.assertEqual(second.pending(), [Write(DELETE, "primary", "event1",
+            None, None)])
+
+
+class JournalFlusherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.journal = journal.WriteJournal(":memory:")
+        self.addCleanup(self.journal.close)
+
+    def test_flushed_after_delay(self):
+        flushed = threading.Event()
+        original_flush = self.journal.flush
+
+        def flush(service):
+            result = original_flush(service)
+            flushed.set()
+            return result
+
+        with mock.patch.object(self.journal, "flush", flush), \
+                journal.JournalFlusher(self.journal,
+                        build_fake_service(self.http), delay=0.2):
+            event_id = self.journal.create_event(summary="Meeting",
+                    start=START, end=END)
+            self.journal.patch_event(dict(id=event_id), dict(id=event_id,
+                location="Berlin"))
+            self.assertTrue(flushed.wait(5))
+            self.assertEqual(self.http.events()[event_id]["location"], "Berlin")
+            self.assertEqual(len(self.http.requests), 1)
+
+    def test_flushed_on_stop(self):
+        self.journal.delete_event("event1")
+        flusher = journal.JournalFlusher(self.journal,
+                build_fake_service(self.http), delay=60)
+        with mock.patch.object(self.journal, "flush",
+                side_effect=ConnectionError("offline")):
+            flusher.start()
+        flusher.stop()
+        self.assertEqual(len(self.journal), 0)
+
+
+class DeferredCommandTestCase(unittest.TestCase):
+    def test_defer_and_flush(self):
+        http = FakeCalendarHttp()
+        write_journal = journal.WriteJournal(":memory:")
+        self.addCleanup(write_journal.close)
+
+        def run(*argv):
+            args = main.build_parser().parse_args(argv)
+            stream = io.StringIO()
+            status = main.run_command(build_fake_service(http), args, stream,
+                    write_journal=write_journal)
+            return status, stream.getvalue()
+
+        status, output = run("--defer", "create", START, END, "--id",
+                "deferred1", "-s", "Meeting")
+        self.assertEqual(output, '{"id": "deferred1", "queued": true}\n')
+        run("--defer", "edit", "deferred1", "location=Berlin")
+        self.assertEqual(http.requests, [])
+
+        status, output = run("flush")
+        self.assertEqual(status, 0)
+        self.assertEqual(output, '{"sent": 1, "cancelled": 0, "failed": 0, '
+                '"pending": 0}\n')
+        self.assertEqual(http.events()["deferred1"]["location"], "Berlin")
+
+
+if __name__ == '__main__':
+    unittest.main()
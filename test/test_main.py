@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+import io
+import json
+import unittest
+from unittest import mock
+
+from gcalendar import cache, main, scheduler
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+class CommandTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp({"primary": "Primary", "work": "Work"})
+        self.service = build_fake_service(self.http)
+        for hour in range(3):
+            self.http.add_event(id="event{}".format(hour),
+                    summary="Event {}".format(hour),
+                    start={"dateTime": "2017-04-11T0{}:00:00Z".format(hour)},
+                    end={"dateTime": "2017-04-11T0{}:30:00Z".format(hour)})
+
+    def run_command(self, *argv):
+        args, oauth_args = main.build_parser().parse_known_args(argv)
+        self.assertEqual(oauth_args, [])
+        stream = io.StringIO()
+        status = main.run_command(self.service, args, stream)
+        return status, stream.getvalue()
+
+    def test_list_ndjson(self):
+        status, output = self.run_command("list", "11/04/2017",
+                "--max-results", "2", "--fields", "id,summary")
+        self.assertEqual(status, 0)
+        events = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([e["summary"] for e in events],
+                ["Event 0", "Event 1", "Event 2"])
+        self.assertEqual(len(self.http.requests), 2)
+
+    def test_list_json(self):
+        status, output = self.run_command("list", "11/04/2017", "12/04/2017",
+                "--format", "json")
+        self.assertEqual(len(json.loads(output)), 3)
+
+        status, output = self.run_command("list", "11/04/2017", "-c", "work",
+                "--format", "json")
+        self.assertEqual(json.loads(output), [])
+
+    def test_list_filters(self):
+        self.http.events()["event2"]["extendedProperties"] = {
+                "private": {"source": "import"}}
+        status, output = self.run_command("list", "11/04/2017", "-q", "event",
+                "--property", "source=import", "--fields", "id")
+        self.assertEqual([json.loads(line)["id"] for line in
+            output.splitlines()], ["event2"])
+
+        status, output = self.run_command("list", "11/04/2017", "--match",
+                "summary=[01]$", "--match", "id=1", "--fields", "id")
+        self.assertEqual([json.loads(line)["id"] for line in
+            output.splitlines()], ["event1"])
+
+        status, output = self.run_command("list", "11/04/2017", "--match",
+                "summary")
+        self.assertEqual(status, 1)
+
+    def test_calendars(self):
+        status, output = self.run_command("calendars")
+        self.assertEqual([json.loads(line) for line in output.splitlines()],
+                [{"summary": "Primary", "id": "primary"},
+                    {"summary": "Work", "id": "work"}])
+
+    def test_get(self):
+        status, output = self.run_command("get", "event1")
+        self.assertEqual(json.loads(output)["summary"], "Event 1")
+
+        status, output = self.run_command("get", "nonexisting")
+        self.assertEqual(status, 1)
+        self.assertEqual(output, "")
+
+    def test_create(self):
+        status, output = self.run_command("create", "12/04/2017 08:00:00",
+                "12/04/2017 09:00:00", "-s", "New", "-a", "a@b.c", "-a",
+                "d@e.f", "--id", "abcde12345", "-c", "work")
+        self.assertEqual(json.loads(output), {"id": "abcde12345"})
+        event = self.http.events("work")["abcde12345"]
+        self.assertEqual(event["attendees"],
+                [{"email": "a@b.c"}, {"email": "d@e.f"}])
+        self.assertEqual(event["start"]["dateTime"], "2017-04-12T08:00:00Z")
+
+    def test_delete(self):
+        status, output = self.run_command("delete", "event0", "nonexisting")
+        self.assertEqual(status, 1)
+        results = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([r["deleted"] for r in results], [True, False])
+        self.assertEqual(self.http.events()["event0"]["status"], "cancelled")
+
+    def test_edit(self):
+        status, output = self.run_command("edit", "event2", "location=Berlin",
+                'attendees=[{"email": "a@b.c"}]')
+        self.assertEqual(status, 0)
+        event = self.http.events()["event2"]
+        self.assertEqual(event["location"], "Berlin")
+        self.assertEqual(event["attendees"], [{"email": "a@b.c"}])
+
+        status, output = self.run_command("edit", "event2", "location")
+        self.assertEqual(status, 1)
+
+    def test_oauth_arguments_passed_on(self):
+        args, oauth_args = main.build_parser().parse_known_args(
+                ["--noauth_local_webserver", "calendars"])
+        self.assertEqual(args.command, "calendars")
+        self.assertEqual(oauth_args, ["--noauth_local_webserver"])
+
+
+class MenuEditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.http.add_event(id="event", summary="Old", location="here",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+
+    def edit(self, *answers, event_cache=None):
+        with mock.patch("builtins.input", side_effect=answers), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            main.edit(self.service, event_cache=event_cache)
+        return stdout.getvalue()
+
+    def test_changes_flushed_once(self):
+        output = self.edit("event", "summary", "New", "location", "there",
+                "attendees", "1", "Foo", "foo@bar.com", "none")
+        self.assertIn("Event Modified!", output)
+        methods = [request[0] for request in self.http.requests]
+        self.assertEqual(methods, ["GET", "PATCH"])
+        event = self.http.events()["event"]
+        self.assertEqual((event["summary"], event["location"]), ("New", "there"))
+        self.assertEqual(event["attendees"],
+                [{"displayName": "Foo", "email": "foo@bar.com"}])
+
+    def test_no_request_without_changes(self):
+        output = self.edit("event", "see", "none")
+        self.assertNotIn("Event Modified!", output)
+        self.assertEqual(len(self.http.requests), 1)
+
+    def test_edit_from_cache(self):
+        event_cache = cache.EventCache(":memory:")
+        self.addCleanup(event_cache.close)
+        self.edit("event", "summary", "New", "none", event_cache=event_cache)
+        self.assertEqual(self.http.events()["event"]["summary"], "New")
+
+        # an incremental sync picks up the edit
+        del self.http.requests[:]
+        output = self.edit("event", "see", "none", event_cache=event_cache)
+        self.assertIn("summary : New", output)
+        self.assertEqual([request[2].get("syncToken") is not None for request
+            in self.http.requests], [True])
+
+        with mock.patch.object(self.http, "request",
+                side_effect=ConnectionError("network is unreachable")), \
+                mock.patch.object(scheduler, "default_scheduler",
+                    scheduler.RequestScheduler(sleep=lambda _: None)), \
+                mock.patch("builtins.input", side_effect=["event", "location",
+                    "none"]), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as stdout, \
+                self.assertLogs("gcalendar.main", "WARNING"):
+            main.elaborate(self.service, event_cache)
+        self.assertIn("location : here", stdout.getvalue())
+
+        self.assertIn("Invalid ID", self.edit("nonexisting",
+            event_cache=event_cache))
+
+    def test_cache_miss_asks_server(self):
+        event_cache = cache.EventCache(":memory:")
+        self.addCleanup(event_cache.close)
+        # the cache holds the instances of recurring events only
+        self.http.add_event(id="series", summary="Standup",
+                recurrence=["RRULE:FREQ=DAILY;COUNT=3"],
+                start={"dateTime": "2017-04-11T09:00:00Z", "timeZone": "UTC"},
+                end={"dateTime": "2017-04-11T09:15:00Z", "timeZone": "UTC"})
+        event = main.lookup_event(self.service, "series", event_cache)
+        self.assertEqual(event["recurrence"], ["RRULE:FREQ=DAILY;COUNT=3"])
+        self.assertEqual([request[0] for request in self.http.requests],
+                ["GET", "GET"])
+
+    def test_read_from_cache(self):
+        event_cache = cache.EventCache(":memory:")
+        self.addCleanup(event_cache.close)
+        event_cache.sync(self.service)
+        self.http.add_event(id="new", summary="New",
+                start={"dateTime": "2017-04-11T10:00:00Z"},
+                end={"dateTime": "2017-04-11T11:00:00Z"})
+
+        del self.http.requests[:]
+        with mock.patch("builtins.input", side_effect=["11/04/2017",
+                "11/04/2017"]), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            main.read(self.service, event_cache)
+        self.assertIn("2 events found.", stdout.getvalue())
+        self.assertIn("ID: new", stdout.getvalue())
+        # a single incremental sync, no range query
+        self.assertEqual([request[2].get("syncToken") is not None for request
+            in self.http.requests], [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
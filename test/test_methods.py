@@ -1,17 +1,27 @@
 #!/usr/bin/env python
 
 import unittest
+from unittest import mock
 import uuid
+import threading
 
 from apiclient import http
 
-from gcalendar import methods, utils
+from gcalendar import filters, methods, scheduler, utils
+from gcalendar.fake import FakeCalendarHttp, FakeCalendarServer, \
+        build_fake_service
 
 
 class ServiceTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.service = utils.build_service()
+        cls.server = FakeCalendarServer(FakeCalendarHttp(
+            {"primary": "Primary", "weeknum": "Week Numbers"})).start()
+        cls.service = utils.build_service(root_url=cls.server.url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
 
     def test_create_seek_and_destroy(self):
         summary = "Test summary"
@@ -39,9 +49,8 @@ class ServiceTestCase(unittest.TestCase):
 
     def test_list(self):
         calendars = dict(methods.list_calendars(self.service))
-        # assuming the calendar list contains at least the 'Week numbers'
-        self.assertGreaterEqual(len(calendars), 1)
-        self.assertIn("Week Numbers", calendars.keys())
+        self.assertEqual(calendars, {"Primary": "primary",
+            "Week Numbers": "weeknum"})
 
     def test_delete_nonexisting_event(self):
         event_id = uuid.uuid4().hex
@@ -76,5 +85,230 @@ class ServiceTestCase(unittest.TestCase):
 
         methods.delete_event(self.service, event_id)
 
+
+class FetchEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        for hour in range(10):
+            self.http.add_event(summary="Event {}".format(hour),
+                    start={"dateTime": "2017-04-11T{:02d}:00:00Z".format(hour)},
+                    end={"dateTime": "2017-04-11T{:02d}:30:00Z".format(hour)})
+        self.http.add_event(summary="Next day",
+                start={"dateTime": "2017-04-12T08:00:00Z"},
+                end={"dateTime": "2017-04-12T09:00:00Z"})
+
+    def test_fetch_follows_page_tokens(self):
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                max_results=3)
+        self.assertEqual([e["summary"] for e in events],
+                ["Event {}".format(hour) for hour in range(10)])
+        self.assertEqual(len(self.http.requests), 4)
+
+    def test_iter_events_is_lazy(self):
+        events = methods.iter_events(self.service, start="11/04/2017",
+                end="12/04/2017", max_results=5)
+        self.assertEqual(len(self.http.requests), 0)
+        self.assertEqual(next(events)["summary"], "Event 0")
+        self.assertEqual(len(self.http.requests), 1)
+        self.assertEqual(len(list(events)), 10)
+        self.assertEqual(len(self.http.requests), 3)
+
+    def test_fields_projection(self):
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                fields="id,summary")
+        self.assertEqual(len(events), 10)
+        params = self.http.requests[0][2]
+        self.assertEqual(params["fields"], "nextPageToken,items(id,summary)")
+        self.assertNotIn("pageToken", params)
+
+    def test_fetch_without_start(self):
+        self.assertRaises(AttributeError, methods.fetch_events, self.service)
+
+    def test_server_side_filters(self):
+        tagged = self.http.add_event(summary="Tagged",
+                start={"dateTime": "2017-04-11T12:15:00Z"},
+                end={"dateTime": "2017-04-11T12:45:00Z"},
+                extendedProperties={"private": {"source": "import"}})
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                q="event", private_properties={"source": "import"})
+        self.assertEqual(events, [])
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                private_properties={"source": "import"})
+        self.assertEqual([e["id"] for e in events], [tagged["id"]])
+        self.assertEqual(self.http.requests[-1][2]["privateExtendedProperty"],
+                ["source=import"])
+
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                q="event 3")
+        self.assertEqual([e["summary"] for e in events], ["Event 3"])
+
+    def test_updated_min_and_show_deleted(self):
+        for event in self.http.events().values():
+            event["updated"] = "2017-04-01T00:00:00.000Z"
+        deleted_id = next(iter(self.http.events()))
+        self.http.delete_event("primary", deleted_id)
+
+        # deleted events are included
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                updated_min="10/04/2017")
+        self.assertEqual([(e["id"], e["status"]) for e in events],
+                [(deleted_id, "cancelled")])
+        self.assertEqual(self.http.requests[-1][2]["updatedMin"],
+                "2017-04-10T00:00:00Z")
+
+        self.assertEqual(len(methods.fetch_events(self.service,
+            start="11/04/2017")), 9)
+        self.assertEqual(len(methods.fetch_events(self.service,
+            start="11/04/2017", show_deleted=True)), 10)
+        self.assertRaises(ValueError, methods.fetch_events, self.service,
+                start="11/04/2017", show_deleted=True, expand_locally=True)
+
+    def test_compact_skips_cancelled_instances(self):
+        # deleted instances of recurring events only carry a few fields
+        self.http.add_event(id="series_20170411", status="cancelled",
+                recurringEventId="series",
+                originalStartTime={"dateTime": "2017-04-11T12:00:00Z"})
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                updated_min="10/04/2017", compact=True)
+        self.assertEqual(len(events), 10)
+        self.assertNotIn("series_20170411", [e.id for e in events])
+
+    def test_compact_requests_start_and_end(self):
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                fields="id,summary", compact=True)
+        self.assertEqual(len(events), 10)
+        self.assertEqual(self.http.requests[0][2]["fields"],
+                "nextPageToken,items(end,id,start,summary)")
+
+    def test_local_filter(self):
+        where = filters.matches("summary", "[13579]$") & \
+                ~filters.equals("summary", "Event 5")
+        events = methods.fetch_events(self.service, start="11/04/2017",
+                fields="id", where=where)
+        self.assertEqual([e["summary"] for e in events],
+                ["Event 1", "Event 3", "Event 7", "Event 9"])
+        self.assertEqual(self.http.requests[0][2]["fields"],
+                "nextPageToken,items(id,summary)")
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        # the fake has no quota, send without rate limit
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_create_and_delete_events(self):
+        events = [dict(summary="Work", start="{:02d}/04/2017 08:00:00".format(day),
+                end="{:02d}/04/2017 16:00:00".format(day), enable_reminders=False)
+                for day in range(1, 31)] * 4
+        results = methods.create_events(self.service, events)
+        self.assertEqual(len(results), 120)
+        self.assertTrue(all(r.exception is None for r in results))
+        # three batch requests of at most 50 calls
+        self.assertEqual(len(self.http.requests), 3)
+        self.assertEqual(len(self.http.events()), 120)
+
+        event_ids = [r.response for r in results[:10]] + ["nonexisting"]
+        results = methods.delete_events(self.service, event_ids)
+        self.assertTrue(all(r.exception is None for r in results[:10]))
+        self.assertIsInstance(results[10].exception, http.HttpError)
+        self.assertEqual(len(methods.fetch_events(self.service,
+            start="01/04/2017", end="30/04/2017")), 110)
+
+    def test_create_events_missing_argument(self):
+        self.assertRaises(AttributeError, methods.create_events, self.service,
+                [dict(start="01/04/2017 08:00:00")])
+        self.assertEqual(len(self.http.requests), 0)
+
+    def test_update_events(self):
+        event = self.http.add_event(summary="Old",
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+        changed = dict(event, summary="New")
+        results = methods.update_events(self.service,
+                [changed, dict(changed, id="nonexisting")])
+        self.assertEqual(results[0].response["summary"], "New")
+        self.assertIsNotNone(results[1].exception)
+        self.assertEqual(self.http.events()[event["id"]]["summary"], "New")
+
+    def test_empty_batch(self):
+        self.assertEqual(methods.delete_events(self.service, []), [])
+        self.assertEqual(len(self.http.requests), 0)
+
+
+class FetchEventsManyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar_ids = ["team{}".format(i) for i in range(6)]
+        self.http = FakeCalendarHttp(dict((c, c) for c in self.calendar_ids))
+        self.service = build_fake_service(self.http)
+        for i, calendarId in enumerate(self.calendar_ids):
+            self.http.add_event(calendarId, summary=calendarId,
+                    start={"dateTime": "2017-04-11T{:02d}:00:00+02:00".format(
+                        12 - i)},
+                    end={"dateTime": "2017-04-11T13:00:00+02:00"})
+        self.http_threads = []
+
+    def http_factory(self):
+        self.http_threads.append(threading.current_thread().name)
+        return self.http
+
+    def test_results_merged_by_start(self):
+        results = methods.fetch_events_many(self.service, self.calendar_ids,
+                start="11/04/2017", max_workers=3, http_factory=self.http_factory)
+        self.assertEqual([c for c, _ in results], self.calendar_ids[::-1])
+        self.assertEqual([e["summary"] for _, e in results],
+                self.calendar_ids[::-1])
+        self.assertLessEqual(len(self.http_threads), 3)
+        self.assertEqual(len(set(self.http_threads)), len(self.http_threads))
+        self.assertEqual(len(self.http.requests), 6)
+
+    def test_error_is_propagated(self):
+        self.assertRaises(http.HttpError, methods.fetch_events_many,
+                self.service, ["team0", "nonexisting"], start="11/04/2017",
+                http_factory=self.http_factory)
+
+
+class PatchEventTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.http.add_event(id="event", summary="Old", location="here",
+                attendees=[{"email": "a@b.c"}],
+                start={"dateTime": "2017-04-11T08:00:00Z"},
+                end={"dateTime": "2017-04-11T09:00:00Z"})
+        self.original = methods.get_event(self.service, "event")
+
+    def test_only_changes_are_sent(self):
+        modified = dict(self.original, summary="New")
+        del modified["location"]
+        event = methods.patch_event(self.service, self.original, modified)
+        self.assertEqual(event["summary"], "New")
+        self.assertNotIn("location", event)
+        self.assertEqual(methods.event_changes(self.original, modified),
+                {"summary": "New", "location": None})
+        self.assertEqual(self.http.requests[-1][0], "PATCH")
+
+    def test_unchanged_event_is_not_sent(self):
+        nr_requests = len(self.http.requests)
+        event = methods.patch_event(self.service, self.original,
+                dict(self.original))
+        self.assertIs(event, self.original)
+        self.assertEqual(len(self.http.requests), nr_requests)
+
+    def test_concurrent_modification(self):
+        methods.patch_event(self.service, self.original,
+                dict(self.original, summary="Other"))
+        with self.assertRaises(http.HttpError) as context:
+            methods.patch_event(self.service, self.original,
+                    dict(self.original, summary="New"))
+        self.assertEqual(context.exception.resp.status, 412)
+        self.assertEqual(self.http.events()["event"]["summary"], "Other")
+
+
 if __name__ == "__main__":
     unittest.main()
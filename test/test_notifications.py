@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+import queue
+import unittest
+import urllib.error
+import urllib.request
+
+from gcalendar import methods, notifications
+from gcalendar.cache import EventCache
+from gcalendar.fake import FakeCalendarHttp, NotificationSender, \
+        build_fake_service
+
+TIMEOUT = 5
+
+
+class WatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.received = queue.Queue()
+        self.receiver = notifications.WebhookReceiver(self.received.put).start()
+        self.addCleanup(self.receiver.stop)
+
+    def test_watch_and_stop(self):
+        channel = methods.watch_events(self.service, self.receiver.url,
+                channel_id="channel-1", token="secret", ttl=60)
+        self.assertEqual(channel["id"], "channel-1")
+        self.assertIn("resourceId", channel)
+        self.assertIn("expiration", channel)
+
+        self.http.add_event(summary="Morning",
+                start={"dateTime": "2017-04-11T10:00:00Z"},
+                end={"dateTime": "2017-04-11T11:00:00Z"})
+        first = self.received.get(timeout=TIMEOUT)
+        self.assertEqual(first.state, notifications.SYNC_STATE)
+        self.assertEqual(first.token, "secret")
+        self.assertEqual(first.resource_id, channel["resourceId"])
+        second = self.received.get(timeout=TIMEOUT)
+        self.assertEqual((second.state, second.message_number), ("exists", 2))
+
+        methods.stop_channel(self.service, "channel-1", channel["resourceId"])
+        self.assertEqual(self.http.channels, {})
+        self.http.add_event(summary="Evening",
+                start={"dateTime": "2017-04-11T18:00:00Z"},
+                end={"dateTime": "2017-04-11T19:00:00Z"})
+        self.http.flush_notifications(TIMEOUT)
+        self.assertTrue(self.received.empty())
+
+    def test_rejected_notification(self):
+        self.receiver._server.callback = lambda notification: False
+        request = urllib.request.Request(self.receiver.url, data=b"",
+                method="POST")
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(request, timeout=TIMEOUT)
+        self.assertEqual(context.exception.code, 403)
+
+
+class CalendarWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp({"primary": "Primary", "work": "Work"})
+        self.cache = EventCache(":memory:")
+        self.addCleanup(self.cache.close)
+        self.synced = queue.Queue()
+        self.watcher = notifications.CalendarWatcher(
+                build_fake_service(self.http), self.cache,
+                http_factory=lambda: self.http,
+                on_sync=lambda *args: self.synced.put(args))
+
+    def test_sync_on_change(self):
+        with self.watcher:
+            self.watcher.watch("primary")
+            self.watcher.watch("work")
+            # initial syncs
+            self.assertEqual(sorted([self.synced.get(timeout=TIMEOUT),
+                self.synced.get(timeout=TIMEOUT)]), [("primary", 0), ("work", 0)])
+
+            event = self.http.add_event("work", summary="Meeting",
+                    start={"dateTime": "2017-04-11T10:00:00Z"},
+                    end={"dateTime": "2017-04-11T11:00:00Z"})
+            self.assertEqual(self.synced.get(timeout=TIMEOUT), ("work", 1))
+            self.assertEqual(self.cache.get_event(event["id"], "work"), event)
+
+            # only the affected calendar is fetched, incrementally
+            self.http.delete_event("work", event["id"])
+            self.assertEqual(self.synced.get(timeout=TIMEOUT), ("work", 1))
+            self.assertIsNone(self.cache.get_event(event["id"], "work"))
+            lists = [params for method, path, params in self.http.requests
+                    if path.endswith("/events") and method == "GET"]
+            self.assertEqual(len(lists), 4)
+            self.assertIn("syncToken", lists[-1])
+
+        self.assertEqual(self.http.channels, {})
+
+    def test_renew_before_expiration(self):
+        with self.watcher:
+            channel = self.watcher.watch("primary", ttl=2)
+            self.synced.get(timeout=TIMEOUT)
+            # the renewal syncs once more
+            self.assertEqual(self.synced.get(timeout=TIMEOUT), ("primary", 0))
+            renewed, = self.watcher.channels.values()
+            self.assertNotEqual(renewed.id, channel.id)
+            self.assertGreater(renewed.expiration, channel.expiration)
+            self.assertEqual(list(self.http.channels), [renewed.id])
+
+            # notifications arrive on the new channel
+            self.http.add_event(summary="Meeting",
+                    start={"dateTime": "2017-04-11T10:00:00Z"},
+                    end={"dateTime": "2017-04-11T11:00:00Z"})
+            self.assertEqual(self.synced.get(timeout=TIMEOUT), ("primary", 1))
+
+        self.assertEqual(self.http.channels, {})
+
+    def test_invalid_token_ignored(self):
+        with self.watcher:
+            channel = self.watcher.watch("primary")
+            self.synced.get(timeout=TIMEOUT)
+            sender = NotificationSender()
+            sender.send(self.watcher.address, channel.id, channel.resourceId,
+                    "exists", 5, token="forged")
+            with self.assertLogs("gcalendar.fake", "WARNING"):
+                sender.join(TIMEOUT)
+            self.assertTrue(self.synced.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import os
+import datetime
+import unittest
+from unittest import mock
+
+from gcalendar import credentials, methods, pool
+from gcalendar.fake import FakeCalendarHttp, FakeCalendarServer
+
+
+def list_calendars(service, account, prefix):
+    return os.getpid(), ["{}{}".format(prefix, summary) for summary, _ in
+        methods.list_calendars(service)]
+
+
+def fail(service, account):
+    methods.get_event(service, "nonexisting")
+
+
+class FakeCredentials(object):
+    access_token = "token"
+    invalid = False
+
+    def __init__(self):
+        self.token_expiry = datetime.datetime.utcnow() + \
+            datetime.timedelta(hours=1)
+
+    def authorize(self, http):
+        return http
+
+
+class ServicePoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = pool.ServicePool(max_size=2, root_url="http://127.0.0.1:1/")
+        self.addCleanup(self.pool.clear)
+
+    def test_lru_eviction(self):
+        alice, bob, carol = (pool.Account(credentials_file=name) for name in
+                ("alice", "bob", "carol"))
+        service = self.pool.get(alice)
+        self.assertIs(self.pool.get(alice), service)
+        self.pool.get(bob)
+        self.pool.get(alice)
+        self.pool.get(carol)
+        self.assertEqual(len(self.pool), 2)
+        self.assertIn(alice, self.pool)
+        self.assertNotIn(bob, self.pool)
+        self.assertIsNot(self.pool.get(bob), service)
+
+    def test_shared_discovery_document(self):
+        alice = self.pool.get(pool.Account(credentials_file="alice"))
+        bob = self.pool.get(pool.Account(credentials_file="bob"))
+        self.assertIs(alice._rootDesc, bob._rootDesc)
+        self.assertEqual(alice._rootDesc["rootUrl"], "http://127.0.0.1:1/")
+
+        with mock.patch.dict(os.environ, clear=True), \
+                mock.patch("gcalendar.pool.load_discovery_document") as load:
+            google = pool.ServicePool()
+            document = google.discovery_document()
+            self.assertIs(google.discovery_document(), document)
+        load.assert_called_once_with()
+
+    def test_credentials_forgotten_on_eviction(self):
+        cache = credentials.CredentialCache()
+        self.addCleanup(cache.clear)
+        pool_ = pool.ServicePool(max_size=1, credential_cache=cache,
+                transport_factory=object)
+        pool_._document = self.pool.discovery_document()
+
+        with mock.patch("oauth2client.service_account.ServiceAccountCredentials"
+                ".from_json_keyfile_name", side_effect=lambda *args:
+                FakeCredentials()):
+            pool_.get(pool.Account(service_account="/keys/worker.json"))
+            self.assertEqual(len(cache._credentials), 1)
+            pool_.get(pool.Account(service_account="/keys/other.json"))
+        self.assertEqual(list(cache._credentials), [("service",
+            "/keys/other.json", None)])
+        self.assertEqual(list(cache._timers), [("service", "/keys/other.json",
+            None)])
+
+
+class SyncRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeCalendarServer(FakeCalendarHttp(
+            {"primary": "Primary", "work": "Work"})).start()
+        self.addCleanup(self.server.stop)
+
+    def test_map(self):
+        accounts = [pool.Account(credentials_file=str(i)) for i in range(6)]
+        with pool.SyncRunner(max_workers=2, root_url=self.server.url) as runner:
+            results = runner.map(list_calendars, accounts, "- ")
+            failed = runner.map(fail, accounts[:1])
+
+        self.assertEqual([result.account for result in results], accounts)
+        self.assertTrue(all(result.exception is None for result in results))
+        self.assertEqual(results[0].result[1], ["- Primary", "- Work"])
+        self.assertNotIn(os.getpid(), [result.result[0] for result in results])
+
+        self.assertIsNone(failed[0].result)
+        self.assertIn("HttpError", str(failed[0].exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
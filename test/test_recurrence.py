@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import unittest
+
+from gcalendar import methods, recurrence
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+def standup(**fields):
+    event = {
+        "id": "standup",
+        "summary": "Standup",
+        "status": "confirmed",
+        "start": {"dateTime": "2017-03-20T09:00:00+01:00",
+            "timeZone": "Europe/Berlin"},
+        "end": {"dateTime": "2017-03-20T09:15:00+01:00",
+            "timeZone": "Europe/Berlin"},
+        "recurrence": ["RRULE:FREQ=DAILY;COUNT=20"],
+        }
+    event.update(fields)
+    return event
+
+
+class ExpandTestCase(unittest.TestCase):
+    def test_daily_across_dst(self):
+        instances = list(recurrence.expand(standup(),
+            "2017-03-24T00:00:00.000000Z", "2017-03-28T00:00:00.000000Z"))
+        self.assertEqual([i["start"]["dateTime"] for i in instances], [
+            "2017-03-24T09:00:00+01:00", "2017-03-25T09:00:00+01:00",
+            "2017-03-26T09:00:00+02:00", "2017-03-27T09:00:00+02:00"])
+        self.assertEqual(instances[-1]["end"]["dateTime"],
+                "2017-03-27T09:15:00+02:00")
+        self.assertEqual(instances[0]["id"], "standup_20170324T080000Z")
+        self.assertEqual(instances[0]["recurringEventId"], "standup")
+        self.assertEqual(instances[0]["originalStartTime"],
+                instances[0]["start"])
+        self.assertNotIn("recurrence", instances[0])
+
+    def test_window_overlap_and_count(self):
+        # the instance running at the window start is included
+        instances = list(recurrence.expand(standup(),
+            "2017-03-20T08:10:00.000000Z", "2017-03-21T08:00:00.000000Z"))
+        self.assertEqual(len(instances), 1)
+        instances = list(recurrence.expand(standup(),
+            "2017-01-01T00:00:00.000000Z", "2018-01-01T00:00:00.000000Z"))
+        self.assertEqual(len(instances), 20)
+
+    def test_exdate_and_all_day(self):
+        event = standup(start={"date": "2017-04-03"}, end={"date": "2017-04-04"},
+                recurrence=["RRULE:FREQ=WEEKLY;UNTIL=20170501",
+                    "EXDATE;VALUE=DATE:20170410"])
+        instances = list(recurrence.expand(event,
+            "2017-04-01T00:00:00.000000Z", "2017-06-01T00:00:00.000000Z"))
+        self.assertEqual([i["start"]["date"] for i in instances],
+                ["2017-04-03", "2017-04-17", "2017-04-24", "2017-05-01"])
+        self.assertEqual(instances[0]["id"], "standup_20170403")
+
+    def test_invalid_rule_is_skipped(self):
+        with self.assertLogs("gcalendar.recurrence", "WARNING"):
+            self.assertEqual(list(recurrence.expand(standup(recurrence=[
+                "RRULE:FREQ=SOMETIMES"]), "2017-01-01T00:00:00.000000Z",
+                "2018-01-01T00:00:00.000000Z")), [])
+
+
+class RecurringEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.http.add_event(**standup(recurrence=["RRULE:FREQ=DAILY"]))
+        self.http.add_event(id="lunch", summary="Lunch",
+                start={"dateTime": "2017-03-22T12:00:00Z"},
+                end={"dateTime": "2017-03-22T13:00:00Z"})
+        # moved and cancelled instances
+        self.http.add_event(id="standup_20170321T080000Z", summary="Standup",
+                recurringEventId="standup",
+                originalStartTime={"dateTime": "2017-03-21T09:00:00+01:00"},
+                start={"dateTime": "2017-03-21T10:00:00+01:00"},
+                end={"dateTime": "2017-03-21T10:15:00+01:00"})
+        self.http.add_event(id="standup_20170323T080000Z", status="cancelled",
+                recurringEventId="standup",
+                originalStartTime={"dateTime": "2017-03-23T09:00:00+01:00"},
+                start={"dateTime": "2017-03-23T09:00:00+01:00"},
+                end={"dateTime": "2017-03-23T09:15:00+01:00"})
+
+    def test_matches_server_expansion(self):
+        server = methods.fetch_events(self.service, start="01/03/2017",
+                end="30/04/2017")
+        local = methods.fetch_events(self.service, start="01/03/2017",
+                end="30/04/2017", expand_locally=True)
+        self.assertEqual([(e["id"], e["start"]) for e in local],
+                [(e["id"], e["start"]) for e in server])
+        self.assertEqual(local[1]["start"]["dateTime"], "2017-03-21T10:00:00+01:00")
+        self.assertEqual(local[2]["id"], "standup_20170322T080000Z")
+        self.assertEqual(local[3]["id"], "lunch")
+        self.assertNotIn("standup_20170323T080000Z", [e["id"] for e in local])
+
+    def test_windows_without_requests(self):
+        recurring = recurrence.RecurringEvents.fetch(self.service,
+                start="01/03/2017", end="31/12/2017", max_results=2)
+        self.assertEqual(len(recurring.masters), 1)
+        nr_requests = len(self.http.requests)
+
+        week = list(recurring.events("27/03/2017", "02/04/2017"))
+        self.assertEqual(len(week), 7)
+        december = list(recurring.events("01/12/2017", "31/12/2017"))
+        self.assertEqual(len(december), 31)
+        self.assertEqual(december[0]["start"]["dateTime"],
+                "2017-12-01T09:00:00+01:00")
+        self.assertEqual(len(self.http.requests), nr_requests)
+
+    def test_fields_include_recurrence(self):
+        events = methods.fetch_events(self.service, start="20/03/2017",
+                end="22/03/2017", fields="id,summary", expand_locally=True)
+        self.assertEqual([e["summary"] for e in events],
+                ["Standup", "Standup", "Standup", "Lunch"])
+        params = self.http.requests[-1][2]
+        self.assertIn("recurrence", params["fields"])
+        self.assertEqual(params["singleEvents"], "false")
+
+
+if __name__ == '__main__':
+    unittest.main()
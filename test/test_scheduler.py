@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import unittest
+from unittest import mock
+
+from apiclient import http
+
+from gcalendar import methods, scheduler
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_rate_is_limited(self):
+        clock = FakeClock()
+        bucket = scheduler.TokenBucket(10, clock=clock, sleep=clock.sleep)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertEqual(clock.sleeps, [])
+
+        bucket.acquire(15)
+        self.assertAlmostEqual(clock.now, 1.5)
+
+        clock.now += 10
+        bucket.acquire(10)
+        self.assertAlmostEqual(clock.now, 11.5)
+
+    def test_default_scheduler_limited_to_quota(self):
+        bucket = scheduler.default_scheduler.bucket
+        self.assertEqual((bucket.rate, bucket.capacity), (10, 10))
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.http = FakeCalendarHttp()
+        self.service = build_fake_service(self.http)
+        self.clock = FakeClock()
+        self.scheduler = scheduler.RequestScheduler(max_retries=3,
+                sleep=self.clock.sleep, clock=self.clock, random=lambda: 1.0)
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_with_backoff(self):
+        self.http.fail_next(503, count=2)
+        self.http.fail_next(403, reason="rateLimitExceeded")
+        self.assertEqual(dict(methods.list_calendars(self.service)),
+                {"Primary": "primary"})
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0, 4.0])
+        self.assertEqual(self.scheduler.counters(), {"calendar.calendarList.list":
+            {"requests": 4, "retries": 3, "failures": 0}})
+
+    def test_give_up_after_max_retries(self):
+        self.http.fail_next(500, count=4)
+        self.assertRaises(http.HttpError, methods.get_event, self.service, "id")
+        self.assertEqual(len(self.clock.sleeps), 3)
+        self.assertEqual(self.scheduler.counters()["calendar.events.get"],
+                {"requests": 4, "retries": 3, "failures": 1})
+
+    def test_no_retry_on_client_errors(self):
+        self.http.fail_next(403, reason="forbidden")
+        self.assertRaises(http.HttpError, methods.get_event, self.service, "id")
+        self.assertRaises(http.HttpError, methods.get_event, self.service, "id")
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_batch_retries_failed_calls(self):
+        events = [dict(start="11/04/2017 08:00:00", end="11/04/2017 09:00:00")
+                for _ in range(60)]
+        self.http.fail_next(429, count=2)
+        results = methods.create_events(self.service, events)
+        self.assertTrue(all(r.exception is None for r in results))
+        self.assertEqual(len(self.http.events()), 60)
+        # two batches, then one batch with the two failed calls
+        self.assertEqual(len(self.http.requests), 3)
+        self.assertEqual(self.scheduler.counters()["calendar.events.insert"],
+                {"requests": 62, "retries": 2, "failures": 0})
+
+    def test_rate_limited_batch(self):
+        self.scheduler.bucket = scheduler.TokenBucket(20, clock=self.clock,
+                sleep=self.clock.sleep)
+        methods.delete_events(self.service, ["id{}".format(i) for i in range(50)])
+        self.assertAlmostEqual(self.clock.now, 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import json
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gcalendar import methods, scheduler, transport
+from gcalendar.fake import FakeCalendarHttp, build_fake_service
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TrackingHttp(object):
+    """Http stand-in that detects concurrent use of one object."""
+    def __init__(self, backend, created):
+        self.backend = backend
+        self.in_use = False
+        created.append(self)
+
+    def request(self, uri, **kwargs):
+        assert not self.in_use, "Http object used concurrently"
+        self.in_use = True
+        try:
+            return self.backend.request(uri, **kwargs)
+        finally:
+            self.in_use = False
+
+
+class HttpPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        calendar_ids = ["team{}".format(i) for i in range(12)]
+        self.http = FakeCalendarHttp(dict((c, c) for c in calendar_ids))
+        self.created = []
+        self.pool = transport.HttpPool(size=4,
+                factory=lambda: TrackingHttp(self.http, self.created))
+        self.service = build_fake_service(self.pool)
+        self.calendar_ids = calendar_ids
+        # the fake has no quota, send without rate limit
+        patcher = mock.patch.object(scheduler, "default_scheduler",
+                scheduler.RequestScheduler())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared_by_threads(self):
+        methods.fetch_events_many(self.service, self.calendar_ids * 5,
+                start="11/04/2017", max_workers=8,
+                http_factory=lambda: self.pool)
+        self.assertEqual(len(self.http.requests), 60)
+        self.assertGreaterEqual(len(self.created), 1)
+        self.assertLessEqual(len(self.created), 4)
+
+    def test_batch_through_pool(self):
+        results = methods.delete_events(self.service, ["a", "b"])
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(self.created), 1)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.uri = "http://127.0.0.1:{}/foo".format(self.server.server_port)
+
+    def test_http_pool(self):
+        pool = transport.HttpPool(size=2)
+        for _ in range(3):
+            response, content = pool.request(self.uri)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(json.loads(content.decode("utf-8")), {"path": "/foo"})
+
+    @unittest.skipIf(httpx is None, "httpx not installed")
+    def test_httpx_transport(self):
+        http = transport.HttpxTransport(http2=True)
+        self.addCleanup(http.close)
+        response, content = http.request(self.uri, headers={"x-test": "1"})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response["etag"], '"1"')
+        self.assertEqual(json.loads(content.decode("utf-8")), {"path": "/foo"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import subprocess
+
+import httplib2
+
+from gcalendar import utils
+
+
+class ConvertDatetimeTestCase(unittest.TestCase):
+    def test_documented_formats(self):
+        self.assertEqual(utils.convert_datetime("11/04/2017"),
+                "2017-04-11T00:00:00Z")
+        self.assertEqual(utils.convert_datetime("11/04/2017 08:30"),
+                "2017-04-11T08:30:00Z")
+        self.assertEqual(utils.convert_datetime("1/4/2017 8:00:05"),
+                "2017-04-01T08:00:05Z")
+
+    def test_timedeltas(self):
+        self.assertEqual(utils.convert_datetime("11/04/2017", hours=24),
+                "2017-04-12T00:00:00Z")
+        self.assertEqual(utils.convert_datetime("31/12/2017 23:00:00",
+            hours=1.5, minutes=1), "2018-01-01T00:31:00Z")
+
+    def test_memoized(self):
+        utils.convert_datetime("12/04/2017 10:00:00")
+        hits = utils._convert_datetime.cache_info().hits
+        utils.convert_datetime("12/04/2017 10:00:00")
+        self.assertEqual(utils._convert_datetime.cache_info().hits, hits + 1)
+
+    def test_maya_fallback(self):
+        self.assertEqual(utils.convert_datetime("11/04/2017", months=1),
+                "2017-05-11T00:00:00Z")
+        self.assertEqual(utils.convert_datetime("04/11/2017", day_first=False),
+                "2017-04-11T00:00:00Z")
+        self.assertEqual(utils.convert_datetime("11/04/2017 08:00:00.5"),
+                "2017-04-11T08:00:00.500000Z")
+
+
+class UtcTimestampTestCase(unittest.TestCase):
+    def test_conversion(self):
+        self.assertEqual(utils.utc_timestamp("2017-04-11T10:00:00+02:00"),
+                "2017-04-11T08:00:00.000000Z")
+        self.assertEqual(utils.utc_timestamp({"date": "2017-04-11"}),
+                "2017-04-11T00:00:00.000000Z")
+
+
+class DiscoveryHttp(object):
+    """Http stand-in serving the bundled discovery document."""
+    def __init__(self, revision=None, status=200):
+        with open(utils.BUNDLED_DISCOVERY_FILE) as f:
+            self.document = json.load(f)
+        if revision is not None:
+            self.document["revision"] = revision
+        self.status = status
+        self.nr_requests = 0
+
+    def request(self, uri, method="GET", **kwargs):
+        self.nr_requests += 1
+        response = httplib2.Response({"status": str(self.status)})
+        return response, json.dumps(self.document).encode("utf-8")
+
+
+class DiscoveryCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "cache", "discovery.json")
+
+    def test_download_and_cache(self):
+        http = DiscoveryHttp()
+        document = utils.load_discovery_document(self.path, http=http)
+        self.assertEqual(document["id"], "calendar:v3")
+        self.assertTrue(os.path.exists(self.path))
+
+        self.assertEqual(utils.load_discovery_document(self.path, http=http),
+                document)
+        self.assertEqual(http.nr_requests, 1)
+
+    def test_failed_download(self):
+        self.assertRaises(httplib2.HttpLib2Error,
+                utils.refresh_discovery_document, self.path,
+                http=DiscoveryHttp(status=503))
+
+        with self.assertLogs("gcalendar.utils", "WARNING"):
+            document = utils.load_discovery_document(self.path,
+                    http=DiscoveryHttp(status=503))
+        self.assertEqual(document["id"], "calendar:v3")
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_offline_uses_bundled_document(self):
+        http = DiscoveryHttp()
+        http.request = mock.Mock(side_effect=httplib2.ServerNotFoundError(
+            "Unable to find the server"))
+        with self.assertLogs("gcalendar.utils", "WARNING"):
+            document = utils.load_discovery_document(self.path, http=http)
+        with open(utils.BUNDLED_DISCOVERY_FILE) as f:
+            self.assertEqual(document, json.load(f))
+
+    def test_refresh_keeps_unchanged_revision(self):
+        utils.refresh_discovery_document(self.path, DiscoveryHttp())
+        os.utime(self.path, (0, 0))
+        utils.refresh_discovery_document(self.path, DiscoveryHttp())
+        self.assertGreater(os.path.getmtime(self.path), 0)
+
+        utils.refresh_discovery_document(self.path,
+                DiscoveryHttp(revision="new"))
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["revision"], "new")
+
+    def test_stale_cache_refreshed_in_background(self):
+        utils.refresh_discovery_document(self.path, DiscoveryHttp())
+        os.utime(self.path, (0, 0))
+
+        document = utils.load_discovery_document(self.path, max_age=60,
+                http=DiscoveryHttp(revision="new"))
+        self.assertNotEqual(document["revision"], "new")
+        threads = [t for t in threading.enumerate()
+                if t.name == utils.DISCOVERY_REFRESH_THREAD]
+        self.assertEqual(len(threads), 1)
+        threads[0].join()
+
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)["revision"], "new")
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_no_heavy_imports(self):
+        code = ("import sys; import gcalendar.main, gcalendar.cache; "
+                "print(' '.join(sys.modules))")
+        # pass arguments that the OAuth2 flags parser does not accept
+        output = subprocess.check_output([sys.executable, "-c", code,
+            "--unknown-arg"], universal_newlines=True)
+        modules = output.split()
+        for module in ["maya", "httplib2", "apiclient", "googleapiclient",
+                "oauth2client"]:
+            self.assertNotIn(module, modules)
+
+
+if __name__ == "__main__":
+    unittest.main()